@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# File name: access_filter.py
+# Description: Skips Perforce users who were active too recently to have left
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for filtering perforce users by their last access"""
+
+import time
+import calendar
+from perforce_ldap import chunked
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Users whose access times are parsed together
+CHUNK_SIZE = 1000
+
+# p4 users -ztag prints Access as epoch seconds, the formatted output as
+# "YYYY/MM/DD HH:MM:SS" (or just the date)
+DATE_FORMATS = ['%Y/%m/%d %H:%M:%S', '%Y/%m/%d']
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def parse_access(value):
+    """
+    Seconds since the epoch for a user's Access field, or None if it
+    can't be read. Dates are read as UTC, which only moves the cutoff
+    by the server's UTC offset.
+
+    :param value: the Access field from perforce
+    """
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    for date_format in DATE_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(value, date_format))
+        except ValueError:
+            continue
+    return None
+
+
+def parse_access_times(values):
+    """
+    parse_access over a list of Access fields at once. With numpy the
+    epoch and date forms are each converted as one array, otherwise
+    one value at a time. Unreadable values are None.
+
+    :param values: Access fields from perforce
+    :returns: list of seconds since the epoch
+    """
+    if numpy is None or not values:
+        return [parse_access(value) for value in values]
+
+    values = numpy.array([str(value).strip() for value in values])
+    times = numpy.full(len(values), -1, dtype='int64')
+
+    is_epoch = numpy.char.isdigit(values)
+    times[is_epoch] = values[is_epoch].astype('int64')
+
+    # numpy.char.replace can't take an empty array, e.g. when every value is an epoch
+    if not is_epoch.all():
+        dates = numpy.char.replace(numpy.char.replace(values[~is_epoch], '/', '-'), ' ', 'T')
+        try:
+            times[~is_epoch] = dates.astype('datetime64[s]').astype('int64')
+        except ValueError:
+            # A value numpy can't read; fall back to one at a time for the dates
+            times[~is_epoch] = [-1 if parsed is None else parsed
+                                for parsed in map(parse_access, values[~is_epoch])]
+    return [None if seconds < 0 else int(seconds) for seconds in times]
+
+
+class AccessFilter(object):
+    """
+    Drops the users who accessed Perforce within the last ``active_days``
+    days before they are looked up in LDAP, since someone who logged in
+    yesterday can't be a departed user. Users whose access time can't be
+    read are kept, so the filter never hides a departed user.
+
+    Methods:
+        filter: Yields the users who may have left, as a pipeline stage.
+
+        rank: The users who may have left, least recently active first.
+
+        stats: Summary of the lookups avoided for the log.
+    """
+    def __init__(self, active_days, now=None):
+        """
+        :param active_days: users active within this many days are skipped
+        :param now: seconds since the epoch to measure from, default now
+        """
+        self.active_days = active_days
+        self.cutoff = (time.time() if now is None else now) - active_days * SECONDS_PER_DAY
+        self.users = 0
+        self.skipped = 0
+        self.unparsed = 0
+
+    def _candidates(self, user_list):
+        """Yields (access time, user) for the users who may have left"""
+        for chunk in chunked(user_list, CHUNK_SIZE):
+            access_times = parse_access_times([user.get('Access', '') for user in chunk])
+            self.users += len(chunk)
+            for access, user in zip(access_times, chunk):
+                if access is None:
+                    self.unparsed += 1
+                elif access >= self.cutoff:
+                    self.skipped += 1
+                    continue
+                yield access, user
+
+    def filter(self, user_list):
+        """
+        Yields the users who were not active within active_days, in the
+        order of user_list
+
+        :param user_list: iterable of perforce users
+        """
+        for _, user in self._candidates(user_list):
+            yield user
+
+    def rank(self, user_list):
+        """
+        The users who were not active within active_days, least recently
+        active first, so the most likely departures are looked up first.
+        Users with an unreadable access time come first.
+
+        :param user_list: iterable of perforce users
+        :returns: list of perforce users
+        """
+        candidates = list(self._candidates(user_list))
+        candidates.sort(key=lambda candidate: -1 if candidate[0] is None else candidate[0])
+        return [user for _, user in candidates]
+
+    def stats(self):
+        """Returns a one line summary of the lookups avoided for the log"""
+        share = 100.0 * self.skipped / self.users if self.users else 0
+        return (f'Skipped {self.skipped} of {self.users} users active in the last '
+                f'{self.active_days} days ({share:.0f}% of LDAP lookups avoided, '
+                f'{self.unparsed} access times unreadable)')
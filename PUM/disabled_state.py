@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# File name: disabled_state.py
+# Description: Keeps the known deprovisioned accounts between runs
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for the incremental departed user state"""
+
+import os
+import json
+import time
+
+# A full rescan is forced when the last one is older than this, to catch
+# anything the incremental refreshes missed (e.g. deleted accounts)
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60  # seconds
+
+
+class DisabledAccountState(object):
+    """
+    Known deprovisioned accounts and the uSNChanged high-water mark they
+    were read up to.
+
+    Methods:
+        load: Reads the state file.
+
+        save: Writes the state file.
+
+        is_current: Whether the state can be updated incrementally.
+
+        mark_synced: Records a completed refresh.
+    """
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        """
+        :param path: the state file
+        :param max_age: Seconds after which a full rescan is forced
+        """
+        self.path = path
+        self.max_age = max_age
+        self.ldap_server = None
+        self.high_water_usn = 0
+        self.last_full_scan = 0
+        self.accounts = {}      # lower cased AccountName -> ldap attributes
+
+    def load(self):
+        """Reads the state file. A missing or unreadable file leaves the state empty"""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as state_file:
+                saved = json.load(state_file)
+            self.ldap_server = saved['ldap_server']
+            self.high_water_usn = saved['high_water_usn']
+            if not isinstance(self.high_water_usn, int):
+                raise ValueError(f'high_water_usn is {self.high_water_usn!r}')
+            self.last_full_scan = saved['last_full_scan']
+            self.accounts = saved['accounts']
+        except (IOError, ValueError, KeyError) as excep:
+            print (f"Error reading state file {self.path}, running a full rescan")
+            print (excep)
+            self.ldap_server = None
+
+    def save(self):
+        """Writes the state file, unless it has no high-water mark"""
+        if self.ldap_server is None or self.high_water_usn is None:
+            print (f"Not saving state file {self.path}, the refresh didn't read a USN")
+            return
+
+        saved = {
+            'ldap_server': self.ldap_server,
+            'high_water_usn': self.high_water_usn,
+            'last_full_scan': self.last_full_scan,
+            'accounts': self.accounts,
+        }
+        try:
+            tmp_name = self.path + '.tmp'
+            with open(tmp_name, 'w') as state_file:
+                json.dump(saved, state_file)
+            os.replace(tmp_name, self.path)
+        except IOError as excep:
+            print (f"Error saving state file {self.path}")
+            print (excep)
+
+    def is_current(self, ldap_server):
+        """
+        Whether the state can be brought up to date incrementally.
+
+        uSNChanged values are only meaningful on the DC that issued them,
+        so a state from another server needs a full rescan, as does a
+        state whose last full rescan is older than max_age.
+
+        :param ldap_server: the ldap server about to be queried
+        """
+        return self.ldap_server == ldap_server and \
+            time.time() - self.last_full_scan < self.max_age
+
+    def mark_synced(self, ldap_server, highest_usn, full):
+        """
+        Records a completed refresh
+
+        :param ldap_server: the ldap server that was queried
+        :param highest_usn: the DC's highestCommittedUSN before the refresh
+        :param full: True if the whole group was read
+        :raises ValueError: if highest_usn is None
+        """
+        if highest_usn is None:
+            raise ValueError(f'Refresh of {ldap_server} has no USN')
+        self.ldap_server = ldap_server
+        self.high_water_usn = highest_usn
+        if full:
+            self.last_full_scan = time.time()
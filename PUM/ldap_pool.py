@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# File name: ldap_pool.py
+# Description: Pool of bound ldap connections shared by concurrent searches
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for pooled ldap server connections"""
+
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import ldap
+from ldap.controls import SimplePagedResultsControl
+
+DEFAULT_POOL_SIZE = 4
+PAGE_SIZE = 1000
+
+# A connection idle for longer than this is checked before it is reused
+HEALTH_CHECK_INTERVAL = 60  # seconds
+
+
+def paged_search(con, basedn, scope, ldap_filter, attrs, page_size=PAGE_SIZE):
+    """
+    Runs a search with the simple paged results control, yielding each
+    page of raw results as it arrives.
+
+    :param con: bound ldap connection
+    :param page_size: number of entries requested per page
+    """
+    control = SimplePagedResultsControl(True, size=page_size, cookie='')
+    while True:
+        msgid = con.search_ext(basedn, scope, ldap_filter, attrs, serverctrls=[control])
+        _, rdata, _, serverctrls = con.result3(msgid)
+        yield rdata
+
+        cookies = [ctrl.cookie for ctrl in serverctrls
+                   if ctrl.controlType == SimplePagedResultsControl.controlType]
+        if not cookies or not cookies[0]:
+            break
+        control.cookie = cookies[0]
+
+
+class LdapConnectionPool(object):
+    """
+    Holds a fixed number of bound ldap connections so searches can run at
+    the same time.
+
+    Idle connections are health checked before reuse, connections that
+    report SERVER_DOWN are rebound and the search retried once, and the
+    number of searches in flight is bounded so the DC is not overloaded.
+
+    Methods:
+        open: Binds all of the pool's connections.
+
+        search: Runs a search on a pooled connection.
+
+        search_async: Runs a search without blocking the event loop.
+
+        search_paged: Runs a paged search on a pooled connection.
+
+        close: Unbinds all of the pool's connections.
+    """
+    def __init__(self, server, username, password, size=DEFAULT_POOL_SIZE,
+                 max_in_flight=None):
+        """
+        :param server: ldap server url
+        :param username: account used to bind
+        :param password: password for username
+        :param size: number of bound connections
+        :param max_in_flight: most searches running at once, defaults to size
+        """
+        self.server = server
+        self.username = username
+        self.password = password
+        self.size = size
+        self.connections = queue.Queue()
+        self.in_flight = threading.BoundedSemaphore(max_in_flight or size)
+        self.executor = None
+
+    def _bind(self):
+        """Returns a new bound connection"""
+        con = ldap.initialize(self.server)
+        con.protocol_version = ldap.VERSION3
+        con.set_option(ldap.OPT_REFERRALS, 0)
+        con.simple_bind_s(self.username, self.password)
+        return con
+
+    def _rebind(self, con):
+        """Drops a broken connection and returns a new one in its place"""
+        try:
+            con.unbind()
+        except ldap.LDAPError:
+            pass
+        return self._bind()
+
+    @staticmethod
+    def is_healthy(con):
+        """Checks a connection with a cheap Who am I? request"""
+        try:
+            con.whoami_s()
+            return True
+        except ldap.LDAPError:
+            return False
+
+    def open(self):
+        """Binds all of the pool's connections"""
+        for _ in range(self.size):
+            self.connections.put((self._bind(), time.monotonic()))
+        self.executor = ThreadPoolExecutor(max_workers=self.size)
+
+    def _acquire(self):
+        """Takes a connection from the pool, replacing it if it is unhealthy"""
+        con, last_used = self.connections.get()
+        if time.monotonic() - last_used > HEALTH_CHECK_INTERVAL and \
+                not self.is_healthy(con):
+            try:
+                con = self._rebind(con)
+            except ldap.LDAPError:
+                # Keep the pool at full size, the rebind is retried next time
+                self.connections.put((con, 0))
+                raise
+        return con
+
+    def search(self, basedn, scope, ldap_filter, attrs):
+        """
+        Runs search_s on a pooled connection. The search is retried once
+        on a fresh connection if the server went away.
+
+        :returns: the raw search_s results
+        """
+        with self.in_flight:
+            con = self._acquire()
+            succeeded = False
+            try:
+                try:
+                    res = con.search_s(basedn, scope, ldap_filter, attrs)
+                except ldap.SERVER_DOWN:
+                    con = self._rebind(con)
+                    res = con.search_s(basedn, scope, ldap_filter, attrs)
+                succeeded = True
+                return res
+            finally:
+                # A connection that failed is health checked on its next use
+                self.connections.put((con, time.monotonic() if succeeded else 0))
+
+    def search_paged(self, basedn, scope, ldap_filter, attrs, page_size=PAGE_SIZE):
+        """
+        Runs paged_search on a pooled connection, which is held until
+        the last page has been read.
+        """
+        with self.in_flight:
+            con = self._acquire()
+            succeeded = False
+            try:
+                yield from paged_search(con, basedn, scope, ldap_filter, attrs, page_size)
+                succeeded = True
+            finally:
+                self.connections.put((con, time.monotonic() if succeeded else 0))
+
+    async def search_async(self, basedn, scope, ldap_filter, attrs):
+        """Runs search on the pool's executor and awaits the results"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.search,
+                                          basedn, scope, ldap_filter, attrs)
+
+    def close(self):
+        """Unbinds all of the pool's connections"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        while not self.connections.empty():
+            con, _ = self.connections.get_nowait()
+            try:
+                con.unbind()
+            except ldap.LDAPError:
+                pass
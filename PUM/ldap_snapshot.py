@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# File name: ldap_snapshot.py
+# Description: Saves the deprovisioned users and their managers to a local
+#   file and answers PerforceLdap's searches from it
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for offline ldap snapshots"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import ldap
+
+# Oldest snapshot a modify-mode run will remove users with
+DEFAULT_MAX_AGE = 24 * 60 * 60    # seconds
+
+# Snapshots already loaded, keyed by path, so every server shares one index
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+_ACCOUNT_TERM = re.compile(r'\(?AccountName=([^()]*)\)?', re.IGNORECASE)
+_ESCAPE = re.compile(r'\\([0-9a-fA-F]{2})')
+
+
+def _encode(attrs):
+    """Raw attribute values (lists of bytes) as JSON friendly strings"""
+    return {name: [value.decode('utf-8', 'surrogateescape') if isinstance(value, bytes) else value
+                   for value in values]
+            for name, values in attrs.items()}
+
+
+def _decode(attrs):
+    """The raw attribute values _encode was given"""
+    return {name: [value.encode('utf-8', 'surrogateescape') for value in values]
+            for name, values in attrs.items()}
+
+
+def _unescape(value):
+    """Undoes escape_filter_chars"""
+    return _ESCAPE.sub(lambda match: chr(int(match.group(1), 16)), value)
+
+
+def take_snapshot(p4_ldap, path, basedn, user_attrs, manager_attrs):
+    """
+    Pages through basedn and reads the entry of every manager found,
+    saving them to a SQLite file for LdapSnapshot.
+
+    :param p4_ldap: bound PerforceLdap reading the live server
+    :param path: the snapshot file, replaced if it exists
+    :param basedn: the deprovisioned group
+    :param user_attrs: attributes kept for the users
+    :param manager_attrs: attributes kept for the managers
+    :returns: the number of users and managers saved
+    """
+    started = time.monotonic()
+    highest_usn = p4_ldap.get_highest_usn()
+
+    con = sqlite3.connect(path + '.tmp')
+    con.execute('DROP TABLE IF EXISTS entries')
+    con.execute('DROP TABLE IF EXISTS meta')
+    con.execute('CREATE TABLE entries (dn TEXT, kind TEXT, account TEXT, attrs TEXT, '
+                'PRIMARY KEY (dn, kind))')
+    con.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+
+    users = 0
+    managers = set()
+    for page in p4_ldap.search_paged(basedn, ldap.SCOPE_SUBTREE, '(AccountName=*)', user_attrs):
+        rows = []
+        for dn, attrs in page:
+            if dn is None:      # search continuation references
+                continue
+            attrs = _encode(attrs)
+            account = ''.join(attrs.get('AccountName', [])).lower()
+            managers.update(attrs.get('manager', []))
+            rows.append((dn, 'user', account, json.dumps(attrs)))
+        con.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', rows)
+        users += len(rows)
+
+    rows = []
+    for manager_dn in managers:
+        try:
+            raw_res = p4_ldap.search(manager_dn, ldap.SCOPE_BASE, '(objectClass=*)', manager_attrs)
+        except ldap.NO_SUCH_OBJECT:
+            continue
+        for dn, attrs in raw_res:
+            if dn is not None:
+                rows.append((dn, 'manager', None, json.dumps(_encode(attrs))))
+    con.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', rows)
+
+    con.executemany('INSERT INTO meta VALUES (?, ?)',
+                    [('ldap_server', p4_ldap.server), ('basedn', basedn),
+                     ('highest_usn', str(highest_usn)), ('taken', str(int(time.time())))])
+    con.commit()
+    con.close()
+    os.replace(path + '.tmp', path)
+
+    print (f'Saved {users} users and {len(rows)} managers to {path} '
+           f'in {time.monotonic() - started:.1f}s')
+    return users, len(rows)
+
+
+def snapshot_age(path):
+    """
+    Seconds since the snapshot in path was taken
+
+    :param path: the snapshot file written by take_snapshot
+    :returns: the age, or None if path isn't a snapshot with a taken time
+    """
+    if not os.path.exists(path):
+        return None
+
+    con = sqlite3.connect(path)
+    try:
+        row = con.execute("SELECT value FROM meta WHERE name = 'taken'").fetchone()
+    except sqlite3.DatabaseError:
+        row = None
+    finally:
+        con.close()
+    if row is None:
+        return None
+    return time.time() - int(row[0])
+
+
+class LdapSnapshot(object):
+    """
+    Read-only stand-in for a bound ldap connection, answering the
+    searches PerforceLdap makes from a snapshot held in memory.
+
+    Every entry is indexed by its DN and users also by their AccountName,
+    so a lookup is a dict access. The filters understood are the ones
+    PerforceLdap builds: ``AccountName=x``, OR filters of AccountName
+    terms, ``(AccountName=*)`` (optionally and'ed with a uSNChanged
+    term, which returns every user), base reads of a DN and the root DSE.
+
+    Methods:
+        open: Loads a snapshot once per process.
+
+        load: Reads the snapshot file into the indexes.
+
+        search_s: Same results as ldap's search_s.
+
+        unbind: Does nothing, for PerforceLdap.unbind_from_ldap.
+    """
+    def __init__(self, path):
+        """
+        :param path: the snapshot file written by take_snapshot
+        """
+        self.path = path
+        self.by_dn = {}         # lower cased DN -> (dn, attrs)
+        self.by_account = {}    # lower cased AccountName -> (dn, attrs)
+        self.meta = {}
+        self.searches = 0
+
+    @classmethod
+    def open(cls, path):
+        """Returns the loaded snapshot for path, loading it the first time"""
+        with _loaded_lock:
+            if path not in _loaded:
+                _loaded[path] = cls(path).load()
+            return _loaded[path]
+
+    def load(self):
+        """Reads every entry of the snapshot file into the indexes"""
+        con = sqlite3.connect(self.path)
+        try:
+            self.meta = dict(con.execute('SELECT name, value FROM meta'))
+            for dn, kind, account, attrs in con.execute('SELECT dn, kind, account, attrs FROM entries'):
+                entry = (dn, _decode(json.loads(attrs)))
+                if kind == 'user':
+                    self.by_account.setdefault(account, entry)
+
+                # A manager who is also deprovisioned has both sets of attributes
+                known = self.by_dn.get(dn.lower())
+                if known is not None:
+                    entry = (known[0], dict(known[1], **entry[1]))
+                self.by_dn[dn.lower()] = entry
+        finally:
+            con.close()
+        print (f'Loaded {len(self.by_account)} users and {len(self.by_dn)} entries '
+               f'from {self.path}')
+        return self
+
+    @staticmethod
+    def _project(entry, attrlist):
+        """The entry with only the attributes asked for"""
+        dn, attrs = entry
+        if not attrlist:
+            return dn, dict(attrs)
+        wanted = {name.lower() for name in attrlist}
+        return dn, {name: values for name, values in attrs.items() if name.lower() in wanted}
+
+    def search_s(self, basedn, scope, filterstr='(objectClass=*)', attrlist=None):
+        """
+        Answers a search from the indexes
+
+        :returns: list of (dn, attrs) like ldap's search_s
+        """
+        self.searches += 1
+        if scope == ldap.SCOPE_BASE:
+            if basedn == '':
+                return [('', {'highestCommittedUSN': [self.meta.get('highest_usn', '0').encode()]})]
+            entry = self.by_dn.get(basedn.lower())
+            if entry is None:
+                raise ldap.NO_SUCH_OBJECT({'desc': 'No such object', 'matched': basedn})
+            return [self._project(entry, attrlist)]
+
+        accounts = [_unescape(term) for term in _ACCOUNT_TERM.findall(filterstr)]
+        if not accounts:
+            raise ldap.FILTER_ERROR({'desc': f'Snapshot can\'t answer {filterstr}'})
+        if '*' in accounts:
+            entries = self.by_account.values()
+        else:
+            entries = [self.by_account[account.lower()] for account in accounts
+                       if account.lower() in self.by_account]
+
+        base = basedn.lower()
+        return [self._project(entry, attrlist) for entry in entries
+                if entry[0].lower().endswith(base)]
+
+    def unbind(self):
+        pass
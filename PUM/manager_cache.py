@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# File name: manager_cache.py
+# Description: Caches manager lookups made against the ldap server
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for caching ldap manager lookups"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE = 5000
+DEFAULT_TTL = 24 * 60 * 60  # seconds
+
+
+class ManagerCache(object):
+    """
+    Size bounded LRU cache of manager details keyed by the manager's DN.
+
+    Entries expire after ``ttl`` seconds. The cache is thread safe so a
+    single instance can be shared by every server processed in a run, and
+    it can optionally be persisted to disk between runs.
+
+    Methods:
+        get: Returns the cached (email, display name) for a DN.
+
+        put: Stores the (email, display name) for a DN.
+
+        load: Reads unexpired entries from the cache file.
+
+        save: Writes the cache to the cache file.
+
+        stats: Summary of hits, misses and evictions for the log.
+    """
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, path=None):
+        """
+        :param max_size: Maximum number of managers held in memory
+        :param ttl: Seconds a manager lookup stays valid
+        :param path: Optional file used to persist the cache between runs
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()    # dn -> (expires, (email, name))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(dn):
+        """DNs compare case-insensitively"""
+        return dn.lower()
+
+    def get(self, dn):
+        """
+        Returns the cached manager details for dn, or None on a miss.
+
+        :param dn: the manager's distinguished name
+        """
+        key = self._key(dn)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, dn, manager):
+        """
+        Stores the manager details for dn, evicting the least recently
+        used entry when the cache is full.
+
+        :param dn: the manager's distinguished name
+        :param manager: (email, display name) tuple
+        """
+        key = self._key(dn)
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, tuple(manager))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def load(self):
+        """Reads unexpired entries from the cache file, if there is one"""
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as cache_file:
+                saved = json.load(cache_file)
+        except (IOError, ValueError) as excep:
+            print (f"Error reading manager cache {self.path}")
+            print (excep)
+            return
+
+        now = time.time()
+        with self.lock:
+            for key, (expires, manager) in saved.items():
+                if expires >= now:
+                    self.entries[key] = (expires, tuple(manager))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        """Writes the cache to the cache file, if one was configured"""
+        if not self.path:
+            return
+
+        with self.lock:
+            saved = OrderedDict((key, [expires, list(manager)])
+                                for key, (expires, manager) in self.entries.items())
+        try:
+            tmp_name = self.path + '.tmp'
+            with open(tmp_name, 'w') as cache_file:
+                json.dump(saved, cache_file)
+            os.replace(tmp_name, self.path)
+        except IOError as excep:
+            print (f"Error saving manager cache {self.path}")
+            print (excep)
+
+    def stats(self):
+        """Returns a one line summary of the cache counters"""
+        with self.lock:
+            return (f'Manager cache: {self.hits} hits, {self.misses} misses, '
+                    f'{self.evictions} evictions, {len(self.entries)} entries')
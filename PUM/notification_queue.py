@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# File name: notification_queue.py
+# Description: Collects manager notifications into digests and sends them
+#   in the background over reused SMTP connections
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for batched manager notifications"""
+
+import os
+import time
+import queue
+import smtplib
+import threading
+from email.message import EmailMessage
+
+SMTP_SERVER = 'mail.website.com'
+SENDER = 'perforce-admin@website.com'
+DEFAULT_CONNECTIONS = 1
+
+
+class SmtpSink(object):
+    """
+    Sends messages over a single SMTP connection that is opened on first
+    use and kept open, reconnecting if the server drops it.
+    """
+    def __init__(self, server=SMTP_SERVER):
+        """
+        :param server: SMTP host, optionally with :port
+        """
+        host, _, port = server.partition(':')
+        self.host = host
+        self.port = int(port) if port else 0
+        self.smtp = None
+
+    def send(self, message):
+        """Sends message, retrying once on a fresh connection"""
+        for attempt in range(2):
+            try:
+                if self.smtp is None:
+                    self.smtp = smtplib.SMTP(self.host, self.port)
+                self.smtp.send_message(message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.smtp = None
+                if attempt:
+                    raise
+
+    def close(self):
+        """Ends the SMTP session"""
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self.smtp = None
+
+
+class DirectorySink(object):
+    """Dry-run sink that writes each message to an .eml file instead of sending it"""
+    def __init__(self, path):
+        """
+        :param path: directory the messages are written to
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        """Writes message to the next numbered file"""
+        with self.lock:
+            self.count += 1
+            file_name = os.path.join(self.path, f'{time.strftime("%Y%m%d%H%M%S")}-{self.count:05d}.eml')
+        with open(file_name, 'wb') as eml_file:
+            eml_file.write(message.as_bytes())
+
+    def close(self):
+        """Nothing to close"""
+
+
+class NotificationQueue(object):
+    """
+    Groups the departed users of each manager into a single digest email
+    and sends the digests from background threads, each holding its own
+    reused connection, so removals never wait on the mail server.
+
+    Methods:
+        add: Records a departed user for their manager's digest.
+
+        flush: Queues the collected digests for sending.
+
+        close: Waits for every queued digest to be sent.
+    """
+    def __init__(self, sink_factory, connections=DEFAULT_CONNECTIONS, sender=SENDER):
+        """
+        :param sink_factory: callable returning an SmtpSink or DirectorySink,
+            called once per sending thread
+        :param connections: number of sending threads
+        :param sender: From address of the digests
+        """
+        self.sender = sender
+        self.lock = threading.Lock()
+        self.digests = {}    # lower cased email -> (email, manager name, [(server, user)])
+        self.outbox = queue.Queue()
+        self.sent = 0
+        self.errors = 0
+        self.threads = [threading.Thread(target=self._send_loop, args=(sink_factory(),),
+                                         daemon=True)
+                        for _ in range(max(1, connections))]
+        for thread in self.threads:
+            thread.start()
+
+    def add(self, server, user):
+        """
+        Records that user was found departed on server
+
+        :param server: the perforce server
+        :param user: PerforceUser with a valid manager_email
+        """
+        with self.lock:
+            _, _, users = self.digests.setdefault(user.manager_email.lower(),
+                                                  (user.manager_email, user.manager, []))
+            users.append((server, user))
+
+    def build_digest(self, manager_email, manager, users):
+        """
+        Creates the digest email for one manager
+
+        :param manager_email: the manager's email address
+        :param manager: the manager's display name
+        :param users: list of (server, PerforceUser)
+        """
+        lines = [f'Hello {manager},', '',
+                 'The following Perforce accounts belong to people who report to you '
+                 'and are no longer with the company. They have been removed and their '
+                 'licenses freed:', '']
+        for server, user in users:
+            lines.append(f'    {user.name} ({user.username}) on {server}')
+        lines += ['', 'Please contact the Perforce admins with any questions.']
+
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = manager_email
+        message['Subject'] = f'Perforce accounts removed: {len(users)} of your reports'
+        message.set_content('\n'.join(lines))
+        return message
+
+    def flush(self):
+        """Queues a digest for every manager collected so far and returns straight away"""
+        with self.lock:
+            digests, self.digests = self.digests, {}
+
+        for manager_email, manager, users in digests.values():
+            self.outbox.put(self.build_digest(manager_email, manager, users))
+
+    def _send_loop(self, sink):
+        """Sends queued digests until close is called"""
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                sink.close()
+                return
+
+            try:
+                sink.send(message)
+                with self.lock:
+                    self.sent += 1
+            except (smtplib.SMTPException, OSError) as excep:
+                with self.lock:
+                    self.errors += 1
+                print (f"Error emailing {message['To']}")
+                print (excep)
+
+    def close(self):
+        """Sends anything still collected and waits for the senders to finish"""
+        self.flush()
+        for _ in self.threads:
+            self.outbox.put(None)
+        for thread in self.threads:
+            thread.join()
+        print (f'Manager notifications: {self.sent} sent, {self.errors} failed')
@@ -6,11 +6,70 @@
 
 """Module for ldap server interactions"""
 
-import sys
 import os
+import itertools
+import asyncio
 import ldap
+from ldap.filter import escape_filter_chars
+from ldap.dn import str2dn
 import ldap_helper
 from perforce_user import PerforceUser
+from manager_cache import ManagerCache
+from ldap_pool import LdapConnectionPool, paged_search
+from ldap_snapshot import LdapSnapshot, take_snapshot
+from run_trace import LdapCounters
+
+# Deprovisioned accounts live under this OU
+DISABLED_BASEDN = "OU=Accounts,OU=Disabled"
+USER_ATTRS = ['mail', 'manager', 'AccountName', 'name']
+MANAGER_ATTRS = ['mail', 'displayname']
+
+# Number of AccountName terms OR'ed into a single search filter
+FILTER_CHUNK_SIZE = 200
+
+
+def chunked(iterable, size):
+    """Yields lists of at most size items from iterable"""
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def parse_dn(dn):
+    """
+    Splits dn into its RDNs, with attribute types and values lower cased
+    since AD compares both without case
+
+    :returns: list of RDNs, each a sorted tuple of (type, value) pairs,
+        or None if dn is not a valid DN
+    """
+    try:
+        return [tuple(sorted((attr_type.lower(), value.lower()) for attr_type, value, _ in rdn))
+                for rdn in str2dn(dn)]
+    except ldap.DECODING_ERROR:
+        return None
+
+
+def is_under(dn, base_dn):
+    """
+    Whether dn is base_dn or an entry below it. DNs are compared RDN by
+    RDN, so spacing and escaping differences don't matter and an OU that
+    only ends with the same text doesn't match.
+
+    :param dn: the entry's DN
+    :param base_dn: the subtree's DN
+    """
+    rdns, base_rdns = parse_dn(dn), parse_dn(base_dn)
+    if rdns is None or base_rdns is None or len(rdns) < len(base_rdns):
+        return False
+    return rdns[len(rdns) - len(base_rdns):] == base_rdns
+
+
+class LdapBindError(ldap.LDAPError):
+    """The ldap server refused the service account's credentials"""
+
 
 class PerforceLdap(object):
     """
@@ -22,41 +81,275 @@ class PerforceLdap(object):
         search_ldap_for_user: Searches for users in the deprovisioned
         user group.
 
+        search_ldap_for_users: Searches for many users in the deprovisioned
+        user group with chunked OR filters.
+
         search_ldap_for_manager: Searches for manager.
 
+        search / search_async: Runs a search on the single connection or
+        the connection pool.
+
+        fetch_disabled_accounts: Pages through the deprovisioned user group.
+
+        refresh_disabled_accounts: Brings a DisabledAccountState up to date.
+
+        save_snapshot: Saves the deprovisioned group and managers for
+        offline runs.
+
         unbind_from_ldap: Stops connection from ldap server.
     """
-    def __init__(self):
-        """Sets the ldap server name and login credentials"""
+    def __init__(self, manager_cache=None, pool_size=0, snapshot=None):
+        """
+        Sets the ldap server name and login credentials
+
+        :param manager_cache: ManagerCache shared between PerforceLdap
+            instances. A private cache is used when none is given.
+        :param pool_size: Number of pooled connections used to run
+            searches concurrently. 0 uses a single connection.
+        :param snapshot: Snapshot file searched instead of the ldap
+            server, see save_snapshot
+        """
 
         self.server = 'ldap://1.1.1.1'
         self.username = ('service_acct')
         self.password = os.environ.get('SVC_PWD')
         self.ldap = ''
+        self.filter_chunk_size = FILTER_CHUNK_SIZE
+        if manager_cache is None:
+            manager_cache = ManagerCache()
+        self.manager_cache = manager_cache
+        self.pool_size = pool_size
+        self.pool = None
+        self.snapshot = snapshot
+        self.counters = LdapCounters()
 
     def bind_to_ldap(self):
         """
         Connects to the LDAP server
 
+        :raises LdapBindError: if the credentials are refused
+
         .. literalinclude:: ../perforce_user_management/perforce_ldap.py
             :linenos:
             :language: python
             :lines: 55, 65-76
         """
 
-        self.ldap = ldap.initialize(self.server)
-        self.ldap.protocol_version = ldap.VERSION3
-        self.ldap.set_option(ldap.OPT_REFERRALS, 0)
+        if self.snapshot:
+            self.ldap = LdapSnapshot.open(self.snapshot)
+            return
 
         try:
+            if self.pool_size:
+                self.pool = LdapConnectionPool(self.server, self.username,
+                                               self.password, self.pool_size)
+                self.pool.open()
+                return
+
+            self.ldap = ldap.initialize(self.server)
+            self.ldap.protocol_version = ldap.VERSION3
+            self.ldap.set_option(ldap.OPT_REFERRALS, 0)
             self.ldap.simple_bind_s(self.username, self.password)
        
-        except ldap.INVALID_CREDENTIALS:
+        except ldap.INVALID_CREDENTIALS as exception:
             print ('Incorrect credentials!')
-            sys.exit()
+            raise LdapBindError(f'{self.username} could not bind to {self.server}') from exception
         except ldap.LDAPError as exception:
             print (exception)
 
+    def search(self, basedn, scope, ldap_filter, attrs):
+        """
+        Runs a search on the connection pool when there is one, otherwise
+        on the single connection.
+
+        :returns: the raw search_s results
+        """
+        try:
+            if self.pool is not None:
+                raw_res = self.pool.search(basedn, scope, ldap_filter, attrs)
+            else:
+                raw_res = self.ldap.search_s(basedn, scope, ldap_filter, attrs)
+        except ldap.LDAPError:
+            self.counters.add_error()
+            raise
+        self.counters.add(raw_res)
+        return raw_res
+
+    async def search_async(self, basedn, scope, ldap_filter, attrs):
+        """
+        Awaitable version of search. Searches overlap when a connection
+        pool is in use, otherwise they run one at a time.
+
+        :returns: the raw search_s results
+        """
+        if self.pool is None:
+            return self.search(basedn, scope, ldap_filter, attrs)
+        try:
+            raw_res = await self.pool.search_async(basedn, scope, ldap_filter, attrs)
+        except ldap.LDAPError:
+            self.counters.add_error()
+            raise
+        self.counters.add(raw_res)
+        return raw_res
+
+    def search_paged(self, basedn, scope, ldap_filter, attrs):
+        """
+        Runs a paged search on the connection pool when there is one,
+        otherwise on the single connection.
+
+        :returns: generator of pages of raw search results
+        """
+        if self.pool is not None:
+            pages = self.pool.search_paged(basedn, scope, ldap_filter, attrs)
+        elif self.snapshot:
+            pages = iter([self.ldap.search_s(basedn, scope, ldap_filter, attrs)])
+        else:
+            pages = paged_search(self.ldap, basedn, scope, ldap_filter, attrs)
+        return self._count_pages(pages)
+
+    def _count_pages(self, pages):
+        """Counts each page of a paged search as one query"""
+        try:
+            for page in pages:
+                self.counters.add(page)
+                yield page
+        except ldap.LDAPError:
+            self.counters.add_error()
+            raise
+
+    def get_highest_usn(self):
+        """
+        Reads the highestCommittedUSN of the DC from the root DSE
+
+        :returns: the DC's current update sequence number, or None if the
+            DC doesn't publish one
+        """
+        raw_res = self.search('', ldap.SCOPE_BASE, '(objectClass=*)', ['highestCommittedUSN'])
+        for record in ldap_helper.get_search_results(raw_res):
+            usn = ''.join(record.get_attributes().get('highestCommittedUSN', []))
+            return int(usn) if usn else None
+        return None
+
+    def get_naming_context(self):
+        """
+        Reads the defaultNamingContext of the DC from the root DSE
+
+        :returns: the DN of the directory's root, or None if the DC
+            doesn't publish one
+        """
+        raw_res = self.search('', ldap.SCOPE_BASE, '(objectClass=*)', ['defaultNamingContext'])
+        for record in ldap_helper.get_search_results(raw_res):
+            return ''.join(record.get_attributes().get('defaultNamingContext', [])) or None
+        return None
+
+    def fetch_disabled_accounts(self, ldap_filter='(AccountName=*)'):
+        """
+        Pages through the "deprovisioned" group.
+
+        :param ldap_filter: filter applied to the deprovisioned group
+        :returns: ldap attributes keyed by lower cased AccountName
+
+        .. literalinclude:: ../perforce_user_management/perforce_ldap.py
+            :linenos:
+            :language: python
+            :pyobject: PerforceLdap.fetch_disabled_accounts
+        """
+        accounts = {}
+        for page in self.search_paged(DISABLED_BASEDN, ldap.SCOPE_SUBTREE, ldap_filter, USER_ATTRS):
+            for account, attr in self.index_by_account(ldap_helper.get_search_results(page)).items():
+                accounts.setdefault(account, dict(attr))
+        return accounts
+
+    def find_reenabled_accounts(self, accounts, since_usn):
+        """
+        Finds the known deprovisioned accounts that have been moved out of
+        the "deprovisioned" group since since_usn, i.e. re-enabled.
+
+        The whole directory is searched for accounts changed since
+        since_usn, since an account that left the group can't be found
+        by searching the group.
+
+        :param accounts: known deprovisioned accounts keyed by lower
+            cased AccountName
+        :param since_usn: the lowest uSNChanged to read
+        :returns: set of lower cased AccountNames, or None if the
+            directory's root can't be read
+        """
+        naming_context = self.get_naming_context()
+        if naming_context is None:
+            return None
+
+        ldap_filter = '(&(AccountName=*)(uSNChanged>=%d))' % since_usn
+        reenabled = set()
+        for page in self.search_paged(naming_context, ldap.SCOPE_SUBTREE, ldap_filter, ['AccountName']):
+            for dn, attr in page:
+                if dn is None:      # search continuation references
+                    continue
+                account = b''.join(attr.get('AccountName', [])).decode('utf-8', 'replace').lower()
+                if account in accounts and not is_under(dn, DISABLED_BASEDN):
+                    reenabled.add(account)
+        return reenabled
+
+    def refresh_disabled_accounts(self, state, full=False):
+        """
+        Brings the known deprovisioned accounts in state up to date.
+
+        Only entries whose uSNChanged is past the state's high-water mark
+        are read, unless a full rescan is requested or the state cannot be
+        used, in which case the whole group is read again. Known accounts
+        that were changed and are no longer in the group are dropped, so
+        a re-enabled account stops being treated as departed straight
+        away. When the directory's root can't be read to look for them
+        the whole group is read again instead. When the DC's USN can't be
+        read the whole group is read and the state is left without a
+        server, so it isn't saved with a high-water mark it never had.
+
+        :param state: DisabledAccountState loaded from the previous run
+        :param full: True to force a full rescan
+        :returns: True if a full rescan was done
+
+        .. literalinclude:: ../perforce_user_management/perforce_ldap.py
+            :linenos:
+            :language: python
+            :pyobject: PerforceLdap.refresh_disabled_accounts
+        """
+        # Read before searching so changes made during the search are
+        # picked up again by the next run
+        highest_usn = self.get_highest_usn()
+        if highest_usn is None:
+            print ("Can't read the DC's highestCommittedUSN, reading the whole deprovisioned group")
+            state.accounts = self.fetch_disabled_accounts()
+            state.ldap_server = None
+            return True
+
+        full = full or not state.is_current(self.server)
+        if not full:
+            reenabled = self.find_reenabled_accounts(state.accounts, state.high_water_usn + 1)
+            full = reenabled is None
+        if full:
+            state.accounts = self.fetch_disabled_accounts()
+        else:
+            ldap_filter = '(&(AccountName=*)(uSNChanged>=%d))' % (state.high_water_usn + 1)
+            state.accounts.update(self.fetch_disabled_accounts(ldap_filter))
+            for account in reenabled:
+                del state.accounts[account]
+            if reenabled:
+                print (f'Dropped {len(reenabled)} re-enabled accounts: {", ".join(sorted(reenabled))}')
+
+        state.mark_synced(self.server, highest_usn, full)
+        return full
+
+    def save_snapshot(self, path):
+        """
+        Saves the deprovisioned group and the managers of its users to
+        path, so later runs can search it with the snapshot parameter
+        instead of the ldap server
+
+        :param path: the snapshot file
+        :returns: the number of users and managers saved
+        """
+        return take_snapshot(self, path, DISABLED_BASEDN, USER_ATTRS, MANAGER_ATTRS)
+
     def search_ldap_for_user(self, user):
         """
         Searches the LDAP server for users in the "deprovisioned" group.
@@ -67,33 +360,167 @@ class PerforceLdap(object):
             :lines: 78, 88-106
         """
 		#Prepare the ldap search. Only Searches the Deprovisioned group
-        basedn = "OU=Accounts,OU=Disabled"
         ldap_filter = "AccountName=%s" % user['User']
-        attrs = ['mail', 'manager', 'AccountName', 'name']
 
         # Convert results into something easily usable.
-        raw_res = self.ldap.search_s(basedn, ldap.SCOPE_SUBTREE, ldap_filter, attrs)
+        raw_res = self.search(DISABLED_BASEDN, ldap.SCOPE_SUBTREE, ldap_filter, USER_ATTRS)
+        res = ldap_helper.get_search_results(raw_res)
+
+        if not res:
+            return False
+        for record in res:
+            return self.build_user(record.get_attributes(), user)
+
+    async def search_ldap_for_user_async(self, user):
+        """
+        Awaitable version of search_ldap_for_user. The manager is resolved
+        through search_ldap_for_manager_async before the user is built.
+
+        :param user: the users information from perforce
+        """
+        ldap_filter = "AccountName=%s" % escape_filter_chars(user['User'])
+
+        raw_res = await self.search_async(DISABLED_BASEDN, ldap.SCOPE_SUBTREE, ldap_filter, USER_ATTRS)
         res = ldap_helper.get_search_results(raw_res)
 
         if not res:
             return False
         for record in res:
             attr = record.get_attributes()
+            managers = {}
+            if 'manager' in attr.keys():
+                managers[''.join(attr['manager'])] = await self.search_ldap_for_manager_async(attr)
+            return self.build_user(attr, user, managers)
 
-            if len(attr.keys()) == 4:
-                return self.set_reg_user(attr, user)
+    def search_ldap_for_users(self, user_list):
+        """
+        Searches the LDAP server for every user in user_list that is in
+        the "deprovisioned" group.
 
-            else:
-                return self.set_other_user(attr, user)
+        Users are looked up in chunks of ``filter_chunk_size`` with a single
+        ``(|(AccountName=a)(AccountName=b)...)`` search per chunk, then the
+        results are joined back to the Perforce users in memory.
+
+        :param user_list: the users information from perforce
+        :returns: List of PerforceUser for the departed users, in the
+            same order as user_list
+
+        .. literalinclude:: ../perforce_user_management/perforce_ldap.py
+            :linenos:
+            :language: python
+            :pyobject: PerforceLdap.search_ldap_for_users
+        """
+        if self.pool is not None:
+            return asyncio.run(self.search_ldap_for_users_async(user_list))
+
+        departed_users = []
+        for chunk in chunked(user_list, self.filter_chunk_size):
+            raw_res = self.search(DISABLED_BASEDN, ldap.SCOPE_SUBTREE,
+                                  self.account_filter(chunk), USER_ATTRS)
+            accounts = self.index_by_account(ldap_helper.get_search_results(raw_res))
+            departed_users.extend(self.join_users(chunk, accounts))
+
+        return departed_users
+
+    async def search_ldap_for_users_async(self, user_list):
+        """
+        Awaitable version of search_ldap_for_users.
+
+        As many chunks as there are pooled connections are searched at
+        once, then the managers of every departed user found are resolved
+        concurrently and handed to the PerforceUser objects as they are
+        built, so each manager goes through the cache once.
+
+        :param user_list: the users information from perforce
+        :returns: List of PerforceUser for the departed users, in the
+            same order as user_list
+        """
+        window_size = self.pool.size if self.pool is not None else 1
+        departed_users = []
+
+        for window in chunked(chunked(user_list, self.filter_chunk_size), window_size):
+            raw_results = await asyncio.gather(*(
+                self.search_async(DISABLED_BASEDN, ldap.SCOPE_SUBTREE,
+                                  self.account_filter(chunk), USER_ATTRS)
+                for chunk in window))
+            window_accounts = [self.index_by_account(ldap_helper.get_search_results(raw_res))
+                               for raw_res in raw_results]
+
+            manager_dns = list({''.join(attr['manager'])
+                                for accounts in window_accounts
+                                for attr in accounts.values() if 'manager' in attr.keys()})
+            found = await asyncio.gather(*(self.search_ldap_for_manager_async({'manager': [dn]})
+                                           for dn in manager_dns))
+            managers = dict(zip(manager_dns, found))
+
+            for chunk, accounts in zip(window, window_accounts):
+                departed_users.extend(self.join_users(chunk, accounts, managers))
+
+        return departed_users
+
+    @staticmethod
+    def account_filter(user_list):
+        """
+        Builds an OR filter matching the AccountName of every user
+
+        :param user_list: the users information from perforce
+        """
+        return '(|%s)' % ''.join('(AccountName=%s)' % escape_filter_chars(user['User'])
+                                 for user in user_list)
 
+    @staticmethod
+    def index_by_account(res):
+        """
+        Maps the lower cased AccountName of each search result to its
+        attributes. The first record wins, like search_ldap_for_user.
+
+        :param res: results from ldap_helper.get_search_results
+        """
+        accounts = {}
+        for record in res:
+            attr = record.get_attributes()
+            account = ''.join(attr.get('AccountName', [])).lower()
+            accounts.setdefault(account, attr)
+        return accounts
 
-    def set_reg_user(self, attr, user):
+    def join_users(self, user_list, accounts, managers=None):
+        """
+        Creates a PerforceUser for every Perforce user with an entry
+        in accounts
+
+        :param user_list: the users information from perforce
+        :param accounts: ldap attributes keyed by lower cased AccountName
+        :param managers: managers already looked up, keyed by DN
+        """
+        departed_users = []
+        for user in user_list:
+            attr = accounts.get(user['User'].lower())
+            if attr:
+                departed_users.append(self.build_user(attr, user, managers))
+        return departed_users
+
+    def build_user(self, attr, user, managers=None):
+        """
+        Creates a PerforceUser from the ldap attributes, depending on
+        whether all of the user information was found
+
+        :param attr: the users attributes from the ldap query
+        :param user: the users information from perforce
+        :param managers: managers already looked up, keyed by DN
+        """
+        if len(attr.keys()) == 4:
+            return self.set_reg_user(attr, user, managers)
+
+        return self.set_other_user(attr, user, managers)
+
+    def set_reg_user(self, attr, user, managers=None):
         """
         Creates a PerforceUser given all the user information
         has been found
 
         :param attr: the users attributes from the ldap query
         :param user: the users information from perforce
+        :param managers: managers already looked up, keyed by DN
 
         .. literalinclude:: ../perforce_user_management/perforce_ldap.py
             :linenos:
@@ -107,16 +534,17 @@ class PerforceLdap(object):
         p4_user.email = ''.join(attr['mail'])
         p4_user.ldap_name = ''.join(attr['name']).replace(',', '.')
         p4_user.manager_email, p4_user.manager = \
-                (self.search_ldap_for_manager(attr))
+                (self.lookup_manager(attr, managers))
         return p4_user
 
-    def set_other_user(self, attr, user):
+    def set_other_user(self, attr, user, managers=None):
         """
         Creates a PerforceUser given not all the user information
         has been found
 
         :param attr: the users attributes from the ldap query
         :param user: the users information from perforce
+        :param managers: managers already looked up, keyed by DN
 
         .. literalinclude:: ../perforce_user_management/perforce_ldap.py
             :linenos:
@@ -137,13 +565,26 @@ class PerforceLdap(object):
 
         if 'manager' in attr.keys():
             p4user.manager_email, p4user.manager = \
-                        (self.search_ldap_for_manager(attr))
+                        (self.lookup_manager(attr, managers))
         else:
             p4user.manager_email, p4user.manager = \
                         ('No manager email', 'No manager in ldap')
 
         return p4user
 
+    def lookup_manager(self, user_attr, managers=None):
+        """
+        The manager an async search already found, taken as it is so the
+        cache counts the lookup once, otherwise search_ldap_for_manager
+
+        :param user_attr: the users attributes from the ldap query
+        :param managers: managers already looked up, keyed by DN
+        """
+        manager = (managers or {}).get(''.join(user_attr['manager']))
+        if manager is not None:
+            return manager
+        return self.search_ldap_for_manager(user_attr)
+
     def search_ldap_for_manager(self, user_attr):
         """
         Searches LDAP for a user's managers details
@@ -154,20 +595,49 @@ class PerforceLdap(object):
             :lines: 166, 176-189
         """
 
-        # Manager Search Criteria
+        # Manager Search Criteria. Reads the manager's entry directly.
+        basedn = ''.join(user_attr['manager'])
+
+        manager = self.manager_cache.get(basedn)
+        if manager is not None:
+            return manager
+
+        raw_res = self.search(basedn, ldap.SCOPE_BASE, '(objectClass=*)', MANAGER_ATTRS)
+        return self.cache_manager(basedn, raw_res)
+
+    async def search_ldap_for_manager_async(self, user_attr):
+        """
+        Awaitable version of search_ldap_for_manager
+
+        :param user_attr: the users attributes from the ldap query
+        """
         basedn = ''.join(user_attr['manager'])
-        ldap_filter = "cn=*"
-        attrs = ['mail', 'displayname']
 
-        raw_res = self.ldap.search_s(basedn, ldap.SCOPE_SUBTREE, ldap_filter, attrs)
+        manager = self.manager_cache.get(basedn)
+        if manager is not None:
+            return manager
+
+        raw_res = await self.search_async(basedn, ldap.SCOPE_BASE, '(objectClass=*)', MANAGER_ATTRS)
+        return self.cache_manager(basedn, raw_res)
+
+    def cache_manager(self, basedn, raw_res):
+        """
+        Converts a manager search into (email, display name) and caches it
+
+        :param basedn: the manager's distinguished name
+        :param raw_res: the raw search_s results for basedn
+        """
         res = ldap_helper.get_search_results(raw_res)
 
         for record in res:
             attr = record.get_attributes()
             if len(attr.keys()) != 2:
-                return 'No managers email', ''.join(attr['displayname'])
+                manager = 'No managers email', ''.join(attr['displayname'])
             else:
-                return ''.join(attr['mail']), ''.join(attr['displayname'])
+                manager = ''.join(attr['mail']), ''.join(attr['displayname'])
+
+            self.manager_cache.put(basedn, manager)
+            return manager
 
     def unbind_from_ldap(self):
         """
@@ -179,6 +649,10 @@ class PerforceLdap(object):
             :lines: 191, 201-202
         """
 
-        self.ldap.unbind()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        else:
+            self.ldap.unbind()
         print ("Unbound")
-		
\ No newline at end of file
+		
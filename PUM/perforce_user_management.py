@@ -12,7 +12,22 @@ Driver module for the script.
 import time
 import sys
 import argparse
-from perforce_ldap import PerforceLdap
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from perforce_ldap import PerforceLdap, LdapBindError, chunked
+from ldap_snapshot import snapshot_age, DEFAULT_MAX_AGE as SNAPSHOT_MAX_AGE
+from manager_cache import ManagerCache, DEFAULT_MAX_SIZE, DEFAULT_TTL
+from disabled_state import DisabledAccountState
+from removal_executor import RemovalExecutor, RemovalCheckpoint, REMOVAL_ATTEMPTS
+from removal_executor import DEFAULT_MAX_AGE as CHECKPOINT_MAX_AGE
+from notification_queue import NotificationQueue, SmtpSink, DirectorySink, SMTP_SERVER
+from report_writer import DepartedUserReport, FORMATS
+from pipeline import run_pipeline, DEFAULT_QUEUE_SIZE
+from perforce_user_stream import PerforceUserStream
+from access_filter import AccessFilter
+from run_trace import RunTrace
+from profiler import PROFILERS, profile_run, profile_thread, choose_profiler
 from perforce import Perforce
 from email_alerts import P4Email
 
@@ -20,6 +35,35 @@ from email_alerts import P4Email
 SERVER_LIST = ['serverA', 'serverB']
 
 
+class ServerLog(object):
+    """
+    Stand-in for sys.stdout that sends each worker thread's output to
+    its own per-server log file. Threads without a log of their own
+    write to the run log.
+    """
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def open(self, server):
+        """Starts a log file for server in the calling thread"""
+        log_file_name = 'PUM_Log_'+server+'_'+time.strftime("%d.%m.%Y")+'.txt'
+        self.local.stream = open(log_file_name, 'w')
+
+    def close(self):
+        """Closes the calling thread's log file"""
+        stream = getattr(self.local, 'stream', None)
+        if stream is not None:
+            stream.close()
+            del self.local.stream
+
+    def write(self, text):
+        return getattr(self.local, 'stream', self.default).write(text)
+
+    def flush(self):
+        getattr(self.local, 'stream', self.default).flush()
+
+
 def is_modify_mode(conf):
     """
     Determine the mode of the script.
@@ -53,7 +97,7 @@ def is_modify_mode(conf):
         print ("--mode m (modify)")
         exit(3)
 
-def create_csv(user_list, server):
+def create_csv(user_list, server, fmt='csv', compress=False):
     """
     Creates a CSV file of all the departed users along with
     details.
@@ -61,37 +105,72 @@ def create_csv(user_list, server):
 	The CSV created will be saved to the current directory
 	with the file name of "PerforceDepartedeparted_users[CurrentDate].csv"
 
+    Users are streamed to the report as they are produced, so user_list
+    can be a generator. JSON lines and Parquet reports can be written
+    instead, and CSV and JSON lines reports can be gzip compressed.
+    Later runs on the same day write new files with a -2, -3, ...
+    suffix rather than adding to the first run's report.
 
-    :param userList: (list): A list of departed perforce_users
+    :param userList: (iterable): The departed perforce_users
     :param server: Name of the current Perforce server
+    :param fmt: Report format, csv, jsonl or parquet
+    :param compress: gzip compress the report
 
     .. literalinclude:: ../perforce_user_management/perforce_user_management.py
             :linenos:
             :language: python
-            :lines: 75, 92-106
+            :pyobject: create_csv
     """
-    header = 'Name,Username,Email,Manager\'s email,LDAP Name'
+    base_name = 'PerforceDeparteDepartedUsers-'+server+time.strftime("%d.%m.%Y")
     try:
-        file_name = ('PerforceDeparteDepartedUsers-'+server+time.strftime("%d.%m.%Y")+'.csv')
-        save_file = open(file_name, 'a')
-        save_file.write(header + '\n')
+        report = DepartedUserReport(base_name, fmt, compress)
+    except (IOError, ValueError) as excep:
+        print ("Error creating csv")
+        print (excep)
+        report = None
 
+    # Only the report's own errors are caught. user_list is read to the
+    # end even without a report, since in a pipeline reading it is what
+    # removes the users, and errors raised while producing it propagate.
+    try:
         for user in user_list:
-            new_line = user.to_csv_string()
-            save_file.write(new_line + '\n')
-        save_file.close()
-        print (f'Saved to {file_name}')
+            if report is None:
+                continue
+            try:
+                report.write(user)
+            except (IOError, ValueError) as excep:
+                print ("Error writing csv")
+                print (excep)
+                close_report(report)
+                report = None
+    finally:
+        if report is not None and close_report(report):
+            print (report.stats())
+
+def close_report(report):
+    """
+    Closes a report, writing any error to the log
 
-    except IOError as excep:
-        print ("Error creating csv")
+    :param report: DepartedUserReport
+    :returns: True if the report was closed without an error
+    """
+    try:
+        report.close()
+        return True
+    except (IOError, ValueError) as excep:
+        print ("Error closing csv")
         print (excep)
+        return False
 
-def generate_departed_user_list(user_list, ldap_con):
+def generate_departed_user_list(user_list, ldap_con, known_accounts=None):
     """
     Creates and returns a list of departed perforce users
 
     :param user_list: All perforce users
     :param ldap_con: PerforceLdap instance
+    :param known_accounts: Deprovisioned accounts from an incremental
+        refresh. When given the users are matched against them in memory
+        instead of searching LDAP.
 
     :returns: List of all departed user in perforce
 
@@ -100,46 +179,63 @@ def generate_departed_user_list(user_list, ldap_con):
             :language: python
             :lines: 108, 122-130
     """
-    departed_users = []
-    for user in user_list:
-        user_info = ldap_con.search_ldap_for_user(user)
+    if known_accounts is not None:
+        return ldap_con.join_users(user_list, known_accounts)
 
-		#If the user is in the "de-provisoned group"
-        if user_info:
-            departed_users.append(user_info)
+    # Only users in the "de-provisoned group" come back
+    return ldap_con.search_ldap_for_users(user_list)
 
-    return departed_users
+def resolve_departed_users(user_list, ldap_con, known_accounts=None):
+    """
+    Pipeline stage yielding the departed users as each chunk of
+    user_list is resolved
 
-def run_removals(d_users, perf, server):
+    :param user_list: iterable of perforce users
+    :param ldap_con: PerforceLdap instance
+    :param known_accounts: Deprovisioned accounts from an incremental refresh
+    """
+    for chunk in chunked(user_list, ldap_con.filter_chunk_size):
+        yield from generate_departed_user_list(chunk, ldap_con, known_accounts)
+
+def run_removals(d_users, perf, server, workers=1, rate=0, checkpoint=None, notifier=None,
+                 attempts=REMOVAL_ATTEMPTS):
     """
     This method starts the process of removing users.
 
-    First it will email the users manager if the manager's
-    email is valid. Then it will call the
-    :func:`~perforce.Perforce.remove_perforce_user` method.
+    For every user it will call the
+    :func:`~perforce.Perforce.remove_perforce_user` method. Then it will
+    email the users manager if the manager's email is valid. Users are
+    removed by a :class:`~removal_executor.RemovalExecutor`.
 
     :param d_users: List of all departed users in Perforce
     :param perf: perforce instance
     :param server: the current perforce server
+    :param workers: number of removals running at the same time
+    :param rate: removals started per second on server, 0 for no limit
+    :param checkpoint: optional RemovalCheckpoint for resumable runs
+    :param notifier: optional NotificationQueue for manager digests
+    :param attempts: times a removal is tried before it has failed
+    :returns: dict of username -> (status, error)
 
     .. literalinclude:: ../perforce_user_management/perforce_user_management.py
             :linenos:
             :language: python
-            :lines: 132, 149-155
+            :pyobject: run_removals
     """
-
-    for user in d_users:
-        if '@' in user.manager_email:
-            user.email_users_manager(server)
-
-        #Removes user from Perforce
-        perf.remove_perforce_user(user)
+    executor = RemovalExecutor(server, perf, workers, rate, checkpoint, notifier, attempts)
+    return executor.run(d_users)
 
 def get_args():
     """
         Retrieves the command line argument (if there is one).
 
-        :returns: The script's running mode (r (read-only) or m (modify))
+        :returns: The script's running mode (r (read-only) or m (modify)),
+            the manager cache settings, the number of workers, the
+            ldap pool size, the incremental mode settings, the
+            removal settings, the notification settings, the
+            report settings, the pipeline settings, the user
+            streaming settings, the access filter settings, the
+            ldap snapshot settings and the trace and profiler settings
 
         .. literalinclude:: ../perforce_user_management/perforce_user_management.py
                 :linenos:
@@ -151,55 +247,535 @@ def get_args():
             metavar='FLAG',\
             help='read-only (r) or modify (m)',\
             default='r')
+    parser.add_argument('--manager-cache',\
+            metavar='FILE',\
+            help='persist the manager lookup cache to FILE between runs',\
+            default=None)
+    parser.add_argument('--manager-cache-size',\
+            metavar='N',\
+            type=int,\
+            help='maximum number of cached managers',\
+            default=DEFAULT_MAX_SIZE)
+    parser.add_argument('--manager-cache-ttl',\
+            metavar='SECONDS',\
+            type=int,\
+            help='seconds a cached manager stays valid',\
+            default=DEFAULT_TTL)
+    parser.add_argument('--workers',\
+            metavar='N',\
+            type=int,\
+            help='number of servers processed at the same time',\
+            default=1)
+    parser.add_argument('--ldap-pool',\
+            metavar='N',\
+            type=int,\
+            help='number of pooled ldap connections searching concurrently',\
+            default=0)
+    parser.add_argument('--incremental',\
+            metavar='STATE_FILE',\
+            help='only read accounts deprovisioned since the run that wrote STATE_FILE',\
+            default=None)
+    parser.add_argument('--full-rescan',\
+            action='store_true',\
+            help='with --incremental, read the whole deprovisioned group again')
+    parser.add_argument('--removal-workers',\
+            metavar='N',\
+            type=int,\
+            help='number of users removed at the same time on each server',\
+            default=1)
+    parser.add_argument('--removal-rate',\
+            metavar='PER_SECOND',\
+            type=float,\
+            help='most removals started per second on each server (0 for no limit)',\
+            default=0)
+    parser.add_argument('--removal-attempts',\
+            metavar='N',\
+            type=int,\
+            help='times a removal is tried before the user is reported as failed',\
+            default=REMOVAL_ATTEMPTS)
+    parser.add_argument('--checkpoint',\
+            metavar='FILE',\
+            help='record modify-mode progress in FILE and resume from it',\
+            default=None)
+    parser.add_argument('--checkpoint-max-age',\
+            metavar='HOURS',\
+            type=float,\
+            help='ignore a --checkpoint left more than HOURS ago, by an earlier run',\
+            default=CHECKPOINT_MAX_AGE / 3600)
+    parser.add_argument('--notify-digest',\
+            action='store_true',\
+            help='send each manager one digest email in the background')
+    parser.add_argument('--smtp-server',\
+            metavar='HOST[:PORT]',\
+            help='mail server used for the manager digests',\
+            default=SMTP_SERVER)
+    parser.add_argument('--smtp-connections',\
+            metavar='N',\
+            type=int,\
+            help='number of SMTP connections sending digests',\
+            default=1)
+    parser.add_argument('--mail-sink',\
+            metavar='DIR',\
+            help='write the manager digests to DIR instead of sending them',\
+            default=None)
+    parser.add_argument('--report-format',\
+            choices=FORMATS,\
+            help='format of the departed user report',\
+            default='csv')
+    parser.add_argument('--compress-report',\
+            action='store_true',\
+            help='gzip compress a csv or jsonl report')
+    parser.add_argument('--pipeline',\
+            action='store_true',\
+            help='stream users through lookup, removal and reporting')
+    parser.add_argument('--pipeline-queue-size',\
+            metavar='N',\
+            type=int,\
+            help='most users waiting between two pipeline stages',\
+            default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument('--stream-users',\
+            action='store_true',\
+            help='stream the user, name, access and email fields from p4 users')
+    parser.add_argument('--max-users',\
+            metavar='N',\
+            type=int,\
+            help='with --stream-users, stop each p4 users command after N users (p4 users -m). '\
+                 'This is a limit, not paging: the users after the first N are not checked',\
+            default=0)
+    parser.add_argument('--user-pattern',\
+            metavar='PATTERN',\
+            action='append',\
+            help='with --stream-users, read the users matching PATTERN as one page, may be repeated',\
+            default=None)
+    parser.add_argument('--active-days',\
+            metavar='N',\
+            type=int,\
+            help='skip the ldap lookup for users who accessed perforce in the last N days',\
+            default=0)
+    parser.add_argument('--rank-by-staleness',\
+            action='store_true',\
+            help='with --active-days, look up the least recently active users first')
+    parser.add_argument('--ldap-snapshot',\
+            metavar='FILE',\
+            help='search the ldap snapshot in FILE instead of the ldap server',\
+            default=None)
+    parser.add_argument('--ldap-snapshot-max-age',\
+            metavar='HOURS',\
+            type=float,\
+            help='in modify mode, refuse an --ldap-snapshot taken more than HOURS ago',\
+            default=SNAPSHOT_MAX_AGE / 3600)
+    parser.add_argument('--save-ldap-snapshot',\
+            metavar='FILE',\
+            help='save the deprovisioned users and their managers to FILE and exit',\
+            default=None)
+    parser.add_argument('--trace',\
+            metavar='FILE',\
+            help='append the timings of every stage to FILE as JSON lines',\
+            default='PUM_Trace_'+time.strftime("%d.%m.%Y")+'.jsonl')
+    parser.add_argument('--profile',\
+            choices=PROFILERS,\
+            help='profile the run with cProfile (.prof) or the sampling profiler (folded stacks)',\
+            default=None)
+    parser.add_argument('--profile-output',\
+            metavar='PATH',\
+            help='profile file name without the extension',\
+            default='PUM_Profile_'+time.strftime("%d.%m.%Y"))
 
     conf = parser.parse_args()
     return conf
 
-def main():
+def get_perforce_users(perf, server, conf):
     """
-    The main function of the script.
+    The server's users, streamed with only the fields the departed user
+    check reads when conf.stream_users is set, otherwise the whole user
+    table from perf.
+
+    :param perf: logged in Perforce instance for server
+    :param server: the perforce server to process
+    :param conf: The command line arguments
+    :returns: iterable of user dicts
+    """
+    if conf.stream_users:
+        return PerforceUserStream(server, max_users=conf.max_users,
+                                  patterns=conf.user_pattern)
+    return perf.get_perforce_users()
 
-    Makes all the calls to connect to perforce and the ldap server.
-    Creates the list of departed perforce_users.
+def filter_by_access(perforce_users, access_filter, conf):
+    """
+    Drops the users active within conf.active_days, ranking the rest by
+    staleness if conf.rank_by_staleness is set.
+
+    :param perforce_users: iterable of perforce users
+    :param access_filter: AccessFilter for the server
+    :param conf: The command line arguments
+    :returns: iterable of the users who may have left
+    """
+    if conf.rank_by_staleness:
+        return access_filter.rank(perforce_users)
+    return access_filter.filter(perforce_users)
+
+def refresh_known_accounts(ldap_factory, conf):
+    """
+    Brings the incremental state file up to date with the accounts
+    deprovisioned since the last run.
+
+    :param ldap_factory: callable returning a new PerforceLdap
+    :param conf: The command line arguments
+    :returns: Deprovisioned accounts keyed by lower cased AccountName
 
     .. literalinclude:: ../perforce_user_management/perforce_user_management.py
             :linenos:
             :language: python
-            :lines: 177, 190-216
+            :pyobject: refresh_known_accounts
     """
-  
-    log_file_name = 'PUM_Log_'+time.strftime("%d.%m.%Y")+'.txt'
-    sys.stdout = open(log_file_name,'w') # Saves console output to a file
-    
-    perforce_users = []    # List of all perforce users
-    departed_users = []     # List of all departed perforce users
+    state = DisabledAccountState(conf.incremental)
+    state.load()
 
-    print (time.strftime("%d/%m/%Y") +' '+ time.strftime("%H:%M:%S"))  # For log purposes
+    p4_ldap = ldap_factory()
+    p4_ldap.bind_to_ldap()
+    try:
+        with conf.trace.span('refresh known accounts', ldap_con=p4_ldap) as span:
+            full = p4_ldap.refresh_disabled_accounts(state, conf.full_rescan)
+            span['full'] = full
+    finally:
+        p4_ldap.unbind_from_ldap()
+
+    state.save()
+    print (f"{'Full' if full else 'Incremental'} refresh: "
+           f"{len(state.accounts)} deprovisioned accounts, USN {state.high_water_usn}")
+    return state.accounts
+
+def run_server_pipeline(server, conf, perf, p4_ldap, known_accounts=None):
+    """
+    Streams the server's users through LDAP resolution, removal and the
+    report as connected pipeline stages, so the first departed user is
+    handled while later users are still being resolved and memory stays
+    bounded by the pipeline's queues.
+
+    :param server: the perforce server to process
+    :param conf: The command line arguments
+    :param perf: logged in Perforce instance for server
+    :param p4_ldap: bound PerforceLdap instance
+    :param known_accounts: Deprovisioned accounts from an incremental refresh
+    :returns: List of the departed users, for the admin email
+
+    .. literalinclude:: ../perforce_user_management/perforce_user_management.py
+            :linenos:
+            :language: python
+            :pyobject: run_server_pipeline
+    """
+    stages = [functools.partial(resolve_departed_users, ldap_con=p4_ldap,
+                                known_accounts=known_accounts)]
+
+    access_filter = None
+    if conf.active_days:
+        access_filter = AccessFilter(conf.active_days)
+        stages.insert(0, lambda users: filter_by_access(users, access_filter, conf))
+
+    executor = None
+    if conf.modify:
+        executor = RemovalExecutor(server, perf, conf.removal_workers, conf.removal_rate,
+                                   conf.removal_checkpoint, conf.notifier,
+                                   conf.removal_attempts)
+        stages.append(lambda d_users: (user for user, _, _ in executor.run_stream(d_users)))
+
+    departed_users = []     # Only the departed users are kept, for the admin email
+
+    def collect(d_users):
+        for user in d_users:
+            departed_users.append(user)
+            yield user
+
+    perforce_users = get_perforce_users(perf, server, conf)
+    create_csv(collect(run_pipeline(perforce_users, stages, conf.pipeline_queue_size)),
+               server, conf.report_format, conf.compress_report)
+    if isinstance(perforce_users, PerforceUserStream):
+        print (perforce_users.stats())
+    if access_filter is not None:
+        print (access_filter.stats())
+
+    if executor is not None:
+        executor.summary()
+    return departed_users
+
+def process_server(server, conf, p4_ldap, known_accounts=None):
+    """
+    Runs the departed user check, removals, CSV and admin email
+    for a single Perforce server. With a checkpoint the server is
+    marked finished once every removal has been tried, whether or not
+    it succeeded, so the next run looks for departed users again.
 
-    p4_ldap = PerforceLdap()
+    :param server: the perforce server to process
+    :param conf: The command line arguments
+    :param p4_ldap: bound PerforceLdap instance
+    :param known_accounts: Deprovisioned accounts from an incremental refresh
+
+    .. literalinclude:: ../perforce_user_management/perforce_user_management.py
+            :linenos:
+            :language: python
+            :pyobject: process_server
+    """
+    checkpoint = conf.removal_checkpoint
+    if checkpoint is not None and checkpoint.is_complete(server):
+        print (f'{server}: finished by the previous run')
+        return
+
+    trace = conf.trace
     perf = Perforce()
     p4_email = P4Email()
 
-    p4_ldap.bind_to_ldap()
-    for server in SERVER_LIST:
-
+    with trace.span('perforce login', server):
         perf.perforce_login(server)
-        perforce_users = perf.get_perforce_users()
-
-        departed_users = generate_departed_user_list(perforce_users, p4_ldap)
 
-        if is_modify_mode(get_args()):
-            run_removals(departed_users, perf, server)
+    departed_users = None
+    if checkpoint is not None:
+        departed_users = checkpoint.departed_users(server)
 
-        create_csv(departed_users, server)
+    if departed_users is None and conf.pipeline:
+        # The stages overlap, so the pipeline is timed as a whole
+        with trace.span('pipeline', server, p4_ldap) as span:
+            departed_users = run_server_pipeline(server, conf, perf, p4_ldap, known_accounts)
+            span['departed'] = len(departed_users)
+    else:
+        if departed_users is None:
+            # A streamed user list is read while the departed users are found
+            with trace.span('get perforce users', server) as span:
+                perforce_users = get_perforce_users(perf, server, conf)
+                if isinstance(perforce_users, list):
+                    span['users'] = len(perforce_users)
+            candidates = perforce_users
+            if conf.active_days:
+                access_filter = AccessFilter(conf.active_days)
+                candidates = filter_by_access(perforce_users, access_filter, conf)
+            with trace.span('departed users', server, p4_ldap) as span:
+                departed_users = generate_departed_user_list(candidates, p4_ldap, known_accounts)
+                span['departed'] = len(departed_users)
+            if isinstance(perforce_users, PerforceUserStream):
+                print (perforce_users.stats())
+            if conf.active_days:
+                print (access_filter.stats())
+            if checkpoint is not None:
+                checkpoint.record_departed(server, departed_users)
+
+        if conf.modify:
+            with trace.span('removals', server, users=len(departed_users)):
+                run_removals(departed_users, perf, server, conf.removal_workers,
+                             conf.removal_rate, checkpoint, conf.notifier,
+                             conf.removal_attempts)
+
+        with trace.span('report', server):
+            create_csv(departed_users, server, conf.report_format, conf.compress_report)
+    with trace.span('admin email', server):
         p4_email.email_admins(perf.get_perforce_server_name(), departed_users)
-        perf.disconnect_from_perforce()
+    perf.disconnect_from_perforce()
+    print (p4_ldap.manager_cache.stats())
+
+    failed = [user.username for user in departed_users
+              if getattr(user, 'removal_status', None) == 'failed']
+    if failed:
+        print (f'{server}: {len(failed)} removals failed after {conf.removal_attempts} '
+               f'attempts: {", ".join(failed)}')
+    # Queued before the server is finished, so a resumed run that skips
+    # these users as already removed never leaves their managers untold
+    if conf.notifier is not None:
+        conf.notifier.flush()
+    if checkpoint is not None:
+        checkpoint.record_complete(server)
+
+def process_server_traced(server, conf, p4_ldap, known_accounts=None):
+    """
+    process_server recorded as one span of the run trace, with the ldap
+    searches it made
 
+    :param server: the perforce server to process
+    :param conf: The command line arguments
+    :param p4_ldap: bound PerforceLdap instance
+    :param known_accounts: Deprovisioned accounts from an incremental refresh
+    """
+    with conf.trace.span('server', server, p4_ldap):
+        process_server(server, conf, p4_ldap, known_accounts)
 
-        departed_users.clear()   # Clears lists before running on next server
-        perforce_users.clear()
+def process_server_worker(server, conf, ldap_factory, server_log, known_accounts=None):
+    """
+    Processes a server from a worker thread with its own ldap binding
+    and its own log file.
+
+    :param server: the perforce server to process
+    :param conf: The command line arguments
+    :param ldap_factory: callable returning a new PerforceLdap
+    :param server_log: ServerLog installed as sys.stdout
+    :param known_accounts: Deprovisioned accounts from an incremental refresh
+    """
+    server_log.open(server)
+    try:
+        print (time.strftime("%d/%m/%Y") +' '+ time.strftime("%H:%M:%S"))  # For log purposes
+        p4_ldap = ldap_factory()
+        p4_ldap.bind_to_ldap()
+        try:
+            if conf.profile == 'cprofile':
+                # cProfile only sees the thread that started it
+                with profile_thread(f'{conf.profile_output}.{server}.prof'):
+                    process_server_traced(server, conf, p4_ldap, known_accounts)
+            else:
+                process_server_traced(server, conf, p4_ldap, known_accounts)
+        finally:
+            p4_ldap.unbind_from_ldap()
+    finally:
+        server_log.close()
+
+def run_servers_concurrently(servers, conf, ldap_factory, known_accounts=None):
+    """
+    Processes the servers in a pool of conf.workers threads so a run
+    takes about as long as the slowest server. Each server logs to its
+    own file.
+
+    :param servers: the perforce servers to process
+    :param conf: The command line arguments
+    :param ldap_factory: callable returning a new PerforceLdap
+    :param known_accounts: Deprovisioned accounts from an incremental refresh
+    """
+    server_log = ServerLog(sys.stdout)
+    sys.stdout = server_log
+
+    try:
+        with ThreadPoolExecutor(max_workers=conf.workers) as executor:
+            futures = {executor.submit(process_server_worker, server, conf,
+                                       ldap_factory, server_log, known_accounts): server
+                       for server in servers}
+            for future, server in futures.items():
+                try:
+                    future.result()
+                    print (f'{server}: finished')
+                except Exception as excep:
+                    print (f'{server}: failed')
+                    print (excep)
+    finally:
+        sys.stdout = server_log.default
+
+def check_snapshot_age(conf):
+    """
+    Stops a modify-mode run that would remove users based on an ldap
+    snapshot older than conf.ldap_snapshot_max_age hours, or one whose
+    age can't be told. Read-only runs may use a snapshot of any age.
+
+    :param conf: The command line arguments
+    """
+    if not conf.modify or not conf.ldap_snapshot:
+        return
+
+    age = snapshot_age(conf.ldap_snapshot)
+    if age is None:
+        print (f"Error: can't tell when the ldap snapshot {conf.ldap_snapshot} was taken, "
+               "refusing to remove users with it")
+        sys.exit(3)
+    if age > conf.ldap_snapshot_max_age * 3600:
+        print (f"Error: the ldap snapshot {conf.ldap_snapshot} is {age / 3600:.1f} hours old, "
+               f"more than --ldap-snapshot-max-age {conf.ldap_snapshot_max_age:g}, "
+               "refusing to remove users with it")
+        sys.exit(3)
+
+def run(conf):
+    """
+    Processes every server with the settings in conf.
+
+    :param conf: The command line arguments
 
-    p4_ldap.unbind_from_ldap()
+    .. literalinclude:: ../perforce_user_management/perforce_user_management.py
+            :linenos:
+            :language: python
+            :pyobject: run
+    """
+    check_snapshot_age(conf)
+
+    # Only modify-mode runs have progress worth resuming
+    conf.removal_checkpoint = None
+    if conf.modify and conf.checkpoint:
+        conf.removal_checkpoint = RemovalCheckpoint(conf.checkpoint,
+                                                    conf.checkpoint_max_age * 3600)
+        conf.removal_checkpoint.load()
+
+    conf.notifier = None
+    if conf.mail_sink:
+        conf.notifier = NotificationQueue(lambda: DirectorySink(conf.mail_sink))
+    elif conf.notify_digest:
+        conf.notifier = NotificationQueue(lambda: SmtpSink(conf.smtp_server),
+                                          conf.smtp_connections)
+
+    # Shared by every server so each manager is only looked up once per run
+    manager_cache = ManagerCache(conf.manager_cache_size, conf.manager_cache_ttl,
+                                 conf.manager_cache)
+    manager_cache.load()
+    ldap_factory = functools.partial(PerforceLdap, manager_cache, conf.ldap_pool,
+                                     conf.ldap_snapshot)
+
+    # The digests of users already removed are sent even if a server fails
+    try:
+        if conf.save_ldap_snapshot:
+            p4_ldap = PerforceLdap(manager_cache, conf.ldap_pool)
+            p4_ldap.bind_to_ldap()
+            try:
+                p4_ldap.save_snapshot(conf.save_ldap_snapshot)
+            finally:
+                p4_ldap.unbind_from_ldap()
+            return
+
+        known_accounts = None
+        if conf.incremental:
+            known_accounts = refresh_known_accounts(ldap_factory, conf)
+
+        if conf.workers > 1:
+            run_servers_concurrently(SERVER_LIST, conf, ldap_factory, known_accounts)
+        else:
+            p4_ldap = ldap_factory()
+            p4_ldap.bind_to_ldap()
+            for server in SERVER_LIST:
+                process_server_traced(server, conf, p4_ldap, known_accounts)
+            p4_ldap.unbind_from_ldap()
+
+        print (manager_cache.stats())
+        manager_cache.save()
+    finally:
+        if conf.notifier is not None:
+            with conf.trace.span('manager emails'):
+                conf.notifier.close()
+
+    checkpoint = conf.removal_checkpoint
+    if checkpoint is not None and all(checkpoint.is_complete(server) for server in SERVER_LIST):
+        checkpoint.clear()
+
+def main():
+    """
+    The main function of the script.
+
+    Makes all the calls to connect to perforce and the ldap server.
+    Creates the list of departed perforce_users.
+
+    .. literalinclude:: ../perforce_user_management/perforce_user_management.py
+            :linenos:
+            :language: python
+            :pyobject: main
+    """
+  
+    log_file_name = 'PUM_Log_'+time.strftime("%d.%m.%Y")+'.txt'
+    sys.stdout = open(log_file_name,'w') # Saves console output to a file
+
+    print (time.strftime("%d/%m/%Y") +' '+ time.strftime("%H:%M:%S"))  # For log purposes
+
+    conf = get_args()
+    conf.modify = is_modify_mode(conf)
+    conf.profile = choose_profiler(conf.profile, conf.workers)
+
+    conf.trace = RunTrace(conf.trace)
+    conf.trace.event('start', mode=conf.mode, servers=SERVER_LIST, workers=conf.workers,
+                     pipeline=conf.pipeline, ldap_pool=conf.ldap_pool, profile=conf.profile)
+    try:
+        with profile_run(conf.profile, conf.profile_output, conf.workers), conf.trace.span('run'):
+            run(conf)
+    except LdapBindError as excep:
+        print (f'Error: {excep}')
+        sys.exit(3)
+    finally:
+        conf.trace.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# File name: perforce_user_stream.py
+# Description: Streams the Perforce user table one user at a time
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for streaming perforce users"""
+
+import subprocess
+
+# The only fields the departed user check reads
+USER_FIELDS = ['User', 'FullName', 'Access', 'Email']
+
+P4_COMMAND = 'p4'
+
+# Separates the fields of a user on each output line
+FIELD_SEPARATOR = '\x1f'
+
+
+class PerforceStreamError(Exception):
+    """Raised when p4 users fails"""
+
+
+class PerforceUserStream(object):
+    """
+    Iterates over a server's users as ``p4 users`` prints them.
+
+    ``p4 -ztag -F`` prints only the projected fields, one user per line,
+    and each line is turned into a dict as it is read, so the whole user
+    table is never held in memory and a consumer such as the ldap stage
+    starts on the first user straight away. Service accounts are left
+    out by the server (``p4 users`` without ``-a``).
+
+    The users can be read in pages of user name patterns, e.g.
+    ``['a*', 'b*', ...]``, each run as its own ``p4 users`` command.
+
+    max_users is a limit, not paging: ``p4 users -m N`` prints the first
+    N users of a page and drops the rest. A page that comes back with N
+    users may have been cut short, so it is counted in truncated and a
+    warning is written to the log.
+
+    p4 uses the ticket left by Perforce.perforce_login, with P4USER and
+    P4TICKETS taken from the environment.
+
+    Methods:
+        command: The p4 command line for a page.
+
+        stats: Summary of the users read for the log.
+    """
+    def __init__(self, server, fields=USER_FIELDS, max_users=0, patterns=None,
+                 p4=P4_COMMAND):
+        """
+        :param server: P4PORT of the server
+        :param fields: the user fields to keep
+        :param max_users: most users read per page, 0 for all (p4 users -m).
+            Users past the limit are never read.
+        :param patterns: user name patterns read one page at a time, None for every user
+        :param p4: path of the p4 command
+        """
+        self.server = server
+        self.fields = list(fields)
+        self.max_users = max_users
+        self.patterns = patterns or [None]
+        self.p4 = p4
+        self.users = 0
+        self.pages = 0
+        self.truncated = 0
+
+    def command(self, pattern=None):
+        """
+        The p4 command printing the projected fields of every user
+        matching pattern
+
+        :param pattern: user name pattern, None for every user
+        """
+        output_format = FIELD_SEPARATOR.join('%' + field + '%' for field in self.fields)
+        command = [self.p4, '-p', self.server, '-ztag', '-F', output_format, 'users']
+        if self.max_users:
+            command += ['-m', str(self.max_users)]
+        if pattern is not None:
+            command.append(pattern)
+        return command
+
+    def __iter__(self):
+        for pattern in self.patterns:
+            yield from self._read_page(pattern)
+
+    def _read_page(self, pattern):
+        """Yields the users of one page as p4 prints them"""
+        process = subprocess.Popen(self.command(pattern), stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, text=True, errors='replace')
+        finished = False
+        page_users = 0
+        try:
+            for line in process.stdout:
+                values = line.rstrip('\n').split(FIELD_SEPARATOR)
+                if len(values) != len(self.fields):
+                    continue
+                self.users += 1
+                page_users += 1
+                yield dict(zip(self.fields, values))
+            finished = True
+        finally:
+            if not finished:
+                # The consumer stopped early, p4 doesn't need to finish
+                process.kill()
+            process.stdout.close()
+            error = process.stderr.read()
+            process.stderr.close()
+            process.wait()
+
+        self.pages += 1
+        # "no such user(s)" just means the page is empty
+        if process.returncode != 0 and 'no such user' not in error:
+            raise PerforceStreamError(f'p4 users failed on {self.server}: {error.strip()}')
+
+        if self.max_users and page_users >= self.max_users:
+            self.truncated += 1
+            print (f'Warning: p4 users -m {self.max_users} on {self.server} returned '
+                   f'{page_users} users for {pattern or "all users"}, '
+                   f'the users after them were not read')
+
+    def stats(self):
+        """Returns a one line summary of the users read for the log"""
+        summary = f'Streamed {self.users} users from {self.server} in {self.pages} pages'
+        if self.truncated:
+            summary += f', {self.truncated} cut short by --max-users'
+        return summary
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# File name: pipeline.py
+# Description: Runs generator stages in threads connected by bounded queues
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for streaming the application's stages"""
+
+import queue
+import threading
+
+DEFAULT_QUEUE_SIZE = 500
+
+# How often a blocked stage checks whether the pipeline was stopped
+POLL_INTERVAL = 0.1  # seconds
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Unwinds a stage when the pipeline is stopped"""
+
+
+def _drain(in_queue, stop, errors):
+    """Yields the items a stage puts on in_queue until it is done"""
+    while True:
+        try:
+            item = in_queue.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            if stop.is_set():
+                if errors:
+                    raise errors[0]
+                raise _Stopped()
+            continue
+
+        if item is _DONE:
+            return
+        yield item
+
+
+def _put(out_queue, item, stop):
+    """Puts item on out_queue, waiting while it is full (backpressure)"""
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            out_queue.put(item, timeout=POLL_INTERVAL)
+            return
+        except queue.Full:
+            continue
+
+
+def _run_stage(stage, items, out_queue, stop, errors):
+    """Thread body feeding everything stage yields to out_queue"""
+    try:
+        for item in stage(items):
+            _put(out_queue, item, stop)
+        _put(out_queue, _DONE, stop)
+    except _Stopped:
+        pass
+    except Exception as excep:
+        errors.append(excep)
+        stop.set()
+
+
+def run_pipeline(source, stages, maxsize=DEFAULT_QUEUE_SIZE):
+    """
+    Connects stages into a pipeline and yields what the last one produces.
+
+    Each stage is a callable that takes an iterable and returns an
+    iterable (usually a generator). Every stage runs in its own thread and
+    hands items to the next one through a queue of at most maxsize items,
+    so a slow stage holds back the stages before it instead of letting
+    items pile up in memory. The first stage reads source.
+
+    If a stage raises, the pipeline stops and the exception is raised by
+    the iteration of run_pipeline.
+
+    :param source: iterable fed to the first stage
+    :param stages: list of stage callables
+    :param maxsize: most items waiting between two stages
+    """
+    stop = threading.Event()
+    errors = []
+    threads = []
+    items = source
+
+    for stage in stages:
+        out_queue = queue.Queue(maxsize)
+        threads.append(threading.Thread(target=_run_stage,
+                                        args=(stage, items, out_queue, stop, errors),
+                                        daemon=True))
+        items = _drain(out_queue, stop, errors)
+
+    for thread in threads:
+        thread.start()
+    try:
+        yield from items
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
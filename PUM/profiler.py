@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# File name: profiler.py
+# Description: Opt-in profilers writing a profile of the run for flame graphs
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for profiling a run"""
+
+import sys
+import time
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILERS = ['cprofile', 'sample']
+
+# Seconds between the sampling profiler's looks at the stacks
+SAMPLE_INTERVAL = 0.005
+
+# From Python 3.12 cProfile uses sys.monitoring, which allows one
+# profiler per process, so each worker thread can't have its own
+PER_THREAD_CPROFILE = sys.version_info < (3, 12)
+
+
+class SamplingProfiler(object):
+    """
+    Looks at the stack of every thread each ``interval`` seconds from a
+    background thread and counts how often each stack was seen. The
+    counts are written as folded stacks (``thread;outer;...;inner count``),
+    which flamegraph.pl and speedscope read directly.
+
+    Sampling costs about the same however busy the run is, and covers the
+    server worker threads that cProfile does not see.
+
+    Methods:
+        start: Starts sampling.
+
+        stop: Stops sampling.
+
+        write: Writes the folded stacks.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        """
+        :param interval: seconds between samples
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Starts sampling in a background thread"""
+        self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        """Stops sampling"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def write(self, path):
+        """
+        Writes the folded stacks, most seen first
+
+        :param path: the output file
+        """
+        with open(path, 'w') as folded:
+            for stack, count in self.stacks.most_common():
+                folded.write(f'{stack} {count}\n')
+
+
+def choose_profiler(kind, workers=1):
+    """
+    The profiler to use for a run. cProfile with several server workers
+    needs a profile per worker thread, so it becomes the sampling
+    profiler where that isn't possible.
+
+    :param kind: one of PROFILERS, or None
+    :param workers: number of server worker threads
+    """
+    if kind == 'cprofile' and workers > 1 and not PER_THREAD_CPROFILE:
+        print ('cProfile can only profile one thread at a time on this Python, '
+               'using the sampling profiler for the workers')
+        return 'sample'
+    return kind
+
+
+@contextmanager
+def profile_thread(path):
+    """
+    Profiles the calling thread with cProfile, writing the stats to
+    path for snakeviz or flameprof. If another profiler is already
+    active the block runs without a profile.
+
+    :param path: the .prof file
+    """
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as excep:
+        print (f'Not profiling to {path}: {excep}')
+        yield None
+        return
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+
+
+@contextmanager
+def profile_run(kind, output, workers=1):
+    """
+    Profiles the block with the chosen profiler, or does nothing when
+    kind is None.
+
+    cProfile only sees the thread that enabled it, so without workers
+    the main thread's profile goes to <output>.prof. With workers each
+    one profiles its own thread with profile_thread instead, and the
+    main thread, which only waits for them, isn't profiled so it never
+    holds the profiler a worker needs. The sampling profiler sees every
+    thread and writes <output>.folded.
+
+    :param kind: one of PROFILERS, or None
+    :param output: output path without the extension
+    :param workers: number of server worker threads
+    """
+    if kind is None or (kind == 'cprofile' and workers > 1):
+        yield
+        return
+
+    started = time.monotonic()
+    if kind == 'cprofile':
+        path = output + '.prof'
+        with profile_thread(path):
+            yield
+    else:
+        path = output + '.folded'
+        sampler = SamplingProfiler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.write(path)
+    print (f'Profiled the run for {time.monotonic() - started:.0f}s, wrote {path}')
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# File name: removal_executor.py
+# Description: Removes departed users from Perforce concurrently and
+#   records progress so an interrupted run can be resumed
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for running user removals"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from perforce import Perforce
+from perforce_user import PerforceUser
+
+# PerforceUser attributes saved to the checkpoint file
+USER_FIELDS = ['name', 'username', 'last_access', 'email', 'ldap_name',
+               'manager_email', 'manager']
+
+# Times a removal is tried before the user is reported as failed
+REMOVAL_ATTEMPTS = 3
+RETRY_DELAY = 5     # seconds, times the attempt number
+
+# A checkpoint older than this was left by an earlier run, not by an
+# interrupted rerun of this one, and is ignored
+DEFAULT_MAX_AGE = 24 * 60 * 60  # seconds
+
+
+class RateLimiter(object):
+    """Spaces calls out so no more than rate of them start per second"""
+    def __init__(self, rate):
+        """
+        :param rate: calls per second, 0 for no limit
+        """
+        self.interval = 1.0 / rate if rate else 0
+        self.next_start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the next call is allowed to start"""
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class RemovalCheckpoint(object):
+    """
+    Append-only record of a modify-mode run.
+
+    For each server it holds the departed user list, every user removed
+    and whether the server finished, so a resumed run skips finished
+    servers, reuses the departed list instead of redoing the lookups and
+    only removes the users that are left. Failed removals are not
+    recorded, so a resumed run tries them again.
+
+    The file starts with the time the run started. A checkpoint older
+    than max_age is from an earlier run rather than an interrupted one,
+    so it is ignored and that run's departed lists are looked up again.
+
+    Methods:
+        load: Reads an existing checkpoint file, unless it is too old.
+
+        record_departed / departed_users: Saves and restores a server's
+        departed user list.
+
+        record_removal / is_removed: Saves and checks a user's removal.
+
+        record_complete / is_complete: Saves and checks a finished server.
+
+        clear: Deletes the checkpoint file after a finished run.
+    """
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        """
+        :param path: the checkpoint file
+        :param max_age: Seconds after which a checkpoint is ignored
+        """
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.started = None
+        self.departed = {}      # server -> list of saved users
+        self.removed = {}       # server -> set of removed usernames
+        self.complete = set()
+
+    def load(self):
+        """
+        Reads the checkpoint file left by an interrupted run, if any. A
+        file older than max_age, or without a start time, is deleted
+        instead.
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path) as checkpoint_file:
+            for line in checkpoint_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # partial line from the interruption
+
+                if entry['type'] == 'start':
+                    self.started = entry['time']
+                    continue
+
+                server = entry['server']
+                if entry['type'] == 'departed':
+                    self.departed[server] = entry['users']
+                elif entry['type'] == 'removal' and entry['status'] == 'removed':
+                    self.removed.setdefault(server, set()).add(entry['user'])
+                elif entry['type'] == 'complete':
+                    self.complete.add(server)
+
+        if self.started is None or time.time() - self.started > self.max_age:
+            print (f'Ignoring {self.path}, it was left by an earlier run')
+            self.started = None
+            self.departed = {}
+            self.removed = {}
+            self.complete = set()
+            self.clear()
+            return
+
+        print (f'Resuming from {self.path}: {len(self.complete)} servers complete')
+
+    def _append(self, entry):
+        """
+        Writes an entry to the checkpoint file straight away, starting a
+        new file with the time of the run
+        """
+        with self.lock:
+            lines = [entry]
+            if self.started is None:
+                self.started = time.time()
+                lines.insert(0, {'type': 'start', 'time': self.started})
+            with open(self.path, 'a') as checkpoint_file:
+                checkpoint_file.writelines(json.dumps(line) + '\n' for line in lines)
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+
+    def record_departed(self, server, d_users):
+        """Saves the departed user list found for server"""
+        users = [{field: getattr(user, field) for field in USER_FIELDS
+                  if hasattr(user, field)} for user in d_users]
+        self.departed[server] = users
+        self._append({'type': 'departed', 'server': server, 'users': users})
+
+    def departed_users(self, server):
+        """
+        Returns the departed users saved for server as PerforceUser
+        objects, or None if none were saved
+        """
+        if server not in self.departed:
+            return None
+
+        d_users = []
+        for saved in self.departed[server]:
+            user = PerforceUser()
+            for field, value in saved.items():
+                setattr(user, field, value)
+            d_users.append(user)
+        return d_users
+
+    def record_removal(self, server, username):
+        """Saves that username was removed from server"""
+        with self.lock:
+            self.removed.setdefault(server, set()).add(username)
+        self._append({'type': 'removal', 'server': server, 'user': username,
+                      'status': 'removed'})
+
+    def is_removed(self, server, username):
+        """Whether username was already removed from server"""
+        with self.lock:
+            return username in self.removed.get(server, ())
+
+    def record_complete(self, server):
+        """Marks server as finished, once every removal has been tried"""
+        self.complete.add(server)
+        self._append({'type': 'complete', 'server': server})
+
+    def is_complete(self, server):
+        """Whether server was finished by the interrupted run"""
+        return server in self.complete
+
+    def clear(self):
+        """Deletes the checkpoint file once the whole run has finished"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.started = None
+
+
+class RemovalExecutor(object):
+    """
+    Removes departed users (along with their clients) from one Perforce
+    server with bounded concurrency and emails their managers.
+
+    Every worker thread other than the caller's gets its own Perforce
+    connection, removals are started no faster than the server's rate
+    limit, a failing removal is tried attempts times and the outcome of
+    each user is recorded.
+
+    Methods:
+        run: Removes a list of departed users.
+
+        run_stream: Removes departed users as they are produced.
+
+        summary: Writes the removal counts to the log.
+    """
+    def __init__(self, server, perf, workers=1, rate=0, checkpoint=None, notifier=None,
+                 attempts=REMOVAL_ATTEMPTS, retry_delay=RETRY_DELAY):
+        """
+        :param server: the perforce server
+        :param perf: logged in Perforce instance for server
+        :param workers: number of removals running at the same time
+        :param rate: removals started per second, 0 for no limit
+        :param checkpoint: optional RemovalCheckpoint
+        :param notifier: optional NotificationQueue collecting manager
+            digests. Without one each manager is emailed per user.
+        :param attempts: times a removal is tried before it has failed
+        :param retry_delay: seconds, times the attempt number, between tries
+        """
+        self.server = server
+        self.perf = perf
+        self.workers = max(1, workers)
+        self.attempts = max(1, attempts)
+        self.retry_delay = retry_delay
+        self.limiter = RateLimiter(rate)
+        self.checkpoint = checkpoint
+        self.notifier = notifier
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.owner = None
+        self.removed = 0
+        self.failed = []
+        self.skipped = 0
+
+    def _connection(self):
+        """Returns the calling thread's Perforce connection"""
+        if threading.get_ident() == self.owner:
+            return self.perf
+
+        perf = getattr(self.local, 'perf', None)
+        if perf is None:
+            perf = Perforce()
+            perf.perforce_login(self.server)
+            self.local.perf = perf
+            with self.lock:
+                self.connections.append(perf)
+        return perf
+
+    def _remove(self, user):
+        """
+        Removes the user, trying up to attempts times, then tells the
+        user's manager. The manager is only emailed, or the user added
+        to the manager's digest, once the removal has succeeded.
+
+        :returns: (username, status, error)
+        """
+        error = None
+        for attempt in range(self.attempts):
+            if attempt:
+                time.sleep(self.retry_delay * attempt)
+            self.limiter.wait()
+            try:
+                #Removes user from Perforce
+                self._connection().remove_perforce_user(user)
+                error = None
+                break
+            except Exception as excep:
+                error = str(excep)
+        if error is not None:
+            # Left out of the checkpoint so a resumed run retries it
+            return (user.username, 'failed', error)
+
+        if self.checkpoint is not None:
+            self.checkpoint.record_removal(self.server, user.username)
+
+        if '@' in user.manager_email:
+            if self.notifier is not None:
+                self.notifier.add(self.server, user)
+            else:
+                try:
+                    user.email_users_manager(self.server)
+                except Exception as excep:
+                    print (f'Error emailing the manager of {user.username}: {excep}')
+        return (user.username, 'removed', None)
+
+    def _already_removed(self, user):
+        """
+        The result for a user the checkpoint shows as removed, or None
+        if the user still has to be removed
+        """
+        if self.checkpoint is not None and \
+                self.checkpoint.is_removed(self.server, user.username):
+            return (user.username, 'already-removed', None)
+        return None
+
+    def run_stream(self, d_users):
+        """
+        Removes departed users as they arrive. Users the checkpoint shows
+        were already removed are not removed again but still come out,
+        with the status 'already-removed', so the report and admin email
+        of a resumed run list every departed user. At most twice the
+        number of workers removals are queued at once, so d_users can be
+        a generator.
+
+        :param d_users: iterable of departed PerforceUser
+        :returns: generator of (user, status, error), in the order of d_users
+        """
+        self.owner = threading.get_ident()
+        try:
+            if self.workers == 1:
+                for user in d_users:
+                    yield self._record(user, self._already_removed(user) or self._remove(user))
+                return
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                in_flight = deque()
+                for user in d_users:
+                    result = self._already_removed(user)
+                    if result is None:
+                        result = executor.submit(self._remove, user)
+                    in_flight.append((user, result))
+                    if len(in_flight) >= self.workers * 2:
+                        yield self._record(*in_flight.popleft())
+                while in_flight:
+                    yield self._record(*in_flight.popleft())
+        finally:
+            for perf in self.connections:
+                perf.disconnect_from_perforce()
+            self.connections = []
+
+    def _record(self, user, result):
+        """
+        Keeps the outcome of a removal for the summary, and on the user
+        as removal_status for the report
+
+        :param result: (username, status, error), or the Future of a
+            removal still running
+        """
+        if not isinstance(result, tuple):
+            result = result.result()
+        _, status, error = result
+        user.removal_status = status
+        if status == 'removed':
+            self.removed += 1
+        elif status == 'already-removed':
+            self.skipped += 1
+        else:
+            self.failed.append((user.username, error))
+        return user, status, error
+
+    def summary(self):
+        """Writes the removal counts and failures to the log"""
+        print (f'{self.server}: {self.removed} removed, '
+               f'{len(self.failed)} failed, {self.skipped} already removed')
+        for username, error in self.failed:
+            print (f'Error removing {username}: {error}')
+
+    def run(self, d_users):
+        """
+        Removes the departed users, skipping any the checkpoint shows
+        were already removed. Those are returned as 'already-removed'.
+
+        :param d_users: List of all departed users in Perforce
+        :returns: dict of username -> (status, error)
+        """
+        results = {user.username: (status, error)
+                   for user, status, error in self.run_stream(d_users)}
+        self.summary()
+        return results
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# File name: report_writer.py
+# Description: Streams departed users to CSV, JSON lines or Parquet reports
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for writing departed user reports"""
+
+import os
+import csv
+import gzip
+import json
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# (column header, PerforceUser attribute). removal_status is set by
+# RemovalExecutor, so Status is blank in read-only runs
+COLUMNS = [('Name', 'name'),
+           ('Username', 'username'),
+           ('Email', 'email'),
+           ('Manager\'s email', 'manager_email'),
+           ('LDAP Name', 'ldap_name'),
+           ('Status', 'removal_status')]
+
+FORMATS = ['csv', 'jsonl', 'parquet']
+
+# Rows buffered per Parquet row group
+PARQUET_BATCH_SIZE = 10000
+
+
+def unused_file_name(base_name, extension):
+    """
+    The first of base_name.extension, base_name-2.extension,
+    base_name-3.extension and so on that doesn't exist yet
+
+    :param base_name: file name without the extension
+    :param extension: extension including the dot
+    """
+    file_name = base_name + extension
+    run = 1
+    while os.path.exists(file_name):
+        run += 1
+        file_name = f'{base_name}-{run}{extension}'
+    return file_name
+
+
+class DepartedUserReport(object):
+    """
+    Writes PerforceUser records to a report one at a time, so a report
+    of any size is written in constant memory.
+
+    Every report is a new file. When an earlier run of the day already
+    wrote base_name.csv, the report goes to base_name-2.csv and so on,
+    the same for every format, so no run's rows are lost or written
+    under another run's header. CSV and JSON lines reports can be gzip
+    compressed. Parquet reports need pyarrow and are written one row
+    group at a time.
+
+    Methods:
+        write: Adds a user to the report.
+
+        write_all: Adds every user from an iterable to the report.
+
+        close: Finishes the report.
+
+        stats: Summary of rows, file size and throughput for the log.
+    """
+    def __init__(self, base_name, fmt='csv', compress=False):
+        """
+        :param base_name: file name without the extension
+        :param fmt: one of FORMATS
+        :param compress: gzip compress a csv or jsonl report
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f'{fmt} is not a valid report format')
+        if fmt == 'parquet' and pyarrow is None:
+            raise ValueError('Parquet reports need pyarrow to be installed')
+
+        self.fmt = fmt
+        extension = '.' + fmt
+        if compress and fmt != 'parquet':
+            extension += '.gz'
+        self.file_name = unused_file_name(base_name, extension)
+
+        self.rows = 0
+        self.started = time.monotonic()
+        self.elapsed = 0
+        self.batch = []
+        self.stream = None
+        self.writer = None
+        self.schema = None
+
+        if fmt == 'parquet':
+            # Declared rather than inferred, so a column that is empty in
+            # one row group still matches the others
+            self.schema = pyarrow.schema([(header, pyarrow.string()) for header, _ in COLUMNS])
+            self.writer = pyarrow.parquet.ParquetWriter(self.file_name, self.schema)
+            return
+
+        if compress:
+            self.stream = gzip.open(self.file_name, 'xt', newline='')
+        else:
+            self.stream = open(self.file_name, 'x', newline='')
+
+        if fmt == 'csv':
+            self.writer = csv.writer(self.stream)
+            self.writer.writerow([header for header, _ in COLUMNS])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _values(user):
+        """The report columns for user"""
+        return [getattr(user, attribute, '') for _, attribute in COLUMNS]
+
+    def write(self, user):
+        """
+        Adds user to the report
+
+        :param user: PerforceUser
+        """
+        values = self._values(user)
+        if self.fmt == 'csv':
+            self.writer.writerow(values)
+        elif self.fmt == 'jsonl':
+            record = dict(zip((header for header, _ in COLUMNS), values))
+            self.stream.write(json.dumps(record) + '\n')
+        else:
+            self.batch.append(values)
+            if len(self.batch) >= PARQUET_BATCH_SIZE:
+                self._write_batch()
+        self.rows += 1
+
+    def write_all(self, users):
+        """
+        Adds every user to the report as they are produced
+
+        :param users: iterable of PerforceUser
+        :returns: the number of users written
+        """
+        written = 0
+        for user in users:
+            self.write(user)
+            written += 1
+        return written
+
+    def _write_batch(self):
+        """Writes the buffered rows as a Parquet row group"""
+        if not self.batch:
+            return
+        columns = [pyarrow.array([None if value is None else str(value) for value in column],
+                                 pyarrow.string())
+                   for column in zip(*self.batch)]
+        self.writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+        self.batch = []
+
+    def close(self):
+        """Finishes the report"""
+        if self.fmt == 'parquet':
+            if self.writer is not None:
+                self._write_batch()
+                self.writer.close()
+                self.writer = None
+        elif self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.elapsed = time.monotonic() - self.started
+
+    def stats(self):
+        """Returns a one line summary of the report for the log"""
+        size = os.path.getsize(self.file_name) if os.path.exists(self.file_name) else 0
+        rate = self.rows / self.elapsed if self.elapsed else 0
+        return (f'Saved {self.rows} rows to {self.file_name} '
+                f'({size} bytes, {rate:.0f} rows/s)')
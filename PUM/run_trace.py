@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# File name: run_trace.py
+# Description: Records how long each stage of a run takes, per server, as
+#   JSON lines
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+"""Module for structured run timings"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+def result_size(raw_res):
+    """
+    Approximate size in bytes of raw search results: the DNs and every
+    attribute value
+
+    :param raw_res: the raw search_s results
+    """
+    size = 0
+    for dn, attrs in raw_res:
+        if dn is None or not isinstance(attrs, dict):
+            continue
+        size += len(dn)
+        for values in attrs.values():
+            size += sum(len(value) for value in values)
+    return size
+
+
+class LdapCounters(object):
+    """
+    Thread safe counts of the searches a PerforceLdap has made, the
+    entries and bytes they returned and the searches that failed.
+
+    Methods:
+        add: Counts a search and its results.
+
+        add_error: Counts a failed search.
+
+        snapshot: The counts so far.
+
+        since: The counts since an earlier snapshot.
+    """
+    FIELDS = ('queries', 'entries', 'bytes', 'errors')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, raw_res):
+        """
+        Counts a search that returned raw_res
+
+        :param raw_res: the raw search_s results
+        """
+        entries = sum(1 for dn, _ in raw_res if dn is not None)
+        size = result_size(raw_res)
+        with self.lock:
+            self.counts['queries'] += 1
+            self.counts['entries'] += entries
+            self.counts['bytes'] += size
+
+    def add_error(self):
+        """Counts a search that raised"""
+        with self.lock:
+            self.counts['queries'] += 1
+            self.counts['errors'] += 1
+
+    def snapshot(self):
+        """Returns a copy of the counts so far"""
+        with self.lock:
+            return dict(self.counts)
+
+    def since(self, before):
+        """
+        Returns the counts added since before was taken
+
+        :param before: an earlier snapshot
+        """
+        now = self.snapshot()
+        return {field: now[field] - before[field] for field in self.FIELDS}
+
+
+class RunTrace(object):
+    """
+    Appends a JSON line for every span of a run: its name, the server it
+    belongs to, when it started, how long it took and whether it failed.
+    A span given a PerforceLdap also records the LDAP queries, entries,
+    bytes and errors made while it ran. Lines from every server's worker
+    thread go to one file, tagged with the run's id.
+
+    Methods:
+        span: Times a block of the run.
+
+        event: Records a single line.
+
+        close: Closes the trace file.
+    """
+    def __init__(self, path):
+        """
+        :param path: the trace file, appended to
+        """
+        self.path = path
+        self.run_id = time.strftime('%Y%m%dT%H%M%S')
+        self.lock = threading.Lock()
+        self.stream = open(path, 'a')
+
+    def event(self, name, **fields):
+        """
+        Records a line that is not a span, e.g. the run's settings
+
+        :param name: what happened
+        """
+        self._write(dict({'run': self.run_id, 'event': name,
+                          'time': time.strftime('%Y-%m-%dT%H:%M:%S')}, **fields))
+
+    def _write(self, record):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.write(json.dumps(record, default=str) + '\n')
+                self.stream.flush()
+
+    @contextmanager
+    def span(self, name, server=None, ldap_con=None, **fields):
+        """
+        Times the block it wraps. The block gets the span's fields as a
+        dict and can add counts to it, e.g. the number of users read.
+
+        :param name: the stage, e.g. 'perforce login'
+        :param server: the perforce server the stage is for
+        :param ldap_con: PerforceLdap whose searches are counted
+        """
+        started = time.time()
+        began = time.perf_counter()
+        before = ldap_con.counters.snapshot() if ldap_con is not None else None
+        record = {'run': self.run_id, 'span': name, 'server': server,
+                  'start': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started))}
+        try:
+            yield fields
+            record['status'] = 'ok'
+        except BaseException as excep:
+            record['status'] = 'error'
+            record['error'] = str(excep) or type(excep).__name__
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - began, 3)
+            if before is not None:
+                record['ldap'] = ldap_con.counters.since(before)
+            record.update(fields)
+            self._write(record)
+
+    def close(self):
+        """Closes the trace file"""
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# File name: fakes.py
+# Description: In-process stand-ins for the LDAP server, Exchange and the
+#   success record API, so the benchmarks never touch a live service, and
+#   for the client packages the tools import that aren't installed
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import sys
+import json
+import time
+import types
+import threading
+import importlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def standIn(name, **attrs):
+    '''Registers an empty module called name holding attrs, as an
+    attribute of its parent package too'''
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def placeholder(name):
+    '''A class that can be imported but is never used by the benchmarks'''
+    return type(name, (), {'__init__': lambda self, *args, **kwargs: None})
+
+
+def standInLdap():
+    '''python-ldap: the scopes and errors PerforceLdap and LdapSnapshot use.
+    The searches themselves go to fakeLdap'''
+    class LDAPError(Exception):
+        pass
+
+    errors = {name: type(name, (LDAPError,), {})
+              for name in ['NO_SUCH_OBJECT', 'FILTER_ERROR', 'INVALID_CREDENTIALS', 'SERVER_DOWN',
+                           'DECODING_ERROR']}
+    standIn('ldap', SCOPE_BASE=0, SCOPE_ONELEVEL=1, SCOPE_SUBTREE=2, OPT_REFERRALS=8,
+            VERSION3=3, LDAPError=LDAPError, **errors)
+    standIn('ldap.filter', escape_filter_chars=lambda value: ''.join(
+        f'\\{ord(char):02x}' if char in '\\*()\0' else char for char in value))
+
+    def str2dn(dn):
+        '''Splits a DN without escaped separators into RDNs of (type, value, flags)'''
+        avas = [rdn.split('+') for rdn in dn.split(',')]
+        if not all('=' in ava for rdn in avas for ava in rdn):
+            raise errors['DECODING_ERROR'](dn)
+        return [[tuple(ava.split('=', 1)) + (1,) for ava in rdn] for rdn in avas]
+    standIn('ldap.dn', str2dn=str2dn)
+
+    class SimplePagedResultsControl:
+        controlType = '1.2.840.113556.1.4.319'
+
+        def __init__(self, criticality=True, size=0, cookie=''):
+            self.criticality = criticality
+            self.size = size
+            self.cookie = cookie
+    standIn('ldap.controls', SimplePagedResultsControl=SimplePagedResultsControl)
+
+
+def standInLdapHelper():
+    '''ldap_helper: search results with their values decoded'''
+    class SearchResult:
+        def __init__(self, dn, attrs):
+            self.dn = dn
+            self.attrs = {name: [value.decode() if isinstance(value, bytes) else value
+                                 for value in values]
+                          for name, values in attrs.items()}
+
+        def get_attributes(self):
+            return self.attrs
+
+    standIn('ldap_helper', get_search_results=lambda raw: [SearchResult(dn, attrs)
+                                                           for dn, attrs in raw if dn is not None])
+
+
+def standInPerforce():
+    '''perforce: the Perforce connection, which the benchmarks never open'''
+    standIn('perforce', Perforce=placeholder('Perforce'))
+
+
+def standInPerforceUser():
+    '''perforce_user: the departed users PerforceLdap builds'''
+    class PerforceUser:
+        def email_users_manager(self, server):
+            pass
+
+    standIn('perforce_user', PerforceUser=PerforceUser)
+
+
+def standInEmailAlerts():
+    '''email_alerts: the admin email, which the benchmarks never send'''
+    standIn('email_alerts', P4Email=placeholder('P4Email'))
+
+
+def standInExchangelib():
+    '''exchangelib: the names maill_detection imports. The mailbox itself
+    is FakeExchangeAccount'''
+    names = ['Account', 'Configuration', 'Credentials', 'ItemAttachment', 'Message',
+             'CalendarItem', 'HTMLBody', 'EWSDateTime']
+    standIn('exchangelib', DELEGATE='Delegate', **{name: placeholder(name) for name in names})
+
+
+def standInSelenium():
+    '''selenium: the names report_scrape imports. The benchmark only times
+    waitForDownload, which never drives a browser'''
+    for name in ['selenium', 'selenium.webdriver', 'selenium.webdriver.common',
+                 'selenium.webdriver.support', 'selenium.webdriver.firefox', 'selenium.common']:
+        standIn(name)
+    standIn('selenium.webdriver.common.by', By=placeholder('By'))
+    standIn('selenium.webdriver.support.ui', WebDriverWait=placeholder('WebDriverWait'))
+    standIn('selenium.webdriver.support.expected_conditions')
+    standIn('selenium.webdriver.common.desired_capabilities',
+            DesiredCapabilities=placeholder('DesiredCapabilities'))
+    standIn('selenium.webdriver.firefox.options', Options=placeholder('Options'))
+    standIn('selenium.common.exceptions', TimeoutException=type('TimeoutException', (Exception,), {}))
+
+
+# Package -> function putting a stand-in for it in sys.modules
+STAND_INS = {
+    'ldap': standInLdap,
+    'ldap_helper': standInLdapHelper,
+    'perforce': standInPerforce,
+    'perforce_user': standInPerforceUser,
+    'email_alerts': standInEmailAlerts,
+    'exchangelib': standInExchangelib,
+    'selenium': standInSelenium,
+}
+
+
+def installStandIns():
+    '''Stands in for the packages in STAND_INS that aren't installed, so the
+    tools' modules can be imported and timed against the fakes below.
+    Installed packages are left alone. Returns the packages stood in for'''
+    installed = []
+    for name, install in STAND_INS.items():
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            install()
+            installed.append(name)
+    return installed
+
+
+def fakeLdap(userEntries, managerEntries, latency=0.0):
+    '''A bound-connection stand-in answering PerforceLdap's searches from
+    the fixture entries, waiting "latency" seconds per search like a round
+    trip to the DC would. Built on the offline LdapSnapshot'''
+    from ldap_snapshot import LdapSnapshot
+
+    class FakeLdapServer(LdapSnapshot):
+        def search_s(self, basedn, scope, filterstr='(objectClass=*)', attrlist=None):
+            if latency:
+                time.sleep(latency)
+            return super().search_s(basedn, scope, filterstr, attrlist)
+
+    server = FakeLdapServer(None)
+    for dn, attrs in managerEntries:
+        server.by_dn[dn.lower()] = (dn, attrs)
+    for dn, attrs in userEntries:
+        server.by_dn[dn.lower()] = (dn, attrs)
+        server.by_account[b''.join(attrs['AccountName']).decode().lower()] = (dn, attrs)
+    server.meta = {'highest_usn': '1'}
+    return server
+
+
+class FakeQuery:
+    '''The parts of an exchangelib QuerySet get_success_emails uses'''
+
+    def __init__(self, emails):
+        self.emails = emails
+        self.page_size = 100
+
+    def filter(self, subject__icontains=None, datetime_received__gt=None):
+        emails = self.emails
+        if subject__icontains is not None:
+            emails = [email for email in emails if subject__icontains in email.subject.lower()]
+        if datetime_received__gt is not None:
+            emails = [email for email in emails if email.datetime_received > datetime_received__gt]
+        return FakeQuery(emails)
+
+    def only(self, *fields):
+        return self
+
+    def order_by(self, field):
+        return FakeQuery(sorted(self.emails, key=lambda email: email.datetime_received,
+                                reverse=field.startswith('-')))
+
+    def all(self):
+        return self
+
+    def __getitem__(self, index):
+        return self.emails[index]
+
+
+class FakeFolder(FakeQuery):
+    def __truediv__(self, name):
+        return self
+
+
+class FakeExchangeAccount:
+    '''An Exchange mailbox holding the fixture emails in one folder, with
+    "latency" seconds per EWS request'''
+
+    def __init__(self, emails, latency=0.0):
+        self.root = FakeFolder(emails)
+        self.trash = FakeFolder([])
+        self.byId = {email.id: email for email in emails}
+        self.latency = latency
+        self.requests = 0
+
+    def request(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def fetch(self, ids, only_fields=None):
+        self.request()
+        return [self.byId[email.id] for email in ids]
+
+    def bulk_move(self, ids, to_folder, chunk_size=100):
+        for _ in range(0, len(ids), chunk_size):
+            self.request()
+        return [True] * len(ids)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    '''Takes success records like the REST API, one form post or a JSON list'''
+    records = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        count = len(json.loads(body)) if self.path.endswith('/bulk') else 1
+        with FakeApiHandler.lock:
+            FakeApiHandler.records += count
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def startFakeApi():
+    '''Starts the fake success record API in a background thread.
+    Returns the server, the record URL and the bulk URL'''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/success"
+    return server, url, url + '/bulk'
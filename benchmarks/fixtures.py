@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# File name: fixtures.py
+# Description: Synthetic Perforce users, LDAP entries, notification emails
+#   and OBIEE exports for the benchmarks
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import os
+import csv
+import random
+import datetime
+from collections import namedtuple
+
+DISABLED_BASEDN = 'OU=Accounts,OU=Disabled'
+MANAGER_BASEDN = 'OU=Staff'
+DAY = 24 * 60 * 60
+
+Email = namedtuple('Email', ['id', 'changekey', 'subject', 'body', 'datetime_received'])
+
+
+def perforceUsers(count, now, seed=1):
+    '''Perforce users shaped like p4 users -ztag output. Access is spread
+    over the last two years, so most users were active recently'''
+    rng = random.Random(seed)
+    return [{'User': f'user{i:06d}', 'FullName': f'User {i}', 'Email': f'user{i:06d}@website.com',
+             'Access': str(int(now - rng.expovariate(1 / (30 * DAY)) % (730 * DAY)))}
+            for i in range(count)]
+
+
+def ldapEntries(users, disabled, managers, seed=1):
+    '''Raw search_s entries for "disabled" of the users, each reporting to
+    one of "managers" managers. Returns (user entries, manager entries)'''
+    rng = random.Random(seed)
+    managerDns = [f'CN=Manager {i},{MANAGER_BASEDN}' for i in range(managers)]
+
+    userEntries = []
+    for user in rng.sample(users, min(disabled, len(users))):
+        attrs = {'mail': [user['Email'].encode()],
+                 'AccountName': [user['User'].encode()],
+                 'name': [user['FullName'].encode()]}
+        # Some accounts lost their manager when they were disabled
+        if rng.random() < 0.9:
+            attrs['manager'] = [rng.choice(managerDns).encode()]
+        userEntries.append((f"CN={user['FullName']},{DISABLED_BASEDN}", attrs))
+
+    managerEntries = [(dn, {'mail': [f'manager{i}@website.com'.encode()],
+                            'displayname': [f'Manager {i}'.encode()]})
+                      for i, dn in enumerate(managerDns)]
+    return userEntries, managerEntries
+
+
+def successBodies(count):
+    '''Synthetic change notification bodies shaped like the real ones'''
+    template = ('Hello,\r\n\r\nThe following change has been implemented in production.\r\n'
+                'Change Number: CO-{number}\r\nImplemented on {month:02d}/{day:02d}/22 at '
+                '{hour:02d}:{minute:02d} {half}\r\nImplementer: Deployment Automation\r\n\r\n'
+                'This is an automated message, please do not reply.\r\n' + 'Footer text. ' * 40)
+    return [template.format(number=100000 + i, month=i % 12 + 1, day=i % 28 + 1,
+                            hour=i % 12 + 1, minute=i % 60, half='AP'[i % 2] + 'M')
+            for i in range(count)]
+
+
+def loadCorpus(path):
+    '''Reads every file in a directory as one email body'''
+    bodies = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), errors='replace') as bodyFile:
+            bodies.append(bodyFile.read())
+    return bodies
+
+
+def notificationEmails(count, otherShare=0.2, seed=1):
+    '''Emails for the fake Exchange folder; about otherShare of them are
+    not change notifications'''
+    rng = random.Random(seed)
+    start = datetime.datetime(2022, 5, 16, tzinfo=datetime.timezone.utc)
+    bodies = successBodies(count)
+    emails = []
+    for i, body in enumerate(bodies):
+        if rng.random() < otherShare:
+            subject, body = f'Weekly digest {i}', 'Nothing to see here. ' * 40
+        else:
+            subject = f'PROD: Change Number CO-{100000 + i} implemented'
+        emails.append(Email(f'id{i}', f'ck{i}', subject, body, start + datetime.timedelta(minutes=i)))
+    return emails
+
+
+def largeCsv(path, rows, seed=1):
+    '''Writes an export shaped like the staffing report, with the byte
+    order mark OBIEE starts its CSVs with'''
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8-sig') as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(['Employee ID', 'Employee Name', 'Team', 'Schedule Date', 'Scheduled Hours', 'Project'])
+        for i in range(rows):
+            writer.writerow([100000 + i, f'Employee {i}', f'Team {i % 40}',
+                             f'{i % 12 + 1}/{i % 28 + 1}/2022', f'{rng.uniform(0, 40):.2f}',
+                             f'Project {rng.randrange(500)}'])
+    return path
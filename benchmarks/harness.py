@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# File name: harness.py
+# Description: Times benchmarks and reports throughput, latency percentiles
+#   and peak memory
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import time
+import tracemalloc
+from collections import namedtuple
+
+BenchmarkResult = namedtuple('BenchmarkResult',
+                             ['name', 'ops', 'seconds', 'opsPerSec', 'p50Ms', 'p99Ms', 'peakKib'])
+
+
+class BenchmarkSkipped(Exception):
+    '''Raised by a benchmark's setup when what it times can't run here,
+    e.g. a library the tool needs is not installed'''
+
+
+def percentile(values, share):
+    '''Nearest rank percentile of a sorted list'''
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(round(share * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+def measure(name, op, calls, opsPerCall=1, warmup=1):
+    '''Runs op() "calls" times, timing every call, then once more under
+    tracemalloc for the peak memory (tracing slows everything down, so
+    it is kept out of the timed calls). Each call counts as opsPerCall
+    operations, e.g. the number of users in a batch'''
+    for _ in range(warmup):
+        op()
+
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        op()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        op()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(latencies)
+    latencies.sort()
+    ops = calls * opsPerCall
+    return BenchmarkResult(name, ops, total, ops / total if total else float('inf'),
+                           percentile(latencies, 0.50) * 1000, percentile(latencies, 0.99) * 1000,
+                           peak / 1024)
+
+
+def printResults(results, skipped):
+    '''Prints the results as a table'''
+    width = max([len(result.name) for result in results] + [len(name) for name in skipped] + [9])
+    print(f"{'benchmark':<{width}} {'ops':>9} {'ops/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'peak KiB':>10}")
+    for result in results:
+        print(f"{result.name:<{width}} {result.ops:>9} {result.opsPerSec:>12,.0f} "
+              f"{result.p50Ms:>10.3f} {result.p99Ms:>10.3f} {result.peakKib:>10,.0f}")
+    for name, reason in skipped.items():
+        print(f"{name:<{width}} skipped: {reason}")
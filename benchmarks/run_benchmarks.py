@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# File name: run_benchmarks.py
+# Description: Times the hot paths of PUM, mail_detection and report_scrape
+#   against synthetic data and in-process fakes of the services they use
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+import threading
+import contextlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+# The tools import their modules by name, from the repo root and PUM/
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'PUM')]
+
+from harness import measure, printResults, BenchmarkSkipped
+import fixtures
+import fakes
+
+
+def requires(*modules):
+    '''Raises BenchmarkSkipped if a module a benchmark imports is missing'''
+    for module in modules:
+        try:
+            __import__(module)
+        except ImportError as excep:
+            raise BenchmarkSkipped(f"needs {excep.name}")
+
+
+def benchDepartedUsers(args):
+    '''generate_departed_user_list (chunked OR filters) against one
+    search_ldap_for_user per user, and with the access time filter'''
+    requires('perforce_user_management')
+    from perforce_user_management import generate_departed_user_list
+    from perforce_ldap import PerforceLdap
+    from manager_cache import ManagerCache
+    from access_filter import AccessFilter
+
+    now = time.time()
+    users = fixtures.perforceUsers(args.users, now)
+    userEntries, managerEntries = fixtures.ldapEntries(users, args.disabled, args.managers)
+
+    p4Ldap = PerforceLdap()
+    p4Ldap.ldap = fakes.fakeLdap(userEntries, managerEntries, args.ldap_latency)
+
+    def chunked():
+        p4Ldap.manager_cache = ManagerCache()
+        generate_departed_user_list(users, p4Ldap)
+
+    legacyUsers = users[:args.legacy_users]
+
+    def perUser():
+        p4Ldap.manager_cache = ManagerCache()
+        for user in legacyUsers:
+            p4Ldap.search_ldap_for_user(user)
+
+    def filtered():
+        p4Ldap.manager_cache = ManagerCache()
+        generate_departed_user_list(AccessFilter(args.active_days, now).filter(users), p4Ldap)
+
+    return [
+        measure('generate_departed_user_list', chunked, args.calls, len(users)),
+        measure('search_ldap_for_user per user', perUser, args.calls, len(legacyUsers)),
+        measure(f'departed users, active {args.active_days} days skipped', filtered,
+                args.calls, len(users)),
+    ]
+
+
+def benchManagerLookup(args):
+    '''search_ldap_for_manager with every lookup missing the cache, and
+    with every lookup hitting it'''
+    requires('perforce_ldap')
+    from perforce_ldap import PerforceLdap
+    from manager_cache import ManagerCache
+
+    users = fixtures.perforceUsers(args.disabled, time.time())
+    userEntries, managerEntries = fixtures.ldapEntries(users, args.disabled, args.managers)
+    # Attributes as ldap_helper hands them to PerforceLdap
+    attrs = itertools.cycle([{'manager': [attr['manager'][0].decode()]}
+                             for _, attr in userEntries if 'manager' in attr])
+    managerDns = [dn for dn, _ in managerEntries]
+
+    p4Ldap = PerforceLdap(ManagerCache(max_size=0))
+    p4Ldap.ldap = fakes.fakeLdap(userEntries, managerEntries, args.ldap_latency)
+    cold = measure('search_ldap_for_manager, cache miss',
+                   lambda: p4Ldap.search_ldap_for_manager(next(attrs)), args.lookups)
+
+    p4Ldap.manager_cache = ManagerCache()
+    for dn in managerDns:
+        p4Ldap.search_ldap_for_manager({'manager': [dn]})
+    warm = measure('search_ldap_for_manager, cache hit',
+                   lambda: p4Ldap.search_ldap_for_manager(next(attrs)), args.lookups)
+    return [cold, warm]
+
+
+def legacyParse(body):
+    '''The three separate searches parseSuccessString used to run'''
+    changeNumber = re.search('[a-zA-Z]{2,3}-\\d*', body).group(0)
+    time = re.search('\\d*:\\d*\\s[A,P,M].', body).group(0)
+    date = re.search('\\d./\\d./\\d.', body).group(0)
+    return changeNumber, time, date
+
+
+def benchParse(args):
+    '''parseSuccess, the three regex parser it replaced and parseMany over
+    the whole batch, on synthetic bodies or a --corpus of real ones.
+
+    parseSuccess is not faster than the three searches. It replaced them
+    because they missed dates with a single digit month, cut four digit
+    years short and failed with an AttributeError that didn't say which
+    field was missing'''
+    from success_parser import parseSuccess, parseMany
+
+    bodies = fixtures.loadCorpus(args.corpus) if args.corpus else fixtures.successBodies(args.emails)
+    cycle = itertools.cycle(bodies)
+
+    def legacy():
+        # A real corpus has bodies the legacy parser can't read
+        try:
+            legacyParse(next(cycle))
+        except AttributeError:
+            pass
+
+    return [
+        measure('parseSuccess', lambda: parseSuccess(next(cycle)), args.lookups),
+        measure('legacy parse', legacy, args.lookups),
+        measure(f'parseMany, processes={args.processes}',
+                lambda: parseMany(bodies, args.processes), args.calls, len(bodies)),
+    ]
+
+
+def benchSaveRecords(args):
+    '''saveSuccessRecord (one connection per record) against the pooled,
+    batched SuccessRecordSink, both posting to a local fake API'''
+    requires('requests')
+    from success_sink import SuccessRecordSink
+
+    server, url, bulkUrl = fakes.startFakeApi()
+    spool = os.path.join(args.workdir, 'spool.jsonl')
+    numbers = itertools.count()
+    results = []
+    try:
+        try:
+            requires('maill_detection')
+            from maill_detection import saveSuccessRecord
+            results.append(measure('saveSuccessRecord',
+                                   lambda: saveSuccessRecord(f'CO-{next(numbers)}', '06:12 PM',
+                                                             '05/16/22', url),
+                                   args.records))
+        except BenchmarkSkipped as excep:
+            print(f"saveSuccessRecord skipped: {excep}", file=sys.stderr)
+
+        sink = SuccessRecordSink(url, bulkUrl, spoolPath=spool)
+        results.append(measure('SuccessRecordSink.add, batched',
+                               lambda: sink.add(f'CO-{next(numbers)}', '06:12 PM', '05/16/22'),
+                               args.records))
+        sink.close()
+    finally:
+        server.shutdown()
+    return results
+
+
+def benchGetSuccess(args):
+    '''get_success_emails and getSuccess end to end, from a fake mailbox
+    to the fake API'''
+    requires('maill_detection')
+    from maill_detection import get_success_emails, getSuccess, MailboxCleanup
+    from success_sink import SuccessRecordSink
+
+    emails = fixtures.notificationEmails(args.emails)
+    server, url, bulkUrl = fakes.startFakeApi()
+    spool = os.path.join(args.workdir, 'spool.jsonl')
+
+    def run():
+        account = fakes.FakeExchangeAccount(emails, args.ews_latency)
+        getSuccess(get_success_emails(account, 'Success', len(emails)), None,
+                   SuccessRecordSink(url, bulkUrl, spoolPath=spool), MailboxCleanup(account))
+
+    try:
+        return [measure('getSuccess', run, args.calls, len(emails))]
+    finally:
+        server.shutdown()
+
+
+def benchDownloadWait(args):
+    '''How long waitForDownload takes to notice a finished download.
+    Includes report_scrape.STABLE_FOR, the time the size must hold'''
+    requires('report_scrape')
+    from report_scrape import waitForDownload
+
+    savePath = os.path.join(args.workdir, 'downloads')
+    os.makedirs(savePath, exist_ok=True)
+    fileName = 'report.csv'
+
+    def download():
+        # Firefox writes "<name>.part" then renames it
+        time.sleep(0.05)
+        with open(os.path.join(savePath, fileName + '.part'), 'w') as part:
+            part.write('a,b\n' * 1000)
+        os.replace(os.path.join(savePath, fileName + '.part'), os.path.join(savePath, fileName))
+
+    def wait():
+        filePath = os.path.join(savePath, fileName)
+        if os.path.exists(filePath):
+            os.remove(filePath)
+        writer = threading.Thread(target=download)
+        writer.start()
+        waitForDownload(savePath, fileName, timeout=60)
+        writer.join()
+
+    return [measure('waitForDownload', wait, args.download_calls, warmup=0)]
+
+
+def benchObieeExport(args):
+    '''ObieeExportSession streaming a large CSV from the stub saw.dll'''
+    requires('requests')
+    from obiee_export import ObieeExportSession, startStub
+
+    reports = os.path.join(args.workdir, 'reports')
+    savePath = os.path.join(args.workdir, 'exported')
+    os.makedirs(reports, exist_ok=True)
+    os.makedirs(savePath, exist_ok=True)
+    fixtures.largeCsv(os.path.join(reports, 'Staffing.csv'), args.csv_rows)
+
+    server, baseUrl = startStub(reports)
+    export = ObieeExportSession(baseUrl)
+    try:
+        export.login('user', 'password')
+        return [measure('ObieeExportSession.exportReport',
+                        lambda: export.exportReport('Staffing', savePath), args.calls, args.csv_rows)]
+    finally:
+        export.close()
+        server.shutdown()
+
+
+def benchReportLoader(args):
+    '''Loading a large CSV into an empty database, and reloading it
+    unchanged (only hashes compared, nothing written)'''
+    from report_loader import ReportLoader
+
+    csvPath = fixtures.largeCsv(os.path.join(args.workdir, 'Staffing.csv'), args.csv_rows)
+    dbPath = os.path.join(args.workdir, 'reports.db')
+
+    def load():
+        loader = ReportLoader(dbPath, 'staffing', ['Employee ID'], ['Team', 'Schedule Date'],
+                              columnTypes={'Schedule Date': 'DATE', 'Scheduled Hours': 'REAL'})
+        try:
+            loader.load(csvPath)
+        finally:
+            loader.close()
+
+    def firstLoad():
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(dbPath + suffix):
+                os.remove(dbPath + suffix)
+        load()
+
+    return [measure('ReportLoader first load', firstLoad, args.calls, args.csv_rows, warmup=0),
+            measure('ReportLoader unchanged reload', load, args.calls, args.csv_rows)]
+
+
+BENCHMARKS = {
+    'departed-users': benchDepartedUsers,
+    'manager-lookup': benchManagerLookup,
+    'parse': benchParse,
+    'save-records': benchSaveRecords,
+    'get-success': benchGetSuccess,
+    'download-wait': benchDownloadWait,
+    'obiee-export': benchObieeExport,
+    'report-loader': benchReportLoader,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the tools against local fakes')
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                        help='benchmark to run, may be repeated (default: all)')
+    parser.add_argument('--users', type=int, default=20000, help='Perforce users')
+    parser.add_argument('--disabled', type=int, default=2000, help='deprovisioned LDAP entries')
+    parser.add_argument('--managers', type=int, default=200)
+    parser.add_argument('--emails', type=int, default=5000, help='notification emails')
+    parser.add_argument('--corpus', default=None, metavar='DIR',
+                        help='directory of real notification bodies, one per file, to parse '
+                             'instead of synthetic ones')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='process pool size for parseMany (default: no pool)')
+    parser.add_argument('--csv-rows', type=int, default=100000, help='rows in the OBIEE export')
+    parser.add_argument('--ldap-latency', type=float, default=0.0005,
+                        help='seconds the fake DC takes per search')
+    parser.add_argument('--ews-latency', type=float, default=0.005,
+                        help='seconds the fake Exchange takes per request')
+    parser.add_argument('--legacy-users', type=int, default=2000,
+                        help='users looked up one at a time by the per user baseline')
+    parser.add_argument('--active-days', type=int, default=90)
+    parser.add_argument('--lookups', type=int, default=5000, help='calls timed one at a time')
+    parser.add_argument('--records', type=int, default=500, help='records posted to the fake API')
+    parser.add_argument('--calls', type=int, default=5, help='times each batch benchmark runs')
+    parser.add_argument('--download-calls', type=int, default=3)
+    parser.add_argument('--verbose', action='store_true',
+                        help='show what the tools print while they are timed')
+    parser.add_argument('--json', default=None, metavar='FILE',
+                        help='append the results to FILE as JSON lines, to compare runs')
+    args = parser.parse_args()
+
+    standIns = fakes.installStandIns()
+    if standIns:
+        print(f"Standing in for {', '.join(standIns)}, which are not installed", file=sys.stderr)
+
+    args.workdir = tempfile.mkdtemp(prefix='benchmarks-')
+    results, skipped = [], {}
+    quiet = open(os.devnull, 'w')
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"Running {name}", file=sys.stderr)
+            try:
+                with contextlib.redirect_stdout(sys.stdout if args.verbose else quiet):
+                    results.extend(BENCHMARKS[name](args))
+            except BenchmarkSkipped as excep:
+                skipped[name] = str(excep)
+    finally:
+        quiet.close()
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+    printResults(results, skipped)
+    if args.json:
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with open(args.json, 'a') as out:
+            for result in results:
+                out.write(json.dumps(dict(result._asdict(), time=stamp)) + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# File name: mail_daemon.py
+# Description: Long running version of mail_detection that watches several
+#   mailboxes and folders at once
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import sys
+import json
+import time
+import signal
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from exchangelib import Account, Configuration, Credentials, DELEGATE
+from exchangelib.properties import NewMailEvent, CreatedEvent
+from maill_detection import getCredentials, get_success_emails, getSuccess, MailState, MailboxCleanup
+from success_sink import SuccessRecordSink
+
+SERVER = 'mail.website.com'
+MAX_CONNECTIONS = 8     # EWS connections shared by every target
+DEFAULT_INTERVAL = 300  # seconds between polls of a target
+FETCH_COUNT = 1000
+STOP_CHECK = 1          # seconds between checks for a shutdown while waiting
+
+
+def pollSuccess(account, target):
+    '''One pass over a folder of change notifications, like mail_detection.main'''
+    state = MailState(target.get('state', f"{target['mailbox']}-{target['folder']}.state.json"))
+    state.load()
+
+    emails = get_success_emails(account, target['folder'], FETCH_COUNT,
+                                state.lastReceived, newestFirst=False)
+    sink = SuccessRecordSink(spoolPath=target.get('spool', f"{target['mailbox']}-{target['folder']}.spool.jsonl"))
+    getSuccess(emails, state, sink, MailboxCleanup(account))
+
+
+# Parser name used in the config -> function polling a target once
+PARSERS = {
+    'success': pollSuccess,
+}
+
+
+def log(target, message):
+    print(f"{datetime.datetime.now()} [{target['mailbox']}/{target['folder']}] {message}", flush=True)
+
+
+def streamUntilMail(account, target, interval, arrived):
+    '''Runs in its own thread: holds an EWS streaming subscription open
+    until new mail arrives or the connection times out, then sets arrived.
+    Switches the target to polling if the server can't stream'''
+    folder = account.root / 'Top of Information Store' / target['folder']
+    try:
+        with folder.streaming_subscription() as subscriptionId:
+            # connection_timeout is in minutes
+            for notification in folder.get_streaming_events(
+                    subscriptionId, connection_timeout=max(1, interval // 60)):
+                if any(isinstance(event, (NewMailEvent, CreatedEvent)) for event in notification.events):
+                    break
+    except Exception as excep:
+        log(target, f"Streaming not available, polling every {interval}s: {excep}")
+        target['streaming'] = False
+    finally:
+        arrived.set()
+
+
+def waitForMail(account, target, stop):
+    '''Blocks until new mail arrives in the target's folder, using an EWS
+    streaming subscription, or until the target's interval passes.
+    Falls back to plain polling if the server can't stream.
+
+    The subscription blocks inside exchangelib, so it is held open by a
+    daemon thread while this one checks for a shutdown every STOP_CHECK
+    seconds. On shutdown the subscription is left to the daemon thread'''
+    interval = target.get('interval', DEFAULT_INTERVAL)
+    if not target.get('streaming', True):
+        stop.wait(interval)
+        return
+
+    arrived = threading.Event()
+    threading.Thread(target=streamUntilMail, args=(account, target, interval, arrived),
+                     name=f"stream-{target['mailbox']}-{target['folder']}", daemon=True).start()
+    deadline = time.monotonic() + interval
+    while not stop.is_set() and not arrived.is_set() and time.monotonic() < deadline:
+        arrived.wait(STOP_CHECK)
+    if arrived.is_set() and not target.get('streaming', True):
+        stop.wait(interval)
+
+
+def watchTarget(config, target, stop):
+    '''Polls one (mailbox, folder, parser) target until stop is set'''
+    poll = PARSERS[target['parser']]
+    account = Account(primary_smtp_address=target['mailbox'], autodiscover=False,
+                      config=config, access_type=DELEGATE)
+
+    while not stop.is_set():
+        try:
+            poll(account, target)
+        except Exception as excep:
+            log(target, f"Error: Polling failed: {excep}")
+            stop.wait(target.get('interval', DEFAULT_INTERVAL))
+            continue
+        waitForMail(account, target, stop)
+
+
+def logFailure(target):
+    '''Done callback logging why a target's watcher stopped, so errors
+    such as a bad mailbox aren't lost in the executor'''
+    def done(future):
+        if not future.cancelled() and future.exception() is not None:
+            log(target, f"Error: Stopped watching: {future.exception()!r}")
+    return done
+
+
+def loadTargets(path):
+    '''Reads the targets from a JSON config file:
+    {"targets": [{"mailbox": "user@exchange.com", "folder": "Success",
+                  "parser": "success", "interval": 300, "streaming": true}]}'''
+    with open(path) as configFile:
+        targets = json.load(configFile)['targets']
+    for target in targets:
+        if target['parser'] not in PARSERS:
+            raise ValueError(f"Unknown parser {target['parser']} for {target['mailbox']}")
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Watches Exchange folders for notifications')
+    parser.add_argument('config', help='JSON file listing the mailboxes and folders to watch')
+    parser.add_argument('--server', default=SERVER)
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help='EWS connections shared by all of the targets')
+    args = parser.parse_args()
+
+    targets = loadTargets(args.config)
+
+    # One configuration, so every account shares the same connection pool
+    username, password = getCredentials()
+    config = Configuration(server=args.server,
+                           credentials=Credentials(username=username, password=password),
+                           max_connections=args.max_connections)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        futures = []
+        for target in targets:
+            future = pool.submit(watchTarget, config, target, stop)
+            future.add_done_callback(logFailure(target))
+            futures.append(future)
+        while not stop.is_set() and not all(future.done() for future in futures):
+            stop.wait(STOP_CHECK)
+        stop.set()
+    print('Stopped')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
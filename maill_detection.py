@@ -7,10 +7,91 @@
 
 import os
 import base64
-import re
+import json
+import argparse
+import datetime
 import requests
-from exchangelib import Account, Configuration, Credentials, DELEGATE, ItemAttachment, Message, CalendarItem, HTMLBody
+from success_sink import SuccessRecordSink, BATCH_SIZE, URL, BULK_URL
+from success_parser import parseSuccess, SuccessParseError
+from exchangelib import Account, Configuration, Credentials, DELEGATE, ItemAttachment, Message, CalendarItem, HTMLBody, EWSDateTime
 
+SUCCESS_SUBJECT = 'prod: change number'
+PAGE_SIZE = 100     # items requested from Exchange per page
+PROCESSED_DAYS = 90     # days a processed change number is remembered
+CLEANUP_CHUNK_SIZE = 100    # emails moved per EWS request
+
+
+class MailState:
+    '''Watermark of the newest email handled and the change numbers already
+    saved, kept between runs so each run only reads new emails and never
+    saves the same change twice.
+
+    A change number is appended to a journal next to the state file as
+    soon as its record is confirmed saved, before its email is queued for
+    cleanup, so a crash can't leave a saved record that the next run
+    posts again. save() folds the journal into the state file'''
+
+    def __init__(self, path):
+        self.path = path
+        self.journalPath = path + '.journal'
+        self.lastReceived = None
+        self.processed = {}     # change number -> date it was saved
+        self.stalled = False
+
+    def load(self):
+        '''Reads the state file and the journal, if there are any'''
+        if os.path.exists(self.path):
+            with open(self.path) as stateFile:
+                saved = json.load(stateFile)
+            if saved.get('lastReceived'):
+                self.lastReceived = EWSDateTime.from_string(saved['lastReceived'])
+            self.processed = saved.get('processed', {})
+
+        if os.path.exists(self.journalPath):
+            with open(self.journalPath) as journal:
+                for line in journal:
+                    try:
+                        changeNumber, day = json.loads(line)
+                    except ValueError:
+                        continue    # partial line from a crash
+                    self.processed[changeNumber] = day
+
+    def save(self):
+        '''Writes the state file, forgetting change numbers older than
+        PROCESSED_DAYS, and empties the journal'''
+        cutoff = (datetime.date.today() - datetime.timedelta(days=PROCESSED_DAYS)).isoformat()
+        self.processed = {cn: day for cn, day in self.processed.items() if day >= cutoff}
+        saved = {'lastReceived': self.lastReceived.isoformat() if self.lastReceived else None,
+                 'processed': self.processed}
+        with open(self.path + '.tmp', 'w') as stateFile:
+            json.dump(saved, stateFile)
+        os.replace(self.path + '.tmp', self.path)
+        if os.path.exists(self.journalPath):
+            os.remove(self.journalPath)
+
+    def isProcessed(self, changeNumber):
+        return changeNumber in self.processed
+
+    def markProcessed(self, changeNumbers):
+        '''Records saved change numbers, appending them to the journal
+        before returning'''
+        if not changeNumbers:
+            return
+        today = datetime.date.today().isoformat()
+        with open(self.journalPath, 'a') as journal:
+            for changeNumber in changeNumbers:
+                self.processed[changeNumber] = today
+                journal.write(json.dumps([changeNumber, today]) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def advance(self, received, handled):
+        '''Moves the watermark up to an email, oldest first. Stops at the first
+        email that could not be handled so it is read again next run'''
+        if not handled:
+            self.stalled = True
+        if not self.stalled and (self.lastReceived is None or received > self.lastReceived):
+            self.lastReceived = received
 
 def getCredentials():
     """Get credentials from the environment variables"""   
@@ -28,38 +109,123 @@ def connect(server, email, username, password):
     return Account(primary_smtp_address=email, autodiscover=False, config = config, access_type=DELEGATE)
 
 
-def getSuccess(emails):
+class MailboxCleanup:
+    '''Moves processed emails to the trash, or to an archive folder, with
+    one bulk_move per chunk instead of one move_to_trash per email'''
+
+    def __init__(self, account, chunkSize=CLEANUP_CHUNK_SIZE, folder=None):
+        self.account = account
+        self.chunkSize = chunkSize
+        self.folder = folder
+        if folder is None and account is not None:
+            self.folder = account.trash
+        self.pending = []
+        self.moved = 0
+        self.errors = 0
+
+    def add(self, email):
+        '''Queues an email whose record is confirmed saved'''
+        self.pending.append(email)
+        if len(self.pending) >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        '''Moves the queued emails, reporting any that could not be moved'''
+        emails, self.pending = self.pending, []
+        if not emails:
+            return
+
+        if self.account is None:
+            results = []
+            for email in emails:
+                try:
+                    email.move_to_trash()
+                    results.append(True)
+                except Exception as excep:
+                    results.append(excep)
+        else:
+            results = self.account.bulk_move(ids=emails, to_folder=self.folder,
+                                             chunk_size=self.chunkSize)
+
+        for email, result in zip(emails, results):
+            if isinstance(result, Exception):
+                self.errors += 1
+                print(f"Error: Moving '{email.subject}': {result}")
+            else:
+                self.moved += 1
+
+
+def isSuccess(subject):
+    '''Validates the subject is the type we are looking for'''
+    subject = subject.lower().replace('re: ', '').replace('fw: ', '')
+    return SUCCESS_SUBJECT in subject
+
+
+def getSuccess(emails, state=None, sink=None, cleanup=None):
     '''Validates the email is the type we are looking for'''
+    if sink is None:
+        sink = SuccessRecordSink()
+    if cleanup is None:
+        cleanup = MailboxCleanup(None)
+
+    held = {}       # change number -> emails waiting for their record to be saved
+    received = []   # (datetime_received, change number) in the order read
+    saved = set()
+
+    def confirm(changeNumbers):
+        '''Queues the emails of records the API confirmed saved for cleanup'''
+        if state is not None:
+            state.markProcessed(changeNumbers)
+        for changeNumber in changeNumbers:
+            saved.add(changeNumber)
+            for email in held.pop(changeNumber, []):
+                cleanup.add(email)
+
     for email in emails:
-        subject = email.subject.lower().replace('re: ', '').replace('fw: ', '')
-        if "prod: change number" in subject:
-            parseSuccessString(email.body)
-            email.move_to_trash()
-            
-    
-def parseSuccessString(message):
-    '''Parses the email to pull out key details for the database'''
-    changePattern = '[a-zA-Z]{2,3}-\d*'
-    timePattern = '\d*:\d*\s[A,P,M].'
-    datePattern = '\d./\d./\d.'
+        if isinstance(email, FetchFailed):
+            # Never handled, so the watermark stops before it
+            received.append((email.datetime_received, None))
+            continue
+        if isSuccess(email.subject):
+            try:
+                changeNumber, time, date = parseSuccessString(email.body)
+            except SuccessParseError as excep:
+                # Left in the folder for someone to look at
+                print(f"Error: Parsing '{email.subject}': {excep}")
+                continue
+            received.append((email.datetime_received, changeNumber))
+
+            if state is not None and state.isProcessed(changeNumber):
+                saved.add(changeNumber)
+                cleanup.add(email)
+                continue
 
-    #get change number - CO-123456
-    match = re.search(changePattern, message)
-    changeNumber = match.group(0)   
-    #get time - 06:12 PM
-    match = re.search(timePattern, message)
-    time = match.group(0)
-    #get date - 05/16/22
-    match = re.search(datePattern, message)
-    date = match.group(0)
+            held.setdefault(changeNumber, []).append(email)
+            confirm(sink.add(changeNumber, time, date))
 
-    saveSuccessRecord(changeNumber,time,date)
+    # Emails whose record was spooled are kept so they are tried again
+    confirm(sink.close())
+    cleanup.flush()
+    print(f"Cleaned up {cleanup.moved} emails, {cleanup.errors} failed")
 
+    if state is not None:
+        for emailReceived, changeNumber in received:
+            state.advance(emailReceived, changeNumber in saved)
+        state.save()
 
-def saveSuccessRecord(cn,time,date):
+
+
+def parseSuccessString(message):
+    '''Parses the email to pull out key details for the database.
+    Raises SuccessParseError if a detail is missing'''
+    #change number - CO-123456, time - 06:12 PM, date - 05/16/22
+    record = parseSuccess(message)
+    return record.changeNumber, record.time, record.date
+
+
+def saveSuccessRecord(cn,time,date,url=URL):
     '''Send the data gather to an REST API to store the data for reporting and visualization'''
     #call to api to store record
-    url ='https://website.com/success'
     body = {'changenumber':cn,'date':date,'time':time}
     header = {'Content-Type': 'application/x-www-form-urlencoded'}
 
@@ -69,7 +235,8 @@ def saveSuccessRecord(cn,time,date):
     #Handle errors from API
     if not resp.ok:
         print(f"Error: Saving {cn}")
-    
+    return resp.ok
+
 
 def get_recent_emails(account, folder_name, count):
     """Retrieves "count" number of emails for a given folder"""
@@ -80,6 +247,52 @@ def get_recent_emails(account, folder_name, count):
     return folder.all().order_by('-datetime_received')[:count]
 
 
+def get_success_emails(account, folder_name, count, since=None, pageSize=PAGE_SIZE, newestFirst=True):
+    """Retrieves up to "count" success emails for a given folder.
+
+    Exchange does the subject (and optional received date) filtering and
+    only sends the subjects back. Bodies are then fetched, a page at a
+    time, for the emails that pass isSuccess. Incremental runs read the
+    oldest emails first so the watermark only ever moves forward."""
+    folder = account.root / 'Top of Information Store' / folder_name
+
+    query = folder.filter(subject__icontains=SUCCESS_SUBJECT)
+    if since is not None:
+        query = query.filter(datetime_received__gt=since)
+    query = query.only('subject', 'datetime_received').order_by(
+        '-datetime_received' if newestFirst else 'datetime_received')
+    query.page_size = pageSize
+
+    # Read all of the (small) subject-only items first, so moving emails
+    # out of the folder while they are processed can't shift the paging
+    matches = [email for email in query[:count] if isSuccess(email.subject)]
+
+    for start in range(0, len(matches), pageSize):
+        yield from fetchBodies(account, matches[start:start + pageSize])
+
+
+class FetchFailed:
+    '''Stands in for an email whose body could not be fetched, so getSuccess
+    can keep the watermark from moving past it'''
+
+    def __init__(self, email, error):
+        self.subject = email.subject
+        self.datetime_received = email.datetime_received
+        self.error = error
+
+
+def fetchBodies(account, emails):
+    '''Fetches the subject and body of emails in a single request. Emails
+    that can't be fetched come back as FetchFailed'''
+    fetched = account.fetch(ids=emails, only_fields=['subject', 'body', 'datetime_received'])
+    for email, result in zip(emails, fetched):
+        if isinstance(result, Exception):
+            print(f"Error: Fetching '{email.subject}': {result}")
+            yield FetchFailed(email, result)
+            continue
+        yield result
+
+
 def emailLogin():
     '''Login to the exchange server. Returns an "account" object used
     to interact with the exchange server'''
@@ -92,15 +305,45 @@ def emailLogin():
 
     return account
 
+def getArgs():
+    '''Reads the command line arguments'''
+    parser = argparse.ArgumentParser(description='Saves success notifications from Exchange')
+    parser.add_argument('--state', metavar='FILE', default=None,
+                        help='only read emails newer than the last run recorded in FILE')
+    parser.add_argument('--batch-size', metavar='N', type=int, default=BATCH_SIZE,
+                        help='records sent to the API together')
+    parser.add_argument('--bulk-url', metavar='URL', default=BULK_URL,
+                        help='post each batch to this bulk endpoint as one JSON list')
+    parser.add_argument('--cleanup-chunk', metavar='N', type=int, default=CLEANUP_CHUNK_SIZE,
+                        help='processed emails moved per request')
+    parser.add_argument('--archive-folder', metavar='NAME', default=None,
+                        help='move processed emails to this folder instead of the trash')
+    return parser.parse_args()
+
+
 def main():
+    args = getArgs()
+
     # Connection details
     account = emailLogin()
 
     print ('Connected')
-   
-    emails = get_recent_emails(account, 'Success', 1000)
+
+    state = None
+    if args.state:
+        state = MailState(args.state)
+        state.load()
+
+    since = state.lastReceived if state else None
+    emails = get_success_emails(account, 'Success', 1000, since, newestFirst=state is None)
     
-    getSuccess(emails)
+    folder = None
+    if args.archive_folder:
+        folder = account.root / 'Top of Information Store' / args.archive_folder
+    cleanup = MailboxCleanup(account, args.cleanup_chunk, folder)
+
+    getSuccess(emails, state, SuccessRecordSink(bulkUrl=args.bulk_url, batchSize=args.batch_size),
+               cleanup)
 
     
 if __name__ == '__main__':
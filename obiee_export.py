@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# File name: obiee_export.py
+# Description: Exports OBIEE reports as CSV over plain HTTP, using the
+#   browser only to log in, or not at all
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import os
+import sys
+import time
+import argparse
+import threading
+from urllib.parse import quote, urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+BASE_URL = 'https://website/analytics/saw.dll'
+REPORT_FOLDER = '/shared/Staffing'  # catalog folder the reports are saved in
+CHUNK_SIZE = 1024*1024              # bytes written to disk at a time
+TIMEOUT = 15*60                     # seconds, big reports take a while to run
+SESSION_COOKIE = 'ORA_BIPS_NQID'    # set by OBIEE once the log in works
+
+
+class ObieeSessionError(Exception):
+    '''Raised when OBIEE sends back its log in page instead of a report'''
+
+
+class ObieeExportSession:
+    '''One authenticated requests.Session that exports any number of reports
+    through saw.dll?Go, so a batch of reports pays for one log in and no
+    browser at all after it'''
+
+    def __init__(self, baseUrl=BASE_URL, reportFolder=REPORT_FOLDER, verify=True):
+        self.baseUrl = baseUrl
+        self.reportFolder = reportFolder
+        self.session = requests.Session()
+        self.session.verify = verify
+
+    def loginFromBrowser(self, browser):
+        '''Copies the cookies of a browser that is already logged in'''
+        for cookie in browser.get_cookies():
+            self.session.cookies.set(cookie['name'], cookie['value'],
+                                     domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        if SESSION_COOKIE not in self.session.cookies:
+            raise ObieeSessionError('The browser is not logged in to OBIEE')
+
+    def login(self, username, password):
+        '''Logs in by posting the same form the log in page does'''
+        resp = self.session.post(self.baseUrl + '?bieehome',
+                                 data={'NQUser': username, 'NQPassword': password},
+                                 timeout=60)
+        resp.raise_for_status()
+        if SESSION_COOKIE not in self.session.cookies:
+            raise ObieeSessionError(f'Logging in to {self.baseUrl} as {username} failed')
+
+    def reportPath(self, reportName):
+        '''Catalog path of a report, e.g. /shared/Staffing/<report name>'''
+        if reportName.startswith('/'):
+            return reportName
+        return f"{self.reportFolder}/{reportName}"
+
+    def exportUrl(self, reportName):
+        return f"{self.baseUrl}?Go&Path={quote(self.reportPath(reportName))}&Format=csv&Extension=.csv"
+
+    def exportReport(self, reportName, savePath, chunkSize=CHUNK_SIZE):
+        '''Streams a report to savePath/<report name>.csv a chunk at a time.
+        Written to a .part file first, so a finished file is always whole,
+        and the .part file is removed if the download fails.
+        Returns the path of the file and its size'''
+        fileName = os.path.basename(self.reportPath(reportName)) + '.csv'
+        filePath = os.path.join(savePath, fileName)
+        partPath = filePath + '.part'
+
+        with self.session.get(self.exportUrl(reportName), stream=True, timeout=TIMEOUT) as resp:
+            resp.raise_for_status()
+            # An expired session gets the log in page back with a 200
+            if 'html' in resp.headers.get('Content-Type', ''):
+                raise ObieeSessionError(f"OBIEE sent a page instead of {reportName}, the session may have expired")
+
+            size = 0
+            try:
+                with open(partPath, 'wb') as csvFile:
+                    for chunk in resp.iter_content(chunk_size=chunkSize):
+                        csvFile.write(chunk)
+                        size += len(chunk)
+            except BaseException:
+                if os.path.exists(partPath):
+                    os.remove(partPath)
+                raise
+        os.replace(partPath, filePath)
+        return filePath, size
+
+    def exportReports(self, reportNames, savePath, chunkSize=CHUNK_SIZE):
+        '''Exports every report in one session. Returns report name ->
+        file path, or the exception if that report failed'''
+        results = {}
+        for reportName in reportNames:
+            start = time.monotonic()
+            try:
+                filePath, size = self.exportReport(reportName, savePath, chunkSize)
+            except (requests.RequestException, ObieeSessionError, OSError) as excep:
+                print (f"Error: Exporting {reportName}: {excep}")
+                results[reportName] = excep
+                continue
+            print (f"Exported {reportName} ({size} bytes in {time.monotonic() - start:.1f}s)")
+            results[reportName] = filePath
+        return results
+
+    def close(self):
+        self.session.close()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''Stands in for saw.dll when testing: takes any log in and serves
+    <report name>.csv files from the stub's directory'''
+    directory = '.'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Set-Cookie', f'{SESSION_COOKIE}=stub; Path=/')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        if SESSION_COOKIE not in self.headers.get('Cookie', ''):
+            return self.reply(200, 'text/html', b'<html>Sign In</html>')
+        filePath = os.path.join(self.directory, os.path.basename(query.get('Path', [''])[0]) + '.csv')
+        if not os.path.isfile(filePath):
+            return self.reply(404, 'text/plain', b'No such report')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(os.path.getsize(filePath)))
+        self.end_headers()
+        with open(filePath, 'rb') as csvFile:
+            while True:
+                chunk = csvFile.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+    def reply(self, status, contentType, body):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def startStub(directory, port=0):
+    '''Starts the stub saw.dll in a background thread.
+    Returns the server and the base URL to give ObieeExportSession'''
+    handler = type('Handler', (StubHandler,), {'directory': directory})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/analytics/saw.dll"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exports OBIEE reports as CSV without a browser')
+    parser.add_argument('reports', nargs='+', help='report names or catalog paths')
+    parser.add_argument('--save-path', default='/downloads')
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--report-folder', default=REPORT_FOLDER)
+    parser.add_argument('--stub', metavar='DIR', default=None,
+                        help='serve the reports from DIR on a local stub instead of OBIEE')
+    args = parser.parse_args()
+
+    if args.stub:
+        server, args.base_url = startStub(args.stub)
+
+    export = ObieeExportSession(args.base_url, args.report_folder)
+    try:
+        export.login(os.environ.get('USER'), os.environ.get('PWD'))
+        results = export.exportReports(args.reports, args.save_path)
+    finally:
+        export.close()
+        if args.stub:
+            server.shutdown()
+    return 0 if all(isinstance(result, str) for result in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
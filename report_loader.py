@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# File name: report_loader.py
+# Description: Loads downloaded OBIEE CSV reports into a database, writing
+#   only the rows that changed since the last refresh
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import re
+import sys
+import csv
+import time
+import sqlite3
+import hashlib
+import argparse
+import datetime
+
+DB_PATH = 'reports.db'
+CHUNK_SIZE = 5000       # CSV rows read, hashed and written at a time
+LOOKUP_SIZE = 500       # keys per "IN (...)" lookup, under SQLite's variable limit
+
+# Bookkeeping columns added to every report table
+KEY_COLUMN = '_key'     # the key columns joined, or the row hash (and occurrence) without keys
+HASH_COLUMN = '_hash'   # hash of the raw row, to spot changed rows
+SEPARATOR = '\x1f'
+
+
+def columnName(header):
+    '''SQL friendly name for a CSV header or report name,
+    e.g. "Schedule Date" -> schedule_date'''
+    name = re.sub(r'\W+', '_', header.strip().lower()).strip('_')
+    return name if name and not name[0].isdigit() else f"c_{name}"
+
+
+# A number written with thousands separators, e.g. 1,234,567.5
+GROUPED_NUMBER = re.compile(r'[-+]?\d{1,3}(,\d{3})+(\.\d*)?%?')
+
+
+def withoutSeparators(value):
+    '''value without its thousands separators. Commas anywhere else, as in
+    "1,2", mean it isn't a number'''
+    if ',' in value and not GROUPED_NUMBER.fullmatch(value):
+        raise ValueError(f'{value!r} is not a number')
+    return value.replace(',', '')
+
+
+def toInt(value):
+    return int(withoutSeparators(value))
+
+
+def toFloat(value):
+    return float(withoutSeparators(value).rstrip('%'))
+
+
+def toDate(value):
+    '''OBIEE writes dates as 5/16/2022, stored as 2022-05-16 so they sort'''
+    return datetime.datetime.strptime(value, '%m/%d/%Y').date().isoformat()
+
+
+# Column type -> converter. Columns are TEXT unless a type is declared,
+# since a guess from the first rows turns ids like 00123 into numbers
+CONVERTERS = {
+    'INTEGER': toInt,
+    'REAL': toFloat,
+    'DATE': toDate,
+    'TEXT': str,
+}
+
+# Keys of duplicate rows listed in the log, the rest are only counted
+DUPLICATES_SHOWN = 10
+
+
+def columnType(declaration):
+    '''Parses a COLUMN=TYPE command line declaration'''
+    column, _, typeName = declaration.rpartition('=')
+    typeName = typeName.strip().upper()
+    if not column or typeName not in CONVERTERS:
+        raise argparse.ArgumentTypeError(
+            f"{declaration!r} is not COLUMN=TYPE with TYPE one of {', '.join(CONVERTERS)}")
+    return column, typeName
+
+
+def convertRow(row, converters):
+    '''Typed values for a row. A value that doesn't fit its column's type
+    is kept as text rather than dropping the row'''
+    values = []
+    for value, convert in zip(row, converters):
+        if value == '':
+            values.append(None)
+            continue
+        try:
+            values.append(convert(value))
+        except ValueError:
+            values.append(value)
+    return values
+
+
+def rowHash(row):
+    return hashlib.sha1(SEPARATOR.join(row).encode()).hexdigest()
+
+
+def readChunks(csvPath, chunkSize=CHUNK_SIZE):
+    '''Yields the header, then lists of at most chunkSize rows'''
+    # OBIEE starts its CSVs with a byte order mark
+    with open(csvPath, newline='', encoding='utf-8-sig') as csvFile:
+        reader = csv.reader(csvFile)
+        yield next(reader)
+        chunk = []
+        for row in reader:
+            if not any(row):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunkSize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class ReportLoader:
+    '''Keeps a table in step with the latest download of a report.
+
+    The CSV is read a chunk at a time. Columns are stored as TEXT unless
+    columnTypes declares their type, e.g. {'Schedule Date': 'DATE'}. Each row is hashed
+    and only rows that are new, or whose hash changed, are written with one
+    executemany per chunk; rows that are gone from the report are deleted.
+    The whole refresh is one transaction, so readers never see half of it.
+
+    Rows are matched on keyColumns. A row whose key was already read is
+    counted as a duplicate and logged, and the first row with the key is
+    kept. Without key columns the row hash is the key, so a changed row is
+    a delete and an insert. Identical rows are told apart by how many
+    copies of the row were read before them, so none of the copies are
+    dropped'''
+
+    def __init__(self, dbPath=DB_PATH, table=None, keyColumns=(), indexColumns=(),
+                 chunkSize=CHUNK_SIZE, deleteMissing=True, columnTypes=None):
+        self.dbPath = dbPath
+        self.table = table
+        self.keyColumns = [columnName(column) for column in keyColumns]
+        self.indexColumns = [columnName(column) for column in indexColumns]
+        self.columnTypes = {columnName(column): typeName.upper()
+                            for column, typeName in (columnTypes or {}).items()}
+        unknown = [typeName for typeName in self.columnTypes.values() if typeName not in CONVERTERS]
+        if unknown:
+            raise ValueError(f"Unknown column types {', '.join(unknown)}")
+        self.chunkSize = chunkSize
+        self.deleteMissing = deleteMissing
+        self.con = sqlite3.connect(dbPath)
+        self.con.execute('PRAGMA journal_mode=WAL')
+        self.con.execute('PRAGMA synchronous=NORMAL')
+
+    def existingColumns(self):
+        '''Column name -> type of the table, empty if it doesn't exist yet'''
+        return {row[1]: row[2] for row in self.con.execute(f'PRAGMA table_info("{self.table}")')}
+
+    def prepareTable(self, columns):
+        '''Creates the table, or adds columns the report has gained.
+        Returns the converter for each column'''
+        missing = [column for column in self.columnTypes if column not in columns]
+        if missing:
+            raise ValueError(f"Can't type {', '.join(missing)}, the report has no such column")
+        types = [self.columnTypes.get(column, 'TEXT') for column in columns]
+
+        existing = self.existingColumns()
+        if not existing:
+            definitions = ', '.join(f'"{column}" {typeName}' for column, typeName in zip(columns, types))
+            self.con.execute(f'CREATE TABLE "{self.table}" ("{KEY_COLUMN}" TEXT PRIMARY KEY, '
+                             f'"{HASH_COLUMN}" TEXT NOT NULL, {definitions})')
+            existing = dict(zip(columns, types))
+        else:
+            for column, typeName in zip(columns, types):
+                if column not in existing:
+                    self.con.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{column}" {typeName}')
+                    existing[column] = typeName
+
+        for column in self.indexColumns:
+            if column not in existing:
+                raise ValueError(f"Can't index {column}, the report has no such column")
+            self.con.execute(f'CREATE INDEX IF NOT EXISTS "idx_{self.table}_{column}" '
+                             f'ON "{self.table}" ("{column}")')
+
+        # The table's types win, so a column keeps its type between refreshes
+        return [CONVERTERS.get(existing[column], str) for column in columns]
+
+    def storedHashes(self, keys):
+        '''Key -> stored row hash for the keys already in the table'''
+        hashes = {}
+        for start in range(0, len(keys), LOOKUP_SIZE):
+            batch = keys[start:start + LOOKUP_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            hashes.update(self.con.execute(
+                f'SELECT "{KEY_COLUMN}", "{HASH_COLUMN}" FROM "{self.table}" '
+                f'WHERE "{KEY_COLUMN}" IN ({placeholders})', batch))
+        return hashes
+
+    def load(self, csvPath):
+        '''Refreshes the table from a CSV. Returns counts of the rows read,
+        inserted, updated, unchanged and deleted'''
+        start = time.monotonic()
+        stats = dict(read=0, inserted=0, updated=0, unchanged=0, duplicates=0, deleted=0)
+        chunks = readChunks(csvPath, self.chunkSize)
+        columns = [columnName(header) for header in next(chunks)]
+        if self.table is None:
+            self.table = columnName(csvPath.rsplit('/', 1)[-1].rsplit('.', 1)[0])
+
+        missing = [column for column in self.keyColumns if column not in columns]
+        if missing:
+            raise ValueError(f"{csvPath} has no {', '.join(missing)} column")
+        keyIndexes = [columns.index(column) for column in self.keyColumns]
+
+        columnList = ', '.join(f'"{column}"' for column in [KEY_COLUMN, HASH_COLUMN] + columns)
+        upsert = (f'INSERT OR REPLACE INTO "{self.table}" ({columnList}) '
+                  f'VALUES ({", ".join("?" * (len(columns) + 2))})')
+
+        with self.con:
+            self.con.execute('CREATE TEMP TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY)')
+            self.con.execute('DELETE FROM seen')
+            converters = None
+            occurrences = {}    # row hash -> copies read so far, without key columns
+            keysRead = set()    # with key columns
+            duplicates = []
+
+            for chunk in chunks:
+                if converters is None:
+                    converters = self.prepareTable(columns)
+
+                rows = {}
+                for row in chunk:
+                    row = (row + [''] * len(columns))[:len(columns)]
+                    hashed = rowHash(row)
+                    if keyIndexes:
+                        key = SEPARATOR.join(row[i] for i in keyIndexes)
+                        if key in keysRead:
+                            stats['duplicates'] += 1
+                            if len(duplicates) < DUPLICATES_SHOWN:
+                                duplicates.append(key.replace(SEPARATOR, '/'))
+                            continue
+                        keysRead.add(key)
+                    else:
+                        copies = occurrences.get(hashed, 0)
+                        occurrences[hashed] = copies + 1
+                        key = f"{hashed}{SEPARATOR}{copies}" if copies else hashed
+                    rows[key] = (hashed, row)
+                stats['read'] += len(chunk)
+
+                stored = self.storedHashes(list(rows))
+                changed = []
+                for key, (hashed, row) in rows.items():
+                    if stored.get(key) == hashed:
+                        stats['unchanged'] += 1
+                        continue
+                    stats['updated' if key in stored else 'inserted'] += 1
+                    changed.append([key, hashed] + convertRow(row, converters))
+
+                self.con.executemany(upsert, changed)
+                self.con.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((key,) for key in rows))
+
+            if duplicates:
+                print (f"{csvPath} has {stats['duplicates']} rows with a key already read, "
+                       f"kept the first of each: {', '.join(duplicates)}"
+                       + (', ...' if stats['duplicates'] > len(duplicates) else ''))
+            if converters is None:
+                print (f"{csvPath} has no rows, leaving {self.table} as it is")
+            elif self.deleteMissing:
+                stats['deleted'] = self.con.execute(
+                    f'DELETE FROM "{self.table}" WHERE "{KEY_COLUMN}" NOT IN (SELECT key FROM seen)').rowcount
+
+        print (f"Loaded {csvPath} into {self.table} in {time.monotonic() - start:.1f}s: "
+               + ', '.join(f"{count} {name}" for name, count in stats.items()))
+        return stats
+
+    def close(self):
+        self.con.close()
+
+
+def loadReport(csvPath, dbPath=DB_PATH, table=None, keyColumns=(), indexColumns=(), chunkSize=CHUNK_SIZE,
+               columnTypes=None):
+    '''Loads one CSV with a loader of its own'''
+    loader = ReportLoader(dbPath, table, keyColumns, indexColumns, chunkSize, columnTypes=columnTypes)
+    try:
+        return loader.load(csvPath)
+    finally:
+        loader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Loads OBIEE CSV reports into a database')
+    parser.add_argument('csv', nargs='+', help='downloaded reports')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--table', default=None,
+                        help='table to load into (default: named after the CSV)')
+    parser.add_argument('--key', action='append', default=[],
+                        help='column that identifies a row, may be repeated')
+    parser.add_argument('--index', action='append', default=[],
+                        help='column to index for the queries that filter on it, may be repeated')
+    parser.add_argument('--type', action='append', default=[], type=columnType, metavar='COLUMN=TYPE',
+                        help=f"type of a column, one of {', '.join(CONVERTERS)} (default TEXT), "
+                             'may be repeated')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    for csvPath in args.csv:
+        loadReport(csvPath, args.db, args.table, args.key, args.index, args.chunk_size, dict(args.type))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
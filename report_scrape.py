@@ -4,15 +4,46 @@
 # Author: Maurice Strickland
 # Date: 2022-05-16
 
+import sys
+import json
 import time
+import random
+import signal
+import subprocess
 import datetime
 import os
+import queue
+import shutil
+import argparse
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+from selenium.webdriver.firefox.options import Options
+from selenium.common.exceptions import TimeoutException
 
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+from obiee_export import ObieeExportSession, BASE_URL, SESSION_COOKIE
+from report_loader import loadReport, columnName, columnType, CONVERTERS
+
+DOWNLOAD_TIMEOUT = 15*60    # seconds
+STABLE_FOR = 2              # seconds the finished file's size must hold
+POLL_INTERVAL = 0.5         # seconds, when inotify is not available
+REPORT_NAME = "Staffing - Schedule Time - Direct Access"
+MAX_ATTEMPTS = 5            # scrapes tried before giving up
+ATTEMPT_DEADLINE = 30*60    # seconds before an attempt and its browser are killed
+BACKOFF = 60                # seconds before the first retry, doubled after each one
+MAX_BACKOFF = 30*60         # seconds, longest wait between attempts
+TIMINGS_PATH = "scrape_timings.jsonl"
+PROFILE_DIR = "/tmp/obiee-profile"    # built once by buildProfile, copied by every browser
 
 def setup(savePath):
     '''Setup for the FireFox webdriver'''
@@ -44,24 +75,86 @@ def setup(savePath):
     return profile
 
 
-def runScrape(savePath):
-    '''Main function to scrape the page and initate the report download'''
-    profile = setup(savePath)
+def downloadFinished(filePath):
+    '''Firefox writes to "<name>.part" and renames it when it is done'''
+    return (os.path.exists(filePath) and not os.path.exists(filePath + '.part')
+            and os.path.getsize(filePath) > 0)
+
+
+def waitForStableSize(filePath, deadline, stableFor=STABLE_FOR):
+    '''Waits until the file size has not changed for stableFor seconds'''
+    size = os.path.getsize(filePath)
+    stableSince = time.monotonic()
+    while time.monotonic() - stableSince < stableFor:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{filePath} is still changing")
+        time.sleep(min(POLL_INTERVAL, stableFor))
+        newSize = os.path.getsize(filePath)
+        if newSize != size:
+            size = newSize
+            stableSince = time.monotonic()
+
+
+def waitForDownload(savePath, fileName, timeout=DOWNLOAD_TIMEOUT):
+    '''Returns as soon as fileName is fully downloaded to savePath. Watches the
+    directory with inotify when inotify_simple is installed, polls otherwise'''
+    filePath = os.path.join(savePath, fileName)
+    deadline = time.monotonic() + timeout
+
+    if INotify is not None:
+        inotify = INotify()
+        try:
+            inotify.add_watch(savePath, flags.MOVED_TO | flags.CLOSE_WRITE | flags.CREATE | flags.DELETE)
+            # Checked after the watch is added so a rename can't be missed
+            while not downloadFinished(filePath):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"{fileName} was not downloaded in {timeout}s")
+                inotify.read(timeout=int(min(remaining, 1) * 1000))
+        finally:
+            inotify.close()
+    else:
+        while not downloadFinished(filePath):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{fileName} was not downloaded in {timeout}s")
+            time.sleep(POLL_INTERVAL)
+
+    waitForStableSize(filePath, deadline)
+    return filePath
+
+
+def buildProfile(savePath, profileDir):
+    '''Saves the profile from setup to profileDir once, so later browsers
+    start from it instead of setting every preference again'''
+    if not os.path.isdir(profileDir):
+        shutil.copytree(setup(savePath).path, profileDir)
+    return profileDir
+
+
+def createBrowser(savePath, profileDir=None, headless=False):
+    '''Starts Firefox with a profile that saves downloads to savePath,
+    copied from profileDir when one is given'''
+    if profileDir:
+        profile = webdriver.FirefoxProfile(buildProfile(savePath, profileDir))
+        profile.set_preference("browser.download.dir", savePath)
+        profile.update_preferences()
+    else:
+        profile = setup(savePath)
 
     caps = DesiredCapabilities.FIREFOX.copy()
     caps["firefox_profile"] = profile.encoded
     caps["marionette"] = True
 
-    browser = webdriver.Firefox(executable_path="/geckodriver",firefox_profile = profile,capabilities = caps)
-    url = "https://website/analytics/saw.dll?bieehome"
-    browser.get(url)
+    options = Options()
+    options.headless = headless
 
-    #waits
-    short_wait = WebDriverWait(browser, 10)
-    long_wait = WebDriverWait(browser, 15*60)
+    return webdriver.Firefox(executable_path="/geckodriver",firefox_profile = profile,capabilities = caps,options = options)
 
 
-    #log in
+def login(browser, baseUrl=BASE_URL, waitForSession=False):
+    '''Logs the browser in to OBIEE with the USER and PWD environment variables.
+    waitForSession waits for the session cookie, for callers that need it'''
+    browser.get(baseUrl + "?bieehome")
 
     username = browser.find_element_by_id("sawlogonuser") #username field
     password = browser.find_element_by_id("sawlogonpwd") #password field'
@@ -71,11 +164,31 @@ def runScrape(savePath):
     submitButton = browser.find_element_by_id("idlogon")
     submitButton.click()
 
-    #Report link
+    #OBIEE sets its session cookie once the log in works
+    if waitForSession:
+        WebDriverWait(browser, 30).until(lambda b: b.get_cookie(SESSION_COOKIE))
 
 
-    short_wait.until(EC.presence_of_element_located((By.LINK_TEXT, "Staffing - Schedule Time - Direct Access")))
-    reportLink = browser.find_element_by_link_text("Staffing - Schedule Time - Direct Access")
+def downloadReport(browser, reportName, savePath, baseUrl=BASE_URL, timer=None):
+    '''Runs a report from the home page of a logged in browser and exports
+    it as CSV. Returns the path of the downloaded file'''
+    timer = timer or StepTimer()
+
+    #waits
+    short_wait = WebDriverWait(browser, 10)
+    long_wait = WebDriverWait(browser, 15*60)
+
+    #An old copy would make Firefox save this one as "<name>(1).csv"
+    filePath = os.path.join(savePath, reportName + ".csv")
+    if os.path.exists(filePath):
+        os.remove(filePath)
+
+    timer.begin('report load')
+    browser.get(baseUrl + "?bieehome")
+
+    #Report link
+    short_wait.until(EC.presence_of_element_located((By.LINK_TEXT, reportName)))
+    reportLink = browser.find_element_by_link_text(reportName)
     reportLink.click()
 
 
@@ -86,53 +199,344 @@ def runScrape(savePath):
 
 
     #Export report
-    long_wait.until(EC.presence_of_element_located((By.PARTIAL_LINK_TEXT, "Export")))
+    long_wait.until(EC.element_to_be_clickable((By.PARTIAL_LINK_TEXT, "Export")))
+    timer.begin('export')
     export_button = browser.find_element_by_partial_link_text("Export")
     browser.execute_script("arguments[0].click()", export_button)
-    time.sleep(10)
 
     #download CSV
-    short_wait.until(EC.presence_of_element_located((By.LINK_TEXT, "Data")))
+    short_wait.until(EC.element_to_be_clickable((By.LINK_TEXT, "Data")))
     data_button = browser.find_element_by_link_text("Data")
     data_button.click()
     print ("Data button clicked")
 
-    time.sleep(10)
-    short_wait.until(EC.presence_of_element_located((By.LINK_TEXT, "CSV")))
+    short_wait.until(EC.element_to_be_clickable((By.LINK_TEXT, "CSV")))
     csv_button = browser.find_element_by_link_text("CSV")
     csv_button.click()
     print ("Csv Button Clicked")
 
-    time.sleep(10)
-
     #need to know when download is done
     long_wait.until(EC.presence_of_element_located((By.XPATH,"//span[contains(text(), 'Confirmation')]")))
     print ("Download started")
-    time.sleep(10)
 
-    max_polls = 2000
-    polls = 0
+    timer.begin('download')
+    filePath = waitForDownload(savePath, reportName + ".csv")
+    timer.end()
+    return filePath
 
-    while polls < max_polls:
-        for file1 in os.listdir(savePath):
-            print (file1)
-            if file1 == "Staffing - Schedule Time - Direct Access.csv":
-                print ('Finished downloading')
-                break
-        time.sleep(10)
-        polls += 1
-        break
 
-    time.sleep(5)
-    browser.quit()
+def runScrape(savePath, timer=None, reports=(REPORT_NAME,)):
+    '''Main function to scrape the page and initate the report downloads,
+    one after the other in the same browser'''
+    timer = timer or StepTimer()
+    timer.begin('browser start')
+    browser = createBrowser(savePath)
+    try:
+        #log in
+        timer.begin('login')
+        login(browser)
 
-def main():
-    savePath = "/downloads"
-    #Ensures file does not already exist
-    while not os.path.exists(savePath + "/Staffing - Schedule Time - Direct Access.csv"):
-        print ("Running Scrape")
+        for reportName in reports:
+            downloadReport(browser, reportName, savePath, timer=timer)
+        print ('Finished downloading')
+    except Exception as excep:
+        timer.fail(excep)
+        if not isinstance(excep, (TimeoutError, TimeoutException)):
+            raise
+        print (excep)
+    finally:
+        browser.quit()
+
+
+def backoffDelay(attempt, backoff=BACKOFF, maxBackoff=MAX_BACKOFF):
+    '''Exponential backoff with jitter: half the delay is fixed and half is
+    random, so retries back off but don't all line up'''
+    delay = min(maxBackoff, backoff * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def killProcessGroup(proc):
+    '''Kills an attempt along with the geckodriver and Firefox it started,
+    which share its process group. If the attempt somehow ended up in our
+    own process group only the attempt itself is killed'''
+    try:
+        group = os.getpgid(proc.pid)
+        if group != os.getpgid(0):
+            os.killpg(group, signal.SIGKILL)
+        else:
+            print ("Attempt is in our process group, killing only the attempt")
+            proc.kill()
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+def missingReports(savePath, reports):
+    '''The reports not downloaded to savePath yet'''
+    return [reportName for reportName in reports
+            if not os.path.exists(os.path.join(savePath, reportName + ".csv"))]
+
+
+def scheduleScrape(savePath, attempts=MAX_ATTEMPTS, deadline=ATTEMPT_DEADLINE,
+                   backoff=BACKOFF, maxBackoff=MAX_BACKOFF, timingsPath=TIMINGS_PATH,
+                   reports=(REPORT_NAME,)):
+    '''Runs runScrape until the reports are downloaded, at most "attempts" times.
+    Each attempt runs in its own process group so one that passes its
+    deadline can be killed with its browser and geckodriver, and attempts
+    are spaced out by backoffDelay. An attempt only downloads the reports
+    the earlier ones didn't. Returns True if every report was downloaded'''
+    for attempt in range(attempts):
+        missing = missingReports(savePath, reports)
+        if not missing:
+            return True
+        print (f"Running Scrape, attempt {attempt + 1} of {attempts}")
         print (str(datetime.datetime.now()))
-        runScrape(savePath)
+
+        start = time.monotonic()
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--single-attempt',
+                                 '--save-path', savePath, '--timings', timingsPath,
+                                 '--attempt', str(attempt + 1), '--'] + missing,
+                                start_new_session=True)     # own session and process group
+        try:
+            status = 'ok' if proc.wait(timeout=deadline) == 0 else 'failed'
+        except subprocess.TimeoutExpired:
+            killProcessGroup(proc)
+            status = 'killed'
+            print (f"Attempt {attempt + 1} passed its {deadline}s deadline and was killed")
+
+        StepTimer(timingsPath, attempt=attempt + 1).record(
+            'attempt', time.monotonic() - start, status == 'ok', status=status)
+        if not missingReports(savePath, reports):
+            return True
+        if attempt + 1 < attempts:
+            delay = backoffDelay(attempt, backoff, maxBackoff)
+            print (f"Retrying in {delay:.0f}s")
+            time.sleep(delay)
+
+    print (f"Error: {', '.join(missingReports(savePath, reports))} "
+           f"not downloaded in {attempts} attempts")
+    return False
+
+
+class StepTimer:
+    '''Times the steps of a scrape (login, report load, export, download),
+    appending each one to a JSON lines file as soon as it finishes, so the
+    step that was running when an attempt was killed still shows up as
+    the last one started'''
+
+    def __init__(self, path=None, **context):
+        self.path = path
+        self.context = context      # e.g. the attempt number, added to every line
+        self.current = None
+        self.started = None
+        self.steps = {}             # step -> seconds
+
+    def record(self, step, seconds, ok=True, **extra):
+        self.steps[step] = seconds
+        if self.path is None:
+            return
+        line = dict(self.context, time=datetime.datetime.now().isoformat(timespec='seconds'),
+                    step=step, seconds=round(seconds, 3), ok=ok, **extra)
+        with open(self.path, 'a') as timings:
+            timings.write(json.dumps(line) + '\n')
+
+    def begin(self, step):
+        '''Ends the current step and starts timing the next one'''
+        self.end()
+        self.current = step
+        self.started = time.monotonic()
+        if self.path is not None:
+            with open(self.path, 'a') as timings:
+                timings.write(json.dumps(dict(self.context, step=step, started=True)) + '\n')
+
+    def end(self):
+        if self.current is not None:
+            self.record(self.current, time.monotonic() - self.started)
+            self.current = None
+
+    def fail(self, excep):
+        '''Records the current step as the one that failed'''
+        if self.current is not None:
+            self.record(self.current, time.monotonic() - self.started, False, error=str(excep))
+            self.current = None
+
+
+class BrowserPool:
+    '''A few logged in browsers shared by every report in a batch, so
+    starting Firefox and logging in is paid once per browser instead of
+    once per report. A browser that fails a report is thrown away and a
+    new one is started the next time one is needed'''
+
+    def __init__(self, savePath, size=2, profileDir=PROFILE_DIR, headless=True, baseUrl=BASE_URL):
+        self.savePath = savePath
+        self.size = size
+        self.profileDir = profileDir
+        self.headless = headless
+        self.baseUrl = baseUrl
+        self.idle = queue.Queue()
+        self.browsers = []
+        self.lock = threading.Lock()
+
+    def newBrowser(self):
+        browser = createBrowser(self.savePath, self.profileDir, self.headless)
+        with self.lock:
+            self.browsers.append(browser)
+        try:
+            login(browser, self.baseUrl, waitForSession=True)
+        except Exception:
+            self.discard(browser)
+            raise
+        return browser
+
+    def start(self):
+        '''Starts and logs in every browser at the same time'''
+        if self.profileDir:
+            buildProfile(self.savePath, self.profileDir)
+        with ThreadPoolExecutor(max_workers=self.size) as starter:
+            for browser in starter.map(lambda _: self.newBrowser(), range(self.size)):
+                self.idle.put(browser)
+
+    def discard(self, browser):
+        with self.lock:
+            if browser in self.browsers:
+                self.browsers.remove(browser)
+        try:
+            browser.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def browser(self):
+        '''Lends out an idle browser for one report'''
+        browser = self.idle.get()
+        if browser is None:
+            try:
+                browser = self.newBrowser()
+            except Exception:
+                self.idle.put(None)
+                raise
+        try:
+            yield browser
+        except Exception:
+            self.discard(browser)
+            self.idle.put(None)
+            raise
+        self.idle.put(browser)
+
+    def close(self):
+        with self.lock:
+            browsers, self.browsers = self.browsers, []
+        for browser in browsers:
+            try:
+                browser.quit()
+            except Exception:
+                pass
+
+
+def scrapeReports(reportNames, savePath, poolSize=2, profileDir=PROFILE_DIR, headless=True, baseUrl=BASE_URL):
+    '''Downloads every report, spread over a pool of logged in browsers.
+    Returns report name -> file path, or the exception if that report failed'''
+    pool = BrowserPool(savePath, min(poolSize, len(reportNames)), profileDir, headless, baseUrl)
+    results = {}
+
+    def download(reportName):
+        start = time.monotonic()
+        with pool.browser() as browser:
+            filePath = downloadReport(browser, reportName, savePath, baseUrl)
+        print (f"Downloaded {reportName} in {time.monotonic() - start:.0f}s")
+        return filePath
+
+    try:
+        pool.start()
+        with ThreadPoolExecutor(max_workers=pool.size) as workers:
+            futures = {workers.submit(download, reportName): reportName for reportName in reportNames}
+            for future in as_completed(futures):
+                reportName = futures[future]
+                try:
+                    results[reportName] = future.result()
+                except Exception as excep:
+                    print (f"Error: Downloading {reportName}: {excep}")
+                    results[reportName] = excep
+    finally:
+        pool.close()
+    return results
+
+def runDirectExport(savePath, reportNames, browserLogin=False, baseUrl=BASE_URL):
+    '''Exports the reports over HTTP in one session. The browser is only
+    used to log in when browserLogin is set (e.g. for single sign on)'''
+    export = ObieeExportSession(baseUrl)
+    try:
+        if browserLogin:
+            browser = createBrowser(savePath)
+            try:
+                login(browser, baseUrl, waitForSession=True)
+                export.loginFromBrowser(browser)
+            finally:
+                browser.quit()
+        else:
+            export.login(os.environ.get('USER'), os.environ.get('PWD'))
+        return export.exportReports(reportNames, savePath)
+    finally:
+        export.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Downloads OBIEE reports')
+    parser.add_argument('--save-path', default="/downloads")
+    parser.add_argument('--direct', action='store_true',
+                        help='export the reports over HTTP instead of clicking through the browser')
+    parser.add_argument('--browser-login', action='store_true',
+                        help='with --direct, log in with the browser and reuse its cookies')
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--pool-size', type=int, default=0,
+                        help='download the reports once with this many logged in browsers')
+    parser.add_argument('--profile-dir', default=PROFILE_DIR,
+                        help='pre-built Firefox profile the pooled browsers start from')
+    parser.add_argument('--show-browser', action='store_true',
+                        help='run the pooled browsers with a window instead of headless')
+    parser.add_argument('--load-db', default=None, metavar='DB',
+                        help='load the downloaded reports into this SQLite database')
+    parser.add_argument('--key', action='append', default=[],
+                        help='with --load-db, column that identifies a row, may be repeated')
+    parser.add_argument('--index', action='append', default=[],
+                        help='with --load-db, column to index, may be repeated')
+    parser.add_argument('--type', action='append', default=[], type=columnType, metavar='COLUMN=TYPE',
+                        help=f"with --load-db, type of a column, one of {', '.join(CONVERTERS)} "
+                             '(default TEXT), may be repeated')
+    parser.add_argument('--attempts', type=int, default=MAX_ATTEMPTS,
+                        help='most scrapes to try before giving up')
+    parser.add_argument('--deadline', type=int, default=ATTEMPT_DEADLINE,
+                        help='seconds before an attempt and its browser are killed')
+    parser.add_argument('--timings', default=TIMINGS_PATH,
+                        help='JSON lines file the step timings are appended to')
+    parser.add_argument('--single-attempt', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--attempt', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('reports', nargs='*', default=[REPORT_NAME])
+    args = parser.parse_args()
+    savePath = args.save_path
+
+    if args.single_attempt:
+        #One attempt run by scheduleScrape
+        runScrape(savePath, StepTimer(args.timings, attempt=args.attempt), args.reports)
+        sys.exit(1 if missingReports(savePath, args.reports) else 0)
+
+    if args.direct:
+        results = runDirectExport(savePath, args.reports, args.browser_login, args.base_url)
+    elif args.pool_size:
+        results = scrapeReports(args.reports, savePath, args.pool_size, args.profile_dir,
+                                not args.show_browser, args.base_url)
+    else:
+        if not scheduleScrape(savePath, args.attempts, args.deadline, timingsPath=args.timings,
+                              reports=args.reports):
+            sys.exit(1)
+        results = {reportName: os.path.join(savePath, reportName + ".csv")
+                   for reportName in args.reports}
+
+    if args.load_db:
+        for reportName, filePath in results.items():
+            if isinstance(filePath, str):
+                loadReport(filePath, args.load_db, columnName(reportName), args.key, args.index,
+                           columnTypes=dict(args.type))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# File name: success_parser.py
+# Description: Parses change notification emails into success records, one
+#   at a time or in batches
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+SuccessRecord = namedtuple('SuccessRecord', ['changeNumber', 'time', 'date'])
+
+# One pattern for every field, so the fields can come in any order and a
+# body missing one is reported with the fields that were found
+#   change number - CO-123456
+#   time - 06:12 PM
+#   date - 05/16/22
+FIELDS = re.compile(r'''\b(?:
+    (?P<changeNumber>[A-Za-z]{2,3}-\d+)
+  | (?P<time>\d{1,2}:\d{2}\s?[AaPp][Mm])
+  | (?P<date>\d{1,2}/\d{1,2}/\d{2,4})
+)\b''', re.VERBOSE)
+
+# Below this many bodies a process pool costs more than it saves
+POOL_THRESHOLD = 20000
+CHUNK_SIZE = 2048
+
+
+class SuccessParseError(ValueError):
+    '''Raised, or returned by parseMany, when a body is missing fields'''
+
+    def __init__(self, missing, found, body):
+        self.missing = missing      # names of the fields that were not found
+        self.found = found          # the fields that were found
+        self.snippet = body[:80]
+        super().__init__(f"Missing {', '.join(missing)} in: {self.snippet!r}")
+
+    def __reduce__(self):
+        return (SuccessParseError, (self.missing, self.found, self.snippet))
+
+
+def parseSuccess(body):
+    '''Pulls the change number, time and date out of an email body.
+    The first match of each field is used. Raises SuccessParseError if any are missing'''
+    found = {}
+    for match in FIELDS.finditer(body):
+        field = match.lastgroup
+        if field not in found:
+            found[field] = match.group(field)
+            if len(found) == 3:
+                return SuccessRecord(**found)
+
+    missing = [field for field in SuccessRecord._fields if field not in found]
+    raise SuccessParseError(missing, found, body)
+
+
+def parseOrError(body):
+    '''parseSuccess that returns the SuccessParseError instead of raising it'''
+    try:
+        return parseSuccess(body)
+    except SuccessParseError as excep:
+        return excep
+
+
+def parseMany(bodies, processes=None):
+    '''Parses a list of bodies, returning a SuccessRecord or SuccessParseError
+    for each, in order. Large batches are spread over a process pool of
+    "processes" workers (all cores when None, no pool when 0)'''
+    bodies = [str(body) for body in bodies]
+    if processes == 0 or len(bodies) < POOL_THRESHOLD:
+        return [parseOrError(body) for body in bodies]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(parseOrError, bodies, chunksize=CHUNK_SIZE))
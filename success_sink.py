@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# File name: success_sink.py
+# Description: Sends parsed success records to the REST API in batches over
+#   a pooled session, spooling anything the API can't take to disk
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import os
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+URL = 'https://website.com/success'
+BULK_URL = None     # the API has no bulk endpoint yet; set one to opt in
+BATCH_SIZE = 50
+SPOOL_PATH = 'success_spool.jsonl'
+RETRIES = 3
+BACKOFF = 1.0   # seconds, doubled on every retry
+
+
+class SuccessRecordSink:
+    '''Collects (changenumber, date, time) records and sends them a batch at a
+    time through one pooled requests.Session, so a batch pays for one
+    connection instead of one per record.
+
+    Records are posted one by one on the same session. When a bulkUrl is
+    given each batch is posted to it as a JSON list instead, falling back to
+    one by one if the API rejects the batch, so a bad record can't hold up
+    the others. Only connection errors are retried, with exponential
+    backoff: a POST that reached the API may have saved its record, so it
+    isn't sent again straight away. For the same reason records that fail
+    aren't retried during the run: they are spooled to disk, and the next
+    run's sink queues them again with loadSpool.'''
+
+    def __init__(self, url=URL, bulkUrl=BULK_URL, batchSize=BATCH_SIZE,
+                 spoolPath=SPOOL_PATH, retries=RETRIES, backoff=BACKOFF, verify=False):
+        self.url = url
+        self.bulkUrl = bulkUrl
+        self.batchSize = batchSize
+        self.spoolPath = spoolPath
+        self.verify = verify    # the API uses a self-signed cert
+        self.bulkSupported = bulkUrl is not None
+        self.pending = {}       # change number -> record
+        self.failed = {}        # change number -> record, mirrored in the spool
+        self.sent = 0
+        self.spooled = 0
+
+        # POST is left out of the retried methods, so read errors and error
+        # statuses come straight back and only failed connections retry
+        retry = Retry(total=retries, connect=retries, backoff_factor=backoff,
+                      raise_on_status=False)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(max_retries=retry))
+        self.session.mount('http://', HTTPAdapter(max_retries=retry))
+
+        self.loadSpool()
+
+    def loadSpool(self):
+        '''Queues the records left in the spool by earlier runs'''
+        if not os.path.exists(self.spoolPath):
+            return
+        with open(self.spoolPath) as spool:
+            for line in spool:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.pending.setdefault(record['changenumber'], record)
+
+    def add(self, cn, time, date):
+        '''Queues a record, sending the batch once it is full.
+        Returns the change numbers confirmed saved by that send, if any'''
+        self.pending[cn] = {'changenumber': cn, 'date': date, 'time': time}
+        if len(self.pending) >= self.batchSize:
+            return self.flush()
+        return []
+
+    def postBulk(self, records):
+        '''Sends records in one request. Returns True if the API took them all'''
+        try:
+            resp = self.session.post(self.bulkUrl, json=records, verify=self.verify)
+        except requests.RequestException as excep:
+            print(f"Error: Saving batch of {len(records)}: {excep}")
+            return False
+
+        if resp.status_code in (404, 405):
+            print("Bulk endpoint not available, sending records one at a time")
+            self.bulkSupported = False
+        return resp.ok
+
+    def postOne(self, record):
+        '''Sends a single record form-encoded, like saveSuccessRecord'''
+        try:
+            resp = self.session.post(self.url, data=record, verify=self.verify)
+        except requests.RequestException as excep:
+            print(f"Error: Saving {record['changenumber']}: {excep}")
+            return False
+
+        if not resp.ok:
+            print(f"Error: Saving {record['changenumber']}")
+        return resp.ok
+
+    def flush(self):
+        '''Sends everything queued. Returns the change numbers confirmed
+        saved; the rest are written to the spool'''
+        if not self.pending:
+            return []
+        records = list(self.pending.values())
+        self.pending = {}
+
+        if self.bulkSupported and self.postBulk(records):
+            confirmed, failed = records, []
+        else:
+            confirmed, failed = [], []
+            for record in records:
+                (confirmed if self.postOne(record) else failed).append(record)
+
+        for record in confirmed:
+            self.failed.pop(record['changenumber'], None)
+        for record in failed:
+            self.failed[record['changenumber']] = record
+        self.writeSpool(self.failed.values())
+
+        self.sent += len(confirmed)
+        self.spooled = len(self.failed)
+        return [record['changenumber'] for record in confirmed]
+
+    def writeSpool(self, records):
+        '''Replaces the spool with the records that could not be saved'''
+        if not records:
+            if os.path.exists(self.spoolPath):
+                os.remove(self.spoolPath)
+            return
+        with open(self.spoolPath + '.tmp', 'w') as spool:
+            for record in records:
+                spool.write(json.dumps(record) + '\n')
+        os.replace(self.spoolPath + '.tmp', self.spoolPath)
+
+    def close(self):
+        '''Sends what is left and closes the session'''
+        confirmed = self.flush()
+        self.session.close()
+        print(f"Saved {self.sent} records, {self.spooled} spooled for the next run")
+        return confirmed
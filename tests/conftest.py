@@ -0,0 +1,11 @@
+# File name: conftest.py
+# Description: Puts the repo root and PUM/ on the path, the way the tools
+#   import their modules
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'PUM')]
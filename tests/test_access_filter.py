@@ -0,0 +1,22 @@
+# File name: test_access_filter.py
+# Description: Tests for reading Perforce access times in bulk
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import pytest
+
+access_filter = pytest.importorskip('access_filter')
+
+
+def test_only_epoch_access_times():
+    assert access_filter.parse_access_times(['1700000000', '1600000000']) == [1700000000, 1600000000]
+
+
+def test_mixed_access_times_match_parse_access():
+    values = ['2026/10/01 12:00:00', '1700000000', 'junk', '']
+    assert access_filter.parse_access_times(values) == [access_filter.parse_access(value)
+                                                        for value in values]
+
+
+def test_no_access_times():
+    assert access_filter.parse_access_times([]) == []
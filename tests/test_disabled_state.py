@@ -0,0 +1,181 @@
+# File name: test_disabled_state.py
+# Description: Tests for the incremental departed user state and refresh
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import re
+import json
+import time
+import pytest
+from disabled_state import DisabledAccountState
+
+LDAP_SERVER = 'ldap://1.1.1.1'
+ROOT_DN = 'DC=example,DC=com'
+DISABLED_DN = 'OU=Accounts,OU=Disabled,' + ROOT_DN
+ACTIVE_DN = 'OU=Users,' + ROOT_DN
+
+
+class FakeDirectory(object):
+    """
+    Bound ldap connection over a dict of entries, answering the searches
+    refresh_disabled_accounts makes: the root DSE and uSNChanged filters
+    under a base DN
+    """
+    def __init__(self):
+        self.usn = 100
+        self.entries = {}       # account -> (dn, attrs, usn)
+        self.results = {}
+
+    def put(self, account, ou, cn=None):
+        self.usn += 1
+        attrs = {'AccountName': [account.encode()], 'mail': [f'{account}@example.com'.encode()],
+                 'name': [account.encode()]}
+        self.entries[account] = (f'CN={cn or account},{ou}', attrs, self.usn)
+
+    def search_s(self, basedn, scope, ldap_filter, attrs):
+        assert basedn == ''
+        return [('', {'highestCommittedUSN': [str(self.usn).encode()],
+                      'defaultNamingContext': [ROOT_DN.encode()]})]
+
+    def search_ext(self, basedn, scope, ldap_filter, attrs, serverctrls=None):
+        since = re.search(r'uSNChanged>=(\d+)', ldap_filter)
+        since = int(since.group(1)) if since else 0
+        msgid = len(self.results)
+        self.results[msgid] = [(dn, {name: values for name, values in entry.items()
+                                     if name in attrs})
+                               for dn, entry, usn in self.entries.values()
+                               if usn >= since and dn.lower().endswith(basedn.lower())]
+        return msgid
+
+    def result3(self, msgid):
+        return None, self.results.pop(msgid), None, []
+
+
+@pytest.fixture
+def directory(monkeypatch):
+    pytest.importorskip('ldap')
+    perforce_ldap = pytest.importorskip('perforce_ldap')
+    # The fake directory's DNs sit under a real looking root
+    monkeypatch.setattr(perforce_ldap, 'DISABLED_BASEDN', DISABLED_DN)
+
+    fake = FakeDirectory()
+    p4_ldap = perforce_ldap.PerforceLdap()
+    p4_ldap.ldap = fake
+    return fake, p4_ldap
+
+
+def test_state_round_trip(tmp_path):
+    path = str(tmp_path / 'state.json')
+    state = DisabledAccountState(path)
+    state.accounts = {'alice': {'mail': ['alice@example.com']}}
+    state.mark_synced(LDAP_SERVER, 42, True)
+    state.save()
+
+    loaded = DisabledAccountState(path)
+    loaded.load()
+    assert loaded.accounts == state.accounts
+    assert loaded.high_water_usn == 42
+    assert loaded.is_current(LDAP_SERVER)
+
+
+def test_state_needs_full_rescan(tmp_path):
+    state = DisabledAccountState(str(tmp_path / 'state.json'), max_age=60)
+    assert not state.is_current(LDAP_SERVER)
+
+    state.mark_synced(LDAP_SERVER, 42, True)
+    assert state.is_current(LDAP_SERVER)
+    assert not state.is_current('ldap://2.2.2.2')
+
+    state.last_full_scan = time.time() - 120
+    assert not state.is_current(LDAP_SERVER)
+
+
+def test_unreadable_state_is_empty(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text('{"ldap_server": ')
+    state = DisabledAccountState(str(path))
+    state.load()
+    assert state.accounts == {}
+    assert not state.is_current(LDAP_SERVER)
+
+
+def test_incremental_refresh_adds_new_accounts(tmp_path, directory):
+    fake, p4_ldap = directory
+    fake.put('alice', DISABLED_DN)
+    fake.put('bob', ACTIVE_DN)
+    state = DisabledAccountState(str(tmp_path / 'state.json'))
+
+    assert p4_ldap.refresh_disabled_accounts(state)
+    assert set(state.accounts) == {'alice'}
+
+    fake.put('bob', DISABLED_DN)
+    assert not p4_ldap.refresh_disabled_accounts(state)
+    assert set(state.accounts) == {'alice', 'bob'}
+    assert state.high_water_usn == fake.usn
+
+
+def test_incremental_refresh_drops_reenabled_accounts(tmp_path, directory):
+    fake, p4_ldap = directory
+    fake.put('alice', DISABLED_DN)
+    fake.put('bob', DISABLED_DN)
+    state = DisabledAccountState(str(tmp_path / 'state.json'))
+    p4_ldap.refresh_disabled_accounts(state)
+
+    # bob is re-enabled by moving the account back out of the Disabled OU
+    fake.put('bob', ACTIVE_DN)
+    assert not p4_ldap.refresh_disabled_accounts(state)
+    assert set(state.accounts) == {'alice'}
+
+
+def test_account_moved_out_and_back_stays_departed(tmp_path, directory):
+    fake, p4_ldap = directory
+    fake.put('alice', DISABLED_DN)
+    state = DisabledAccountState(str(tmp_path / 'state.json'))
+    p4_ldap.refresh_disabled_accounts(state)
+
+    fake.put('alice', ACTIVE_DN)
+    fake.put('alice', DISABLED_DN)
+    p4_ldap.refresh_disabled_accounts(state)
+    assert set(state.accounts) == {'alice'}
+
+
+def test_reenabled_check_compares_parsed_dns(directory):
+    fake, p4_ldap = directory
+    # The Disabled OU written with other case and spacing
+    fake.put('alice', 'ou=accounts, ou=disabled,' + ROOT_DN)
+    # A CN holding an escaped comma, directly under OU=Disabled, whose
+    # DN only ends with the same text as the Disabled OU's
+    fake.put('bob', 'OU=Disabled,' + ROOT_DN, cn='bob\\,OU=Accounts')
+    fake.put('carol', DISABLED_DN)
+    accounts = {'alice': {}, 'bob': {}, 'carol': {}}
+
+    assert p4_ldap.find_reenabled_accounts(accounts, 0) == {'bob'}
+
+
+def test_refresh_without_a_usn_is_not_saved(tmp_path, directory):
+    fake, p4_ldap = directory
+    fake.put('alice', DISABLED_DN)
+    path = tmp_path / 'state.json'
+    state = DisabledAccountState(str(path))
+    p4_ldap.refresh_disabled_accounts(state)
+    state.save()
+    saved = path.read_text()
+
+    fake.put('bob', DISABLED_DN)
+    fake.search_s = lambda basedn, scope, ldap_filter, attrs: [('', {})]
+    assert p4_ldap.refresh_disabled_accounts(state)
+    assert set(state.accounts) == {'alice', 'bob'}
+    state.save()
+
+    assert path.read_text() == saved
+    with pytest.raises(ValueError):
+        state.mark_synced(LDAP_SERVER, None, True)
+
+
+def test_state_without_a_usn_needs_full_rescan(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text(json.dumps({'ldap_server': LDAP_SERVER, 'high_water_usn': None,
+                                'last_full_scan': time.time(), 'accounts': {}}))
+    state = DisabledAccountState(str(path))
+    state.load()
+    assert not state.is_current(LDAP_SERVER)
@@ -0,0 +1,50 @@
+# File name: test_ldap_snapshot.py
+# Description: Tests for the snapshot age check on modify-mode runs
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import time
+import sqlite3
+import argparse
+import pytest
+
+ldap_snapshot = pytest.importorskip('ldap_snapshot')
+perforce_user_management = pytest.importorskip('perforce_user_management')
+
+
+def make_snapshot(path, taken):
+    """A snapshot file holding only its meta table"""
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+    if taken is not None:
+        con.execute("INSERT INTO meta VALUES ('taken', ?)", (str(int(taken)),))
+    con.commit()
+    con.close()
+    return path
+
+
+def make_conf(path, modify=True, max_age=24):
+    return argparse.Namespace(modify=modify, ldap_snapshot=path, ldap_snapshot_max_age=max_age)
+
+
+def test_snapshot_age(tmp_path):
+    path = make_snapshot(str(tmp_path / 'snapshot.db'), time.time() - 3600)
+    assert 3590 < ldap_snapshot.snapshot_age(path) < 3700
+    assert ldap_snapshot.snapshot_age(str(tmp_path / 'missing.db')) is None
+
+
+def test_modify_mode_accepts_a_recent_snapshot(tmp_path):
+    path = make_snapshot(str(tmp_path / 'snapshot.db'), time.time() - 3600)
+    perforce_user_management.check_snapshot_age(make_conf(path))
+
+
+@pytest.mark.parametrize('taken', [time.time() - 48 * 3600, None])
+def test_modify_mode_refuses_an_old_or_undated_snapshot(tmp_path, taken):
+    path = make_snapshot(str(tmp_path / 'snapshot.db'), taken)
+    with pytest.raises(SystemExit):
+        perforce_user_management.check_snapshot_age(make_conf(path))
+
+
+def test_read_only_mode_takes_a_snapshot_of_any_age(tmp_path):
+    path = make_snapshot(str(tmp_path / 'snapshot.db'), time.time() - 48 * 3600)
+    perforce_user_management.check_snapshot_age(make_conf(path, modify=False))
@@ -0,0 +1,75 @@
+# File name: test_mail_daemon.py
+# Description: Tests for how the mail daemon waits for mail and shuts down
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import time
+import threading
+from concurrent.futures import Future
+import pytest
+
+mail_daemon = pytest.importorskip('mail_daemon')
+
+
+class BlockingFolder:
+    '''A folder whose streaming subscription never sends an event'''
+    def __init__(self):
+        self.released = threading.Event()
+
+    def streaming_subscription(self):
+        folder = self
+
+        class Subscription:
+            def __enter__(self):
+                return 'subscription'
+
+            def __exit__(self, *excInfo):
+                folder.released.set()
+        return Subscription()
+
+    def get_streaming_events(self, subscriptionId, connection_timeout):
+        self.released.wait(10)
+        return iter([])
+
+
+class FakeAccount:
+    def __init__(self, folder):
+        self.root = self
+        self.folder = folder
+
+    def __truediv__(self, name):
+        return self if name == 'Top of Information Store' else self.folder
+
+
+TARGET = {'mailbox': 'user@exchange.com', 'folder': 'Success', 'interval': 600}
+
+
+def test_shutdown_does_not_wait_for_the_subscription(monkeypatch):
+    monkeypatch.setattr(mail_daemon, 'STOP_CHECK', 0.05)
+    folder = BlockingFolder()
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+
+    started = time.monotonic()
+    mail_daemon.waitForMail(FakeAccount(folder), dict(TARGET), stop)
+
+    assert time.monotonic() - started < 2
+    folder.released.set()
+
+
+def test_broken_streaming_falls_back_to_polling(monkeypatch):
+    class BrokenFolder(BlockingFolder):
+        def streaming_subscription(self):
+            raise RuntimeError('ErrorInvalidSubscription')
+
+    target = dict(TARGET, interval=0.1)
+    mail_daemon.waitForMail(FakeAccount(BrokenFolder()), target, threading.Event())
+    assert target['streaming'] is False
+
+
+def test_watcher_errors_are_logged(capsys):
+    future = Future()
+    future.add_done_callback(mail_daemon.logFailure(TARGET))
+    future.set_exception(KeyError('nope'))
+
+    assert "Stopped watching: KeyError('nope')" in capsys.readouterr().out
@@ -0,0 +1,113 @@
+# File name: test_mail_detection.py
+# Description: Tests for incremental mailbox reads: the state file, the
+#   watermark and emails whose body could not be fetched
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import datetime
+import pytest
+
+maill_detection = pytest.importorskip('maill_detection')
+MailState = maill_detection.MailState
+
+START = datetime.datetime(2026, 10, 1, 9, 0, tzinfo=datetime.timezone.utc)
+
+
+def receivedAt(minutes):
+    return START + datetime.timedelta(minutes=minutes)
+
+
+class FakeEmail:
+    def __init__(self, number, minutes):
+        self.subject = f'PROD: Change Number CO-{number}'
+        self.body = f'change number - CO-{number}, time - 06:12 PM, date - 05/16/22'
+        self.datetime_received = receivedAt(minutes)
+        self.moved = False
+
+    def move_to_trash(self):
+        self.moved = True
+
+
+class FakeSink:
+    '''SuccessRecordSink confirming every record straight away'''
+    def __init__(self):
+        self.records = []
+
+    def add(self, cn, time, date):
+        self.records.append(cn)
+        return [cn]
+
+    def close(self):
+        return []
+
+
+class FakeAccount:
+    '''Exchange account whose fetch fails for some of the emails'''
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    def fetch(self, ids, only_fields=None):
+        return [Exception('ErrorItemNotFound') if email.subject in self.failing else email
+                for email in ids]
+
+
+def countWrites(state, monkeypatch):
+    writes = []
+    save = state.save
+    monkeypatch.setattr(state, 'save', lambda: writes.append(1) or save())
+    return writes
+
+
+def test_confirmed_change_numbers_survive_a_crash(tmp_path):
+    state = MailState(str(tmp_path / 'state.json'))
+    state.markProcessed(['CO-1', 'CO-2'])
+    state.markProcessed(['CO-3'])
+    # A crash partway through a journal write
+    with open(state.journalPath, 'a') as journal:
+        journal.write('["CO-')
+
+    loaded = MailState(state.path)
+    loaded.load()
+    assert sorted(loaded.processed) == ['CO-1', 'CO-2', 'CO-3']
+
+    loaded.save()
+    assert not (tmp_path / 'state.json.journal').exists()
+    reloaded = MailState(state.path)
+    reloaded.load()
+    assert sorted(reloaded.processed) == ['CO-1', 'CO-2', 'CO-3']
+
+
+def test_run_writes_the_state_once(tmp_path, monkeypatch):
+    state = MailState(str(tmp_path / 'state.json'))
+    writes = countWrites(state, monkeypatch)
+    emails = [FakeEmail(number, number) for number in range(50)]
+
+    maill_detection.getSuccess(emails, state, FakeSink())
+
+    assert len(writes) == 1
+    assert state.lastReceived == receivedAt(49)
+    assert all(email.moved for email in emails)
+
+
+def test_watermark_stops_before_an_email_that_failed_to_fetch(tmp_path):
+    state = MailState(str(tmp_path / 'state.json'))
+    emails = [FakeEmail(number, number) for number in range(5)]
+    account = FakeAccount(failing={emails[2].subject})
+    sink = FakeSink()
+
+    maill_detection.getSuccess(maill_detection.fetchBodies(account, emails), state, sink)
+
+    assert sink.records == ['CO-0', 'CO-1', 'CO-3', 'CO-4']
+    assert state.lastReceived == receivedAt(1)
+    assert not emails[2].moved
+
+
+def test_processed_change_numbers_are_not_saved_again(tmp_path):
+    state = MailState(str(tmp_path / 'state.json'))
+    state.markProcessed(['CO-1'])
+    sink = FakeSink()
+
+    maill_detection.getSuccess([FakeEmail(1, 0), FakeEmail(2, 1)], state, sink)
+
+    assert sink.records == ['CO-2']
+    assert state.lastReceived == receivedAt(1)
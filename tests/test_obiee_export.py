@@ -0,0 +1,87 @@
+# File name: test_obiee_export.py
+# Description: Tests for exporting OBIEE reports over HTTP against the stub saw.dll
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import pytest
+
+obiee_export = pytest.importorskip('obiee_export')
+from obiee_export import ObieeExportSession, ObieeSessionError, startStub
+
+REPORT = 'Staffing - Schedule Time'
+ROWS = b'Employee,Schedule Date,Hours\r\n' + b'amy,5/16/2022,8\r\n' * 5000
+
+
+class TruncatingHandler(obiee_export.StubHandler):
+    '''saw.dll whose connection drops part way through a report'''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(ROWS)))
+        self.end_headers()
+        self.wfile.write(ROWS[:len(ROWS) // 2])
+
+
+@pytest.fixture
+def stub(tmp_path):
+    reports = tmp_path / 'reports'
+    reports.mkdir()
+    (reports / (REPORT + '.csv')).write_bytes(ROWS)
+    server, baseUrl = startStub(str(reports))
+    yield baseUrl
+    server.shutdown()
+
+
+def makeExport(baseUrl):
+    export = ObieeExportSession(baseUrl)
+    export.login('user', 'password')
+    return export
+
+
+def test_report_is_streamed_to_disk(stub, tmp_path):
+    export = makeExport(stub)
+    try:
+        filePath, size = export.exportReport(REPORT, str(tmp_path), chunkSize=1024)
+    finally:
+        export.close()
+
+    assert filePath == str(tmp_path / (REPORT + '.csv'))
+    assert size == len(ROWS)
+    assert (tmp_path / (REPORT + '.csv')).read_bytes() == ROWS
+
+
+def test_export_without_logging_in_gets_the_sign_in_page(stub, tmp_path):
+    export = ObieeExportSession(stub)
+    try:
+        with pytest.raises(ObieeSessionError):
+            export.exportReport(REPORT, str(tmp_path))
+    finally:
+        export.close()
+
+    assert list(tmp_path.glob('*.csv*')) == []
+
+
+def test_failed_reports_are_returned_with_the_others(stub, tmp_path):
+    export = makeExport(stub)
+    try:
+        results = export.exportReports([REPORT, 'Missing Report'], str(tmp_path))
+    finally:
+        export.close()
+
+    assert results[REPORT] == str(tmp_path / (REPORT + '.csv'))
+    assert isinstance(results['Missing Report'], obiee_export.requests.HTTPError)
+
+
+def test_interrupted_download_leaves_no_part_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(obiee_export, 'StubHandler', TruncatingHandler)
+    server, baseUrl = startStub(str(tmp_path))
+    export = makeExport(baseUrl)
+    try:
+        with pytest.raises(obiee_export.requests.RequestException):
+            export.exportReport(REPORT, str(tmp_path), chunkSize=1024)
+    finally:
+        export.close()
+        server.shutdown()
+
+    assert list(tmp_path.glob('*.csv*')) == []
@@ -0,0 +1,43 @@
+# File name: test_perforce_user_stream.py
+# Description: Tests for streaming the Perforce user table
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import sys
+import stat
+from perforce_user_stream import PerforceUserStream, FIELD_SEPARATOR
+
+USERS = ['amy', 'bob', 'cal']
+
+
+def fake_p4(tmp_path):
+    """A p4 that prints USERS, honouring -m like p4 users does"""
+    script = tmp_path / 'p4'
+    script.write_text(f'''#!{sys.executable}
+import sys
+args = sys.argv[1:]
+users = {USERS!r}
+if '-m' in args:
+    users = users[:int(args[args.index('-m') + 1])]
+for user in users:
+    print({FIELD_SEPARATOR!r}.join([user, user.title(), '2026/10/01', user + '@example.com']))
+''')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script)
+
+
+def test_reads_every_user_without_a_limit(tmp_path, capsys):
+    stream = PerforceUserStream('p4:1666', p4=fake_p4(tmp_path))
+
+    assert [user['User'] for user in stream] == USERS
+    assert stream.truncated == 0
+    assert 'Warning' not in capsys.readouterr().out
+
+
+def test_warns_when_max_users_cuts_a_page_short(tmp_path, capsys):
+    stream = PerforceUserStream('p4:1666', max_users=2, p4=fake_p4(tmp_path))
+
+    assert [user['User'] for user in stream] == USERS[:2]
+    assert stream.truncated == 1
+    assert 'p4 users -m 2' in capsys.readouterr().out
+    assert 'cut short' in stream.stats()
@@ -0,0 +1,266 @@
+# File name: test_process_server.py
+# Description: Tests for how a modify-mode run checkpoints each server
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import csv
+import glob
+import argparse
+import pytest
+
+perforce_user_management = pytest.importorskip('perforce_user_management')
+import ldap
+from removal_executor import RemovalCheckpoint
+from run_trace import RunTrace, LdapCounters
+
+SERVER = 'serverA'
+USERNAMES = ['alice', 'bob', 'carol']
+
+
+class FakeUser(object):
+    def __init__(self, username):
+        self.name = username.title()
+        self.username = username
+        self.email = f'{username}@website.com'
+        self.manager_email = 'manager@website.com'
+        self.ldap_name = username
+
+    def email_users_manager(self, server):
+        pass
+
+
+class FakeLdap(object):
+    """PerforceLdap matching users against known deprovisioned accounts"""
+    filter_chunk_size = 200
+
+    def __init__(self):
+        self.counters = LdapCounters()
+
+    class manager_cache(object):
+        @staticmethod
+        def stats():
+            return 'Manager cache'
+
+    def join_users(self, user_list, accounts):
+        return [FakeUser(user['User']) for user in user_list if user['User'] in accounts]
+
+
+class FakePerforce(object):
+    failing = set()
+
+    def perforce_login(self, server):
+        pass
+
+    def get_perforce_users(self):
+        return [{'User': username} for username in USERNAMES]
+
+    def get_perforce_server_name(self):
+        return SERVER
+
+    def remove_perforce_user(self, user):
+        if user.username in self.failing:
+            raise RuntimeError(f'cannot remove {user.username}')
+
+    def disconnect_from_perforce(self):
+        pass
+
+
+class FakeEmail(object):
+    sent = []
+
+    def email_admins(self, server_name, users):
+        self.sent.append([user.username for user in users])
+
+
+@pytest.fixture
+def conf(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(perforce_user_management, 'Perforce', FakePerforce)
+    monkeypatch.setattr(perforce_user_management, 'P4Email', FakeEmail)
+    monkeypatch.setattr(FakePerforce, 'failing', set())
+    monkeypatch.setattr(FakeEmail, 'sent', [])
+
+    conf = argparse.Namespace(
+        modify=True, pipeline=False, stream_users=False, active_days=0,
+        removal_workers=1, removal_rate=0, removal_attempts=1, notifier=None, report_format='csv',
+        compress_report=False, pipeline_queue_size=10, trace=RunTrace(str(tmp_path / 'trace.jsonl')))
+    yield conf
+    conf.trace.close()
+
+
+def run_server(conf, path):
+    conf.removal_checkpoint = RemovalCheckpoint(path)
+    conf.removal_checkpoint.load()
+    perforce_user_management.process_server(SERVER, conf, FakeLdap(), set(USERNAMES))
+    return conf.removal_checkpoint
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_server_with_failed_removals_is_still_complete(conf, tmp_path, pipeline, capsys):
+    conf.pipeline = pipeline
+    FakePerforce.failing = {'bob'}
+
+    checkpoint = run_server(conf, str(tmp_path / 'checkpoint.jsonl'))
+
+    assert checkpoint.is_complete(SERVER)
+    assert not checkpoint.is_removed(SERVER, 'bob')
+    assert '1 removals failed after 1 attempts: bob' in capsys.readouterr().out
+
+
+def test_server_without_failures_is_complete(conf, tmp_path):
+    checkpoint = run_server(conf, str(tmp_path / 'checkpoint.jsonl'))
+    assert checkpoint.is_complete(SERVER)
+
+
+def test_resumed_pipeline_reports_every_departed_user(conf, tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    conf.pipeline = True
+    # An interrupted run that removed alice and carol
+    interrupted = RemovalCheckpoint(path)
+    interrupted.record_removal(SERVER, 'alice')
+    interrupted.record_removal(SERVER, 'carol')
+
+    run_server(conf, path)
+
+    with open(glob.glob('*.csv')[0], newline='') as report_file:
+        rows = {row['Username']: row['Status'] for row in csv.DictReader(report_file)}
+    assert rows == {'alice': 'already-removed', 'bob': 'removed', 'carol': 'already-removed'}
+    assert FakeEmail.sent[-1] == USERNAMES
+
+
+class BrokenLdap(FakeLdap):
+    """PerforceLdap whose stage fails with an IOError, like a missing p4"""
+    def join_users(self, user_list, accounts):
+        raise FileNotFoundError("No such file or directory: 'p4'")
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_failed_detection_does_not_finish_the_server(conf, tmp_path, pipeline):
+    conf.pipeline = pipeline
+    conf.removal_checkpoint = RemovalCheckpoint(str(tmp_path / 'checkpoint.jsonl'))
+
+    with pytest.raises(FileNotFoundError):
+        perforce_user_management.process_server(SERVER, conf, BrokenLdap(), set(USERNAMES))
+
+    assert not conf.removal_checkpoint.is_complete(SERVER)
+    assert FakeEmail.sent == []
+
+
+def test_report_errors_do_not_stop_the_pipeline(conf, tmp_path, monkeypatch):
+    conf.pipeline = True
+
+    def unwritable_report(*args):
+        raise IOError('disk full')
+    monkeypatch.setattr(perforce_user_management, 'DepartedUserReport', unwritable_report)
+
+    checkpoint = run_server(conf, str(tmp_path / 'checkpoint.jsonl'))
+
+    assert checkpoint.is_complete(SERVER)
+    assert all(checkpoint.is_removed(SERVER, username) for username in USERNAMES)
+    assert FakeEmail.sent == [USERNAMES]
+
+
+class FakeNotifier(object):
+    """NotificationQueue recording when digests are flushed and closed"""
+    def __init__(self, *args):
+        self.events = []
+
+    def add(self, server, user):
+        self.events.append(('add', user.username))
+
+    def flush(self):
+        self.events.append(('flush',))
+
+    def close(self):
+        self.events.append(('close',))
+
+
+def test_digests_are_flushed_before_the_server_is_finished(conf, tmp_path):
+    conf.notifier = FakeNotifier()
+    conf.removal_checkpoint = RemovalCheckpoint(str(tmp_path / 'checkpoint.jsonl'))
+    flushed_before_complete = []
+    record_complete = conf.removal_checkpoint.record_complete
+
+    def checked_record_complete(server):
+        flushed_before_complete.append(('flush',) in conf.notifier.events)
+        record_complete(server)
+    conf.removal_checkpoint.record_complete = checked_record_complete
+
+    perforce_user_management.process_server(SERVER, conf, FakeLdap(), set(USERNAMES))
+
+    assert flushed_before_complete == [True]
+    assert conf.notifier.events[:3] == [('add', username) for username in USERNAMES]
+
+
+class BindingLdap(FakeLdap):
+    def __init__(self, *args):
+        super().__init__()
+
+    def bind_to_ldap(self):
+        pass
+
+    def unbind_from_ldap(self):
+        pass
+
+
+def test_digests_are_sent_when_a_server_fails(conf, tmp_path, monkeypatch):
+    notifier = FakeNotifier()
+    monkeypatch.setattr(perforce_user_management, 'PerforceLdap', BindingLdap)
+    monkeypatch.setattr(perforce_user_management, 'NotificationQueue', lambda *args: notifier)
+
+    def failing_server(server, conf, p4_ldap, known_accounts=None):
+        raise RuntimeError('perforce went away')
+    monkeypatch.setattr(perforce_user_management, 'process_server_traced', failing_server)
+
+    conf.__dict__.update(ldap_snapshot=None, checkpoint=None, mail_sink=str(tmp_path / 'mail'),
+                         notify_digest=False, manager_cache_size=10, manager_cache_ttl=60,
+                         manager_cache=None, ldap_pool=0, save_ldap_snapshot=None,
+                         incremental=None, workers=1)
+
+    with pytest.raises(RuntimeError):
+        perforce_user_management.run(conf)
+
+    assert notifier.events == [('close',)]
+
+
+class RefusingConnection(object):
+    """ldap connection whose bind is refused"""
+    def set_option(self, option, value):
+        pass
+
+    def simple_bind_s(self, username, password):
+        raise ldap.INVALID_CREDENTIALS('invalid credentials')
+
+    def unbind(self):
+        pass
+
+
+class BindingConnection(RefusingConnection):
+    def simple_bind_s(self, username, password):
+        pass
+
+
+def test_refused_credentials_raise_a_bind_error(monkeypatch):
+    monkeypatch.setattr(ldap, 'initialize',
+                        lambda server: RefusingConnection())
+
+    with pytest.raises(perforce_user_management.LdapBindError):
+        perforce_user_management.PerforceLdap().bind_to_ldap()
+
+
+def test_refused_bind_only_fails_its_own_server(conf, monkeypatch, capsys):
+    connections = [RefusingConnection(), BindingConnection()]
+    monkeypatch.setattr(ldap, 'initialize',
+                        lambda server: connections.pop(0))
+    processed = []
+
+    def process_server_traced(server, conf, p4_ldap, known_accounts=None):
+        processed.append(server)
+    monkeypatch.setattr(perforce_user_management, 'process_server_traced', process_server_traced)
+    conf.__dict__.update(workers=1, profile=None)
+
+    perforce_user_management.run_servers_concurrently(['serverA', 'serverB'], conf,
+                                                      perforce_user_management.PerforceLdap)
+
+    assert processed == ['serverB']
+    assert 'serverA: failed' in capsys.readouterr().out
@@ -0,0 +1,82 @@
+# File name: test_profiler.py
+# Description: Tests for the run profilers
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import time
+import pstats
+import threading
+import profiler
+
+
+def busy_wait(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+def test_sampling_profiler_writes_folded_stacks_most_seen_first(tmp_path):
+    sampler = profiler.SamplingProfiler()
+    sampler.stacks.update({'main;run;a': 2, 'main;run;b': 5})
+    path = tmp_path / 'run.folded'
+
+    sampler.write(str(path))
+
+    assert path.read_text().splitlines() == ['main;run;b 5', 'main;run;a 2']
+
+
+def test_sampling_profiler_sees_worker_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_wait, args=(stop,), name='server-worker')
+    sampler = profiler.SamplingProfiler(interval=0.001)
+    worker.start()
+    sampler.start()
+    time.sleep(0.05)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    assert sampler.samples > 0
+    assert any(stack.startswith('server-worker;') and 'busy_wait' in stack
+               for stack in sampler.stacks)
+
+
+def test_profile_thread_writes_stats(tmp_path):
+    path = str(tmp_path / 'server.prof')
+    with profiler.profile_thread(path) as profile:
+        assert profile is not None
+        sum(range(1000))
+
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_profile_thread_runs_unprofiled_when_another_profiler_is_active(tmp_path, monkeypatch):
+    def enable(self):
+        raise ValueError('Another profiling tool is already active')
+    monkeypatch.setattr(profiler.cProfile.Profile, 'enable', enable)
+    ran = []
+
+    with profiler.profile_thread(str(tmp_path / 'server.prof')) as profile:
+        ran.append(profile)
+
+    assert ran == [None]
+    assert not (tmp_path / 'server.prof').exists()
+
+
+def test_workers_leave_the_main_thread_unprofiled(tmp_path):
+    output = str(tmp_path / 'run')
+    with profiler.profile_run('cprofile', output, workers=2):
+        # A worker's own profile can still be enabled
+        with profiler.profile_thread(output + '.serverA.prof') as profile:
+            assert profile is not None
+
+    assert not (tmp_path / 'run.prof').exists()
+    assert (tmp_path / 'run.serverA.prof').exists()
+
+
+def test_cprofile_falls_back_to_sampling_without_per_thread_profiles(monkeypatch):
+    monkeypatch.setattr(profiler, 'PER_THREAD_CPROFILE', False)
+    assert profiler.choose_profiler('cprofile', workers=2) == 'sample'
+    assert profiler.choose_profiler('cprofile', workers=1) == 'cprofile'
+
+    monkeypatch.setattr(profiler, 'PER_THREAD_CPROFILE', True)
+    assert profiler.choose_profiler('cprofile', workers=2) == 'cprofile'
@@ -0,0 +1,206 @@
+# File name: test_removal_executor.py
+# Description: Tests for concurrent removals and the resumable checkpoint
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import json
+import time
+import functools
+import pytest
+
+removal_executor = pytest.importorskip('removal_executor')
+# Retries don't wait in the tests
+RemovalExecutor = functools.partial(removal_executor.RemovalExecutor, retry_delay=0)
+RemovalCheckpoint = removal_executor.RemovalCheckpoint
+
+SERVER = 'serverA'
+
+
+class FakeUser(object):
+    """The PerforceUser attributes the executor reads"""
+    def __init__(self, username, manager_email='manager@website.com'):
+        self.username = username
+        self.manager_email = manager_email
+        self.emailed = 0
+
+    def email_users_manager(self, server):
+        self.emailed += 1
+
+
+class FakePerforce(object):
+    """
+    Logged in Perforce connection whose removals of some users fail,
+    the first flaky_failures times for the users in flaky
+    """
+    def __init__(self, failing=(), flaky=(), flaky_failures=1):
+        self.failing = set(failing)
+        self.flaky = {username: flaky_failures for username in flaky}
+        self.removed = []
+        self.tries = []
+
+    def perforce_login(self, server):
+        pass
+
+    def remove_perforce_user(self, user):
+        self.tries.append(user.username)
+        if user.username in self.failing:
+            raise RuntimeError(f'cannot remove {user.username}')
+        if self.flaky.get(user.username):
+            self.flaky[user.username] -= 1
+            raise RuntimeError(f'{user.username} is locked')
+        self.removed.append(user.username)
+
+    def disconnect_from_perforce(self):
+        pass
+
+
+def make_users(*usernames):
+    return [FakeUser(username) for username in usernames]
+
+
+def test_failed_removals_are_not_checkpointed(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = RemovalCheckpoint(path)
+    perf = FakePerforce(failing={'bob'})
+
+    results = RemovalExecutor(SERVER, perf, checkpoint=checkpoint).run(
+        make_users('alice', 'bob', 'carol'))
+
+    assert results['bob'][0] == 'failed'
+    assert perf.removed == ['alice', 'carol']
+
+    resumed = RemovalCheckpoint(path)
+    resumed.load()
+    assert resumed.is_removed(SERVER, 'alice')
+    assert not resumed.is_removed(SERVER, 'bob')
+    assert resumed.is_removed(SERVER, 'carol')
+
+
+def test_resumed_run_retries_only_failed_users(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    users = make_users('alice', 'bob', 'carol')
+    RemovalExecutor(SERVER, FakePerforce(failing={'bob'}),
+                    checkpoint=RemovalCheckpoint(path)).run(users)
+
+    checkpoint = RemovalCheckpoint(path)
+    checkpoint.load()
+    perf = FakePerforce()
+    executor = RemovalExecutor(SERVER, perf, checkpoint=checkpoint)
+    executor.run(make_users('alice', 'bob', 'carol'))
+
+    assert perf.removed == ['bob']
+    assert executor.failed == []
+
+
+def test_status_is_kept_on_the_user():
+    users = make_users('alice', 'bob')
+    RemovalExecutor(SERVER, FakePerforce(failing={'bob'})).run(users)
+    assert [user.removal_status for user in users] == ['removed', 'failed']
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = RemovalCheckpoint(path)
+    user = FakeUser('alice')
+    user.name = 'Alice'
+    checkpoint.record_departed(SERVER, [user])
+    checkpoint.record_removal(SERVER, 'alice')
+    checkpoint.record_complete(SERVER)
+    # An interrupted write leaves a partial line behind
+    with open(path, 'a') as checkpoint_file:
+        checkpoint_file.write('{"type": "removal", "ser')
+
+    resumed = RemovalCheckpoint(path)
+    resumed.load()
+    assert resumed.is_complete(SERVER)
+    assert not resumed.is_complete('serverB')
+    assert [(saved.username, saved.name) for saved in resumed.departed_users(SERVER)] == \
+        [('alice', 'Alice')]
+    assert resumed.departed_users('serverB') is None
+
+    resumed.clear()
+    assert not (tmp_path / 'checkpoint.jsonl').exists()
+
+
+def test_concurrent_removals_keep_order(monkeypatch):
+    # Worker threads log in with their own connection
+    monkeypatch.setattr(removal_executor, 'Perforce', FakePerforce)
+    usernames = [f'user{number}' for number in range(20)]
+    executor = RemovalExecutor(SERVER, FakePerforce(), workers=4)
+
+    streamed = [(user.username, status) for user, status, _ in
+                executor.run_stream(make_users(*usernames))]
+
+    assert streamed == [(username, 'removed') for username in usernames]
+    assert executor.removed == 20
+
+
+class FakeNotifier(object):
+    """NotificationQueue collecting the users added to digests"""
+    def __init__(self):
+        self.added = []
+
+    def add(self, server, user):
+        self.added.append(user.username)
+
+
+def test_digest_only_lists_removed_users():
+    notifier = FakeNotifier()
+    users = make_users('alice', 'bob', 'carol')
+    users[2].manager_email = 'No manager email'
+
+    RemovalExecutor(SERVER, FakePerforce(failing={'bob'}), notifier=notifier).run(users)
+
+    assert notifier.added == ['alice']
+    assert [user.emailed for user in users] == [0, 0, 0]
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_already_removed_users_are_passed_through(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(removal_executor, 'Perforce', FakePerforce)
+    checkpoint = RemovalCheckpoint(str(tmp_path / 'checkpoint.jsonl'))
+    checkpoint.record_removal(SERVER, 'alice')
+    checkpoint.record_removal(SERVER, 'carol')
+    executor = RemovalExecutor(SERVER, FakePerforce(), workers=workers, checkpoint=checkpoint)
+
+    streamed = [(user.username, status) for user, status, _ in
+                executor.run_stream(make_users('alice', 'bob', 'carol', 'dave'))]
+
+    assert streamed == [('alice', 'already-removed'), ('bob', 'removed'),
+                        ('carol', 'already-removed'), ('dave', 'removed')]
+    assert (executor.removed, executor.skipped) == (2, 2)
+
+
+def test_failing_removal_is_tried_attempts_times():
+    perf = FakePerforce(failing={'bob'}, flaky={'alice'})
+    executor = RemovalExecutor(SERVER, perf, attempts=3)
+
+    results = executor.run(make_users('alice', 'bob'))
+
+    assert results['alice'][0] == 'removed'
+    assert results['bob'] == ('failed', 'cannot remove bob')
+    assert perf.tries == ['alice', 'alice', 'bob', 'bob', 'bob']
+
+
+def test_manager_is_only_emailed_after_the_removal():
+    users = make_users('alice', 'bob')
+    RemovalExecutor(SERVER, FakePerforce(failing={'bob'})).run(users)
+    assert [user.emailed for user in users] == [1, 0]
+
+
+def test_checkpoint_from_an_earlier_run_is_ignored(tmp_path):
+    path = tmp_path / 'checkpoint.jsonl'
+    with open(path, 'w') as checkpoint_file:
+        checkpoint_file.write(json.dumps({'type': 'start', 'time': time.time() - 2 * 86400}) + '\n')
+        checkpoint_file.write(json.dumps({'type': 'complete', 'server': SERVER}) + '\n')
+
+    checkpoint = RemovalCheckpoint(str(path), max_age=86400)
+    checkpoint.load()
+
+    assert not checkpoint.is_complete(SERVER)
+    assert not path.exists()
+
+    checkpoint.record_complete(SERVER)
+    resumed = RemovalCheckpoint(str(path), max_age=86400)
+    resumed.load()
+    assert resumed.is_complete(SERVER)
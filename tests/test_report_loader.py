@@ -0,0 +1,126 @@
+# File name: test_report_loader.py
+# Description: Tests for the incremental CSV report loader
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import csv
+import sqlite3
+import argparse
+import pytest
+import report_loader
+
+
+HEADER = ['Employee', 'Schedule Date', 'Hours']
+TYPES = {'Schedule Date': 'DATE', 'Hours': 'INTEGER'}
+
+
+def writeCsv(path, rows):
+    with open(path, 'w', newline='') as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return str(path)
+
+
+def tableRows(dbPath, table='report'):
+    con = sqlite3.connect(dbPath)
+    try:
+        return sorted(con.execute(f'SELECT employee, schedule_date, hours FROM "{table}"'))
+    finally:
+        con.close()
+
+
+def test_keyed_refresh_inserts_updates_and_deletes(tmp_path):
+    dbPath = str(tmp_path / 'reports.db')
+    first = writeCsv(tmp_path / 'report.csv', [['amy', '5/16/2022', '8'],
+                                               ['bob', '5/16/2022', '6'],
+                                               ['cal', '5/16/2022', '4']])
+    stats = report_loader.loadReport(first, dbPath, keyColumns=['Employee'], columnTypes=TYPES)
+    assert stats['inserted'] == 3
+
+    second = writeCsv(tmp_path / 'report.csv', [['amy', '5/16/2022', '8'],
+                                                ['bob', '5/16/2022', '7'],
+                                                ['dan', '5/17/2022', '2']])
+    stats = report_loader.loadReport(second, dbPath, keyColumns=['Employee'], columnTypes=TYPES)
+
+    assert stats == dict(read=3, inserted=1, updated=1, unchanged=1, duplicates=0, deleted=1)
+    assert tableRows(dbPath) == [('amy', '2022-05-16', 8), ('bob', '2022-05-16', 7),
+                                 ('dan', '2022-05-17', 2)]
+
+
+def test_identical_rows_are_all_kept_without_key_columns(tmp_path):
+    dbPath = str(tmp_path / 'reports.db')
+    rows = [['amy', '5/16/2022', '8'],
+            ['amy', '5/16/2022', '8'],
+            ['bob', '5/16/2022', '6']]
+    path = writeCsv(tmp_path / 'report.csv', rows)
+
+    # A chunk size of 1 puts the copies in different chunks
+    loader = report_loader.ReportLoader(dbPath, chunkSize=1)
+    try:
+        stats = loader.load(path)
+    finally:
+        loader.close()
+
+    assert stats['read'] == 3
+    assert stats['inserted'] == 3
+    assert len(tableRows(dbPath)) == 3
+
+    stats = report_loader.loadReport(path, dbPath)
+    assert stats == dict(read=3, inserted=0, updated=0, unchanged=3, duplicates=0, deleted=0)
+
+
+def test_dropping_a_copy_of_a_row_deletes_one_copy(tmp_path):
+    dbPath = str(tmp_path / 'reports.db')
+    report_loader.loadReport(writeCsv(tmp_path / 'report.csv', [['amy', '5/16/2022', '8']] * 3),
+                             dbPath)
+
+    stats = report_loader.loadReport(writeCsv(tmp_path / 'report.csv', [['amy', '5/16/2022', '8']] * 2),
+                                     dbPath)
+
+    assert stats['deleted'] == 1
+    assert tableRows(dbPath) == [('amy', '5/16/2022', '8')] * 2
+
+
+def test_columns_are_text_unless_declared(tmp_path):
+    dbPath = str(tmp_path / 'reports.db')
+    path = writeCsv(tmp_path / 'report.csv', [['00123', '5/16/2022', '1,2'],
+                                              ['00124', '5/17/2022', '1,234']])
+
+    report_loader.loadReport(path, dbPath, columnTypes={'Schedule Date': 'DATE'})
+
+    assert tableRows(dbPath) == [('00123', '2022-05-16', '1,2'), ('00124', '2022-05-17', '1,234')]
+
+
+def test_misplaced_separators_are_not_numbers(tmp_path):
+    dbPath = str(tmp_path / 'reports.db')
+    path = writeCsv(tmp_path / 'report.csv', [['amy', '5/16/2022', '1,2'],
+                                              ['bob', '5/16/2022', '1,234']])
+
+    report_loader.loadReport(path, dbPath, columnTypes={'Hours': 'INTEGER'})
+
+    assert tableRows(dbPath) == [('amy', '5/16/2022', '1,2'), ('bob', '5/16/2022', 1234)]
+
+
+def test_duplicate_keys_are_reported_not_overwritten(tmp_path, capsys):
+    dbPath = str(tmp_path / 'reports.db')
+    path = writeCsv(tmp_path / 'report.csv', [['amy', '5/16/2022', '8'],
+                                              ['bob', '5/16/2022', '6'],
+                                              ['amy', '5/17/2022', '4']])
+
+    # A chunk size of 1 puts the duplicate in a later chunk
+    loader = report_loader.ReportLoader(dbPath, keyColumns=['Employee'], chunkSize=1)
+    try:
+        stats = loader.load(path)
+    finally:
+        loader.close()
+
+    assert (stats['inserted'], stats['duplicates']) == (2, 1)
+    assert tableRows(dbPath) == [('amy', '5/16/2022', '8'), ('bob', '5/16/2022', '6')]
+    assert 'kept the first of each: amy' in capsys.readouterr().out
+
+
+def test_type_declarations():
+    assert report_loader.columnType('Schedule Date=date') == ('Schedule Date', 'DATE')
+    with pytest.raises(argparse.ArgumentTypeError):
+        report_loader.columnType('Hours=MONEY')
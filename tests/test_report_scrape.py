@@ -0,0 +1,158 @@
+# File name: test_report_scrape.py
+# Description: Tests for the OBIEE scrape log in and attempt handling
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import sys
+import time
+import subprocess
+import pytest
+
+report_scrape = pytest.importorskip('report_scrape')
+from selenium.common.exceptions import TimeoutException
+
+
+class FakeElement:
+    def send_keys(self, keys):
+        pass
+
+    def click(self):
+        pass
+
+
+class FakeBrowser:
+    '''A browser whose log in never sets the session cookie'''
+    def __init__(self):
+        self.quit_called = False
+        self.cookie_checks = 0
+
+    def get(self, url):
+        pass
+
+    def find_element_by_id(self, elementId):
+        return FakeElement()
+
+    def get_cookie(self, name):
+        self.cookie_checks += 1
+        return None
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_login_does_not_wait_for_the_cookie_by_default():
+    browser = FakeBrowser()
+    report_scrape.login(browser)
+    assert browser.cookie_checks == 0
+
+
+def test_run_scrape_treats_a_selenium_timeout_as_a_failed_attempt(tmp_path, monkeypatch):
+    browser = FakeBrowser()
+    timings = []
+
+    def downloadReport(*args, **kwargs):
+        raise TimeoutException('report link never appeared')
+
+    class Timer:
+        def begin(self, step):
+            pass
+
+        def fail(self, excep):
+            timings.append(excep)
+
+    monkeypatch.setattr(report_scrape, 'createBrowser', lambda savePath: browser)
+    monkeypatch.setattr(report_scrape, 'downloadReport', downloadReport)
+
+    report_scrape.runScrape(str(tmp_path), Timer())
+
+    assert browser.quit_called
+    assert isinstance(timings[0], TimeoutException)
+
+
+def test_kill_process_group_spares_our_own_group(monkeypatch):
+    killedGroups = []
+
+    class Proc:
+        pid = 12345
+        killed = False
+
+        def kill(self):
+            self.killed = True
+
+        def wait(self):
+            pass
+
+    monkeypatch.setattr(report_scrape.os, 'getpgid', lambda pid: 99)
+    monkeypatch.setattr(report_scrape.os, 'killpg', lambda group, sig: killedGroups.append(group))
+
+    proc = Proc()
+    report_scrape.killProcessGroup(proc)
+
+    assert killedGroups == []
+    assert proc.killed
+
+
+def isRunning(pid):
+    '''Whether pid is alive and not a zombie waiting to be reaped'''
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_kill_process_group_kills_an_attempt_and_its_children():
+    # The attempt's child shares its process group, like geckodriver and Firefox
+    proc = subprocess.Popen([sys.executable, '-c',
+                             'import subprocess, sys, time; '
+                             'child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"]); '
+                             'print(child.pid, flush=True); time.sleep(60)'],
+                            stdout=subprocess.PIPE, start_new_session=True)
+    childPid = int(proc.stdout.readline())
+    proc.stdout.close()
+
+    report_scrape.killProcessGroup(proc)
+
+    assert proc.returncode is not None
+    deadline = time.monotonic() + 5
+    while isRunning(childPid) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert not isRunning(childPid)
+
+
+def test_run_scrape_downloads_every_report(tmp_path, monkeypatch):
+    browser = FakeBrowser()
+    downloaded = []
+
+    def downloadReport(browser, reportName, savePath, timer=None):
+        downloaded.append(reportName)
+
+    monkeypatch.setattr(report_scrape, 'createBrowser', lambda savePath: browser)
+    monkeypatch.setattr(report_scrape, 'downloadReport', downloadReport)
+
+    report_scrape.runScrape(str(tmp_path), reports=['Staffing', 'Overtime'])
+
+    assert downloaded == ['Staffing', 'Overtime']
+    assert browser.quit_called
+
+
+def test_scheduled_attempts_only_download_the_missing_reports(tmp_path, monkeypatch):
+    savePath = str(tmp_path)
+    attempts = []
+
+    class Attempt:
+        '''An attempt that downloads the first report it was given'''
+        def __init__(self, command, start_new_session):
+            reports = command[command.index('--') + 1:]
+            attempts.append(reports)
+            (tmp_path / (reports[0] + '.csv')).write_text('data')
+
+        def wait(self, timeout):
+            return 1
+
+    monkeypatch.setattr(report_scrape.subprocess, 'Popen', Attempt)
+    monkeypatch.setattr(report_scrape.time, 'sleep', lambda seconds: None)
+
+    assert report_scrape.scheduleScrape(savePath, attempts=3, timingsPath=None,
+                                        reports=['Staffing', 'Overtime'])
+    assert attempts == [['Staffing', 'Overtime'], ['Overtime']]
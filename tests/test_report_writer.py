@@ -0,0 +1,98 @@
+# File name: test_report_writer.py
+# Description: Tests for the departed user reports
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import csv
+import gzip
+import json
+import pytest
+import report_writer
+from report_writer import DepartedUserReport, COLUMNS
+
+
+class FakeUser(object):
+    def __init__(self, username, manager_email=None):
+        self.name = username.title()
+        self.username = username
+        self.email = f'{username}@website.com'
+        self.manager_email = manager_email
+        self.ldap_name = username
+
+
+def read_csv(file_name):
+    with open(file_name, newline='') as report_file:
+        return list(csv.reader(report_file))
+
+
+def test_each_run_writes_its_own_csv_report(tmp_path):
+    base_name = str(tmp_path / 'report')
+    with DepartedUserReport(base_name) as first:
+        first.write_all([FakeUser('alice', 'manager@website.com')])
+    with DepartedUserReport(base_name) as second:
+        second.write(FakeUser('bob'))
+
+    assert (first.file_name, second.file_name) == (base_name + '.csv', base_name + '-2.csv')
+    header = [header for header, _ in COLUMNS]
+    assert [row[1] for row in read_csv(first.file_name)] == ['Username', 'alice']
+    assert read_csv(second.file_name)[0] == header
+    assert [row[1] for row in read_csv(second.file_name)[1:]] == ['bob']
+
+
+def test_older_csv_report_keeps_its_own_header(tmp_path):
+    # A report written before the Status column was added
+    base_name = str(tmp_path / 'report')
+    with open(base_name + '.csv', 'w') as old_report:
+        old_report.write('Name,Username,Email,Manager\'s email,LDAP Name\nAlice,alice,,,alice\n')
+
+    with DepartedUserReport(base_name) as report:
+        report.write(FakeUser('bob'))
+
+    assert read_csv(base_name + '.csv')[1] == ['Alice', 'alice', '', '', 'alice']
+    assert read_csv(report.file_name)[0][-1] == 'Status'
+
+
+def test_compressed_jsonl_report(tmp_path):
+    base_name = str(tmp_path / 'report')
+    with DepartedUserReport(base_name, 'jsonl', compress=True) as report:
+        report.write_all([FakeUser('alice'), FakeUser('bob')])
+
+    with gzip.open(base_name + '.jsonl.gz', 'rt') as report_file:
+        records = [json.loads(line) for line in report_file]
+    assert [record['Username'] for record in records] == ['alice', 'bob']
+    assert report.rows == 2
+
+
+def test_parquet_column_empty_in_the_first_row_group(tmp_path, monkeypatch):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    monkeypatch.setattr(report_writer, 'PARQUET_BATCH_SIZE', 2)
+
+    base_name = str(tmp_path / 'report')
+    with DepartedUserReport(base_name, 'parquet') as report:
+        report.write_all([FakeUser('alice'), FakeUser('bob'),
+                          FakeUser('carol', 'manager@website.com')])
+
+    table = pyarrow.parquet.read_table(base_name + '.parquet')
+    assert table.column('Manager\'s email').to_pylist() == [None, None, 'manager@website.com']
+    assert table.schema.field('Manager\'s email').type == pyarrow.string()
+
+
+def test_second_parquet_report_keeps_the_first(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+
+    base_name = str(tmp_path / 'report')
+    with DepartedUserReport(base_name, 'parquet') as first:
+        first.write(FakeUser('alice'))
+    with DepartedUserReport(base_name, 'parquet') as second:
+        second.write(FakeUser('bob'))
+
+    assert pyarrow.parquet.read_table(first.file_name).column('Username').to_pylist() == ['alice']
+    assert second.file_name == base_name + '-2.parquet'
+    assert pyarrow.parquet.read_table(second.file_name).column('Username').to_pylist() == ['bob']
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        DepartedUserReport('report', 'xml')
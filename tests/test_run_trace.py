@@ -0,0 +1,104 @@
+# File name: test_run_trace.py
+# Description: Tests for the run trace spans and the ldap counters
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import json
+import threading
+import pytest
+from run_trace import RunTrace, LdapCounters, result_size
+
+# A user entry and a search continuation reference, as search_s returns them
+RESULTS = [('CN=alice,OU=Disabled', {'AccountName': [b'alice'], 'manager': [b'CN=bob']}),
+           (None, ['ldap://other/'])]
+
+
+class FakeLdap(object):
+    def __init__(self):
+        self.counters = LdapCounters()
+
+
+def read_trace(path):
+    with open(path) as trace_file:
+        return [json.loads(line) for line in trace_file]
+
+
+def test_result_size_counts_dns_and_values():
+    assert result_size(RESULTS) == len('CN=alice,OU=Disabled') + len('alice') + len('CN=bob')
+
+
+def test_ldap_counters():
+    counters = LdapCounters()
+    before = counters.snapshot()
+    counters.add(RESULTS)
+    counters.add_error()
+
+    assert counters.since(before) == {'queries': 2, 'entries': 1,
+                                      'bytes': result_size(RESULTS), 'errors': 1}
+    assert before == {'queries': 0, 'entries': 0, 'bytes': 0, 'errors': 0}
+
+
+def test_ldap_counters_are_thread_safe():
+    counters = LdapCounters()
+    threads = [threading.Thread(target=lambda: [counters.add(RESULTS) for _ in range(500)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counters.snapshot()['queries'] == 2000
+    assert counters.snapshot()['entries'] == 2000
+
+
+def test_span_records_status_fields_and_ldap_deltas(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    trace = RunTrace(path)
+    ldap_con = FakeLdap()
+    ldap_con.counters.add(RESULTS)      # before the span, so not counted
+
+    with trace.span('departed users', 'serverA', ldap_con) as span:
+        ldap_con.counters.add(RESULTS)
+        ldap_con.counters.add_error()
+        span['departed'] = 3
+    trace.close()
+
+    [record] = read_trace(path)
+    assert record['span'] == 'departed users'
+    assert record['server'] == 'serverA'
+    assert record['status'] == 'ok'
+    assert record['departed'] == 3
+    assert record['ldap'] == {'queries': 2, 'entries': 1,
+                              'bytes': result_size(RESULTS), 'errors': 1}
+    assert record['run'] == trace.run_id
+    assert record['seconds'] >= 0
+
+
+def test_span_records_errors_and_reraises(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    trace = RunTrace(path)
+
+    with pytest.raises(RuntimeError):
+        with trace.span('perforce login', 'serverA'):
+            raise RuntimeError('connection refused')
+    with pytest.raises(KeyboardInterrupt):
+        with trace.span('run'):
+            raise KeyboardInterrupt()
+    trace.close()
+
+    login, run = read_trace(path)
+    assert (login['status'], login['error']) == ('error', 'connection refused')
+    assert (run['status'], run['error']) == ('error', 'KeyboardInterrupt')
+    assert 'ldap' not in login
+
+
+def test_events_and_spans_after_close_are_dropped(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    trace = RunTrace(path)
+    trace.event('start', workers=2)
+    trace.close()
+    with trace.span('late'):
+        pass
+
+    [record] = read_trace(path)
+    assert (record['event'], record['workers']) == ('start', 2)
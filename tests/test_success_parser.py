@@ -0,0 +1,57 @@
+# File name: test_success_parser.py
+# Description: Tests for the change notification parser
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import pickle
+import pytest
+import success_parser
+from success_parser import parseSuccess, parseMany, SuccessParseError
+from benchmarks.fixtures import successBodies
+
+
+def test_fields_are_found_in_any_order():
+    record = parseSuccess('Implemented 05/16/22 at 06:12 PM, change number - CO-123456')
+    assert record == ('CO-123456', '06:12 PM', '05/16/22')
+
+
+def test_first_match_of_each_field_wins():
+    record = parseSuccess('CO-1 at 6:12pm on 5/16/2022, then CHG-2 at 07:00 AM on 06/01/22')
+    assert (record.changeNumber, record.time, record.date) == ('CO-1', '6:12pm', '5/16/2022')
+
+
+def test_missing_fields_are_reported():
+    with pytest.raises(SuccessParseError) as excinfo:
+        parseSuccess('Change CO-123456 was implemented')
+    assert excinfo.value.missing == ['time', 'date']
+    assert excinfo.value.found == {'changeNumber': 'CO-123456'}
+
+
+def test_parse_error_survives_a_process_pool():
+    excep = pickle.loads(pickle.dumps(SuccessParseError(['date'], {}, 'body')))
+    assert excep.missing == ['date']
+
+
+def test_notification_bodies():
+    for i, body in enumerate(successBodies(200)):
+        assert parseSuccess(body) == (f'CO-{100000 + i}',
+                                      f"{i % 12 + 1:02d}:{i % 60:02d} {'AP'[i % 2]}M",
+                                      f'{i % 12 + 1:02d}/{i % 28 + 1:02d}/22')
+
+
+def test_single_digit_months_and_long_years():
+    record = parseSuccess('CO-123456 implemented on 5/6/2022 at 6:12 PM')
+    assert (record.date, record.time) == ('5/6/2022', '6:12 PM')
+
+
+@pytest.mark.parametrize('processes', [0, 2])
+def test_parse_many_keeps_order_and_errors(monkeypatch, processes):
+    monkeypatch.setattr(success_parser, 'POOL_THRESHOLD', 1)
+    bodies = successBodies(5)
+    bodies[2] = 'no fields here'
+
+    results = parseMany(bodies, processes)
+
+    assert isinstance(results[2], SuccessParseError)
+    assert [result.changeNumber for i, result in enumerate(results) if i != 2] == \
+        ['CO-100000', 'CO-100001', 'CO-100003', 'CO-100004']
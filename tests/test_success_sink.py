@@ -0,0 +1,88 @@
+# File name: test_success_sink.py
+# Description: Tests for sending success records to a local stand-in API
+# Author: Maurice Strickland
+# Date: 2026-10-17
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+success_sink = pytest.importorskip('success_sink')
+SuccessRecordSink = success_sink.SuccessRecordSink
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    '''Records every POST and answers with the server's next status'''
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.posts.append((self.path, body))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ApiHandler)
+    server.posts = []
+    server.statuses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f'http://127.0.0.1:{server.server_address[1]}/success'
+    server.shutdown()
+
+
+def test_records_are_posted_one_at_a_time_by_default(api, tmp_path):
+    server, url = api
+    sink = SuccessRecordSink(url, batchSize=2, spoolPath=str(tmp_path / 'spool.jsonl'), backoff=0)
+
+    assert sink.add('CO-1', '06:12 PM', '05/16/22') == []
+    assert sink.add('CO-2', '06:12 PM', '05/16/22') == ['CO-1', 'CO-2']
+    assert [path for path, _ in server.posts] == ['/success', '/success']
+
+
+def test_server_errors_are_spooled_not_retried(api, tmp_path):
+    server, url = api
+    spool = tmp_path / 'spool.jsonl'
+    server.statuses = [500]
+    sink = SuccessRecordSink(url, spoolPath=str(spool), backoff=0)
+
+    sink.add('CO-1', '06:12 PM', '05/16/22')
+    assert sink.close() == []
+    assert len(server.posts) == 1
+    assert [json.loads(line)['changenumber'] for line in spool.read_text().splitlines()] == ['CO-1']
+
+    # The next run sends the spooled record first
+    sink = SuccessRecordSink(url, spoolPath=str(spool), backoff=0)
+    assert sink.close() == ['CO-1']
+    assert not spool.exists()
+
+
+def test_failed_records_wait_for_the_next_run(api, tmp_path):
+    server, url = api
+    spool = tmp_path / 'spool.jsonl'
+    server.statuses = [500]
+    sink = SuccessRecordSink(url, batchSize=1, spoolPath=str(spool), backoff=0)
+
+    assert sink.add('CO-1', '06:12 PM', '05/16/22') == []
+    assert sink.add('CO-2', '06:12 PM', '05/16/22') == ['CO-2']
+    sink.close()
+
+    assert len(server.posts) == 2
+    assert [json.loads(line)['changenumber'] for line in spool.read_text().splitlines()] == ['CO-1']
+
+
+def test_bulk_endpoint_is_opt_in(api, tmp_path):
+    server, url = api
+    sink = SuccessRecordSink(url, url + '/bulk', batchSize=2,
+                             spoolPath=str(tmp_path / 'spool.jsonl'), backoff=0)
+
+    sink.add('CO-1', '06:12 PM', '05/16/22')
+    assert sink.add('CO-2', '06:12 PM', '05/16/22') == ['CO-1', 'CO-2']
+    assert [path for path, _ in server.posts] == ['/success/bulk']
+    assert len(json.loads(server.posts[0][1])) == 2